@@ -9,6 +9,7 @@ import torch
 import torch.nn.functional as F
 from .network import ConvBlock, SpiralConv, Pool, ParallelDeblock, SelfAttention
 from .resnet import resnet18, resnet50
+from conv.meshupsample import MeshUpsample
 from .loss import l1_loss, bce_loss, normal_loss, edge_length_loss
 
 
@@ -102,6 +103,8 @@ class CMR_PG(nn.Module):
         self.spiral_indices = spiral_indices
         self.up_transform = up_transform
         self.num_vert = [u.size(0) for u in self.up_transform] + [self.up_transform[-1].size(1)]
+        # fixed-fanout index / weight buffers, see conv/meshupsample.py
+        self.up_transform = nn.ModuleList([MeshUpsample(u) for u in up_transform])
         self.uv_channel = 17 if args.dataset=='Human36M' else 21
         self.relation = [[3, 6], [3, 13], [3, 16], [3, 10], [6, 13], [6, 16], [6, 10], [13, 16], [13, 10], [16, 10]] if args.dataset=='Human36M' else [[4, 8], [4, 12], [4, 16], [4, 20], [8, 12], [8, 16], [8, 20], [12, 16], [12, 20], [16, 20]]
 
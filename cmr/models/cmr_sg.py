@@ -9,6 +9,7 @@ import torch
 import torch.nn.functional as F
 from .network import ConvBlock, SpiralConv, Pool, ParallelDeblock, SelfAttention
 from .resnet import resnet18, resnet50
+from conv.meshupsample import MeshUpsample
 from .loss import l1_loss, bce_loss, normal_loss, edge_length_loss
 
 class EncodeStage1(nn.Module):
@@ -101,6 +102,8 @@ class CMR_SG(nn.Module):
         self.spiral_indices = spiral_indices
         self.up_transform = up_transform
         self.num_vert = [u.size(0) for u in self.up_transform] + [self.up_transform[-1].size(1)]
+        # fixed-fanout index / weight buffers, see conv/meshupsample.py
+        self.up_transform = nn.ModuleList([MeshUpsample(u) for u in up_transform])
         self.uv_channel = 21
         self.relation = [[4, 8], [4, 12], [4, 16], [4, 20], [8, 12], [8, 16], [8, 20], [12, 16], [12, 20], [16, 20]]
 
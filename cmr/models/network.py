@@ -3,15 +3,18 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch_scatter import scatter_add
 from conv import SpiralConv
+from conv.meshupsample import MeshUpsample
 
 
 def Pool(x, trans, dim=1):
     """
     :param x: input feature
-    :param trans: upsample matrix
+    :param trans: upsample matrix, or a MeshUpsample built from it
     :param dim: upsample dimension
     :return: upsampled feature
     """
+    if isinstance(trans, MeshUpsample):
+        return trans(x)
     trans = trans.to(x.device)
     row, col = trans._indices()
     value = trans._values().unsqueeze(-1)
@@ -2,9 +2,12 @@ import torch
 import torch.nn as nn
 from torch_scatter import scatter_add
 from conv import DSConv
+from conv.meshupsample import MeshUpsample
 
 
 def Pool(x, trans, dim=1):
+    if isinstance(trans, MeshUpsample):
+        return trans(x)
     row, col, value = trans[0].to(x.device), trans[1].to(x.device), trans[2].to(x.device)
     value = value.unsqueeze(-1)
     out = torch.index_select(x, dim, col) * value
@@ -88,6 +91,8 @@ class DWReg2DDecode3D(nn.Module):
         self.spiral_indices = spiral_indices
         self.up_transform = up_transform
         self.num_vert = [u[0].size(0)//3 for u in self.up_transform] + [self.up_transform[-1][0].size(0)//6]
+        # fixed-fanout index / weight buffers, see conv/meshupsample.py
+        self.up_transform = nn.ModuleList([MeshUpsample(u, n_out, n_in) for u, n_out, n_in in zip(up_transform, self.num_vert, self.num_vert[1:])])
         self.uv_channel = uv_channel
 
         self.de_layer = nn.ModuleList()
@@ -13,6 +13,7 @@ from termcolor import colored, cprint
 import pickle
 import time
 from utils.transforms import rigid_align
+from utils.prefetch import DevicePrefetcher
 
 
 class Runner(object):
@@ -109,18 +110,22 @@ class Runner(object):
     def phrase_data(self, data):
         for key, val in data.items():
             if isinstance(val, list):
-                data[key] = [d.to(self.device) for d in data[key]]
+                data[key] = [d.to(self.device, non_blocking=True) for d in data[key]]
             else:
-                data[key] = data[key].to(self.device)
+                data[key] = data[key].to(self.device, non_blocking=True)
         return data
 
+    def prefetch(self, loader):
+        # batches already moved by phrase_data, see utils/prefetch.py
+        return DevicePrefetcher(loader, self.device, self.phrase_data, self.args.prefetch)
+
     def train_a_epoch(self):
         self.model.train()
         total_loss = 0
         bar = Bar(colored("TRAIN", color='blue'), max=len(self.train_loader))
-        for step, data in enumerate(self.train_loader):
+        loader = self.prefetch(self.train_loader)
+        for step, data in enumerate(loader):
             t = time.time()
-            data = self.phrase_data(data)
             self.optimizer.zero_grad()
             out = self.model(data['img'])
             loss = self.loss(pred=out['mesh_pred'], gt=data.get('mesh_gt'), uv_pred=out.get('uv_pred'), uv_gt=data.get('uv_gt'),
@@ -157,6 +162,7 @@ class Runner(object):
                 self.writer.print_step(info)
 
         bar.finish()
+        self.writer.print_str('Data wait: {}'.format(loader.stats()))
         self.board_img('train', self.epoch, data['img'][0], mask_gt=data.get('mask_gt'), mask_pred=out.get('mask_pred'), uv_gt=data.get('uv_gt'), uv_pred=out.get('uv_pred'), uv_prior=out.get('uv_prior'))
         return total_loss / len(self.train_loader)
 
@@ -168,8 +174,7 @@ class Runner(object):
         xyz_pred_list, verts_pred_list = list(), list()
         bar = Bar(colored("EVAL", color='green'), max=len(self.eval_loader))
         with torch.no_grad():
-            for step, data in enumerate(self.eval_loader):
-                data = self.phrase_data(data)
+            for step, data in enumerate(self.prefetch(self.eval_loader)):
                 out = self.model(data['img'])
                 # np.save('EXP_pred/img_old.npy', data['img'].permute((0, 2, 3, 1)).reshape((128, 128, 3)).cpu().numpy())
                 # np.save('EXP_pred/out_vert_old.npy', out['mesh_pred'][0].cpu().numpy())
@@ -229,8 +234,7 @@ class Runner(object):
         duration = [0,]
         bar = Bar(colored("TEST", color='yellow'), max=len(self.eval_loader))
         with torch.no_grad():
-            for i, data in enumerate(self.eval_loader):
-                data = self.phrase_data(data)
+            for i, data in enumerate(self.prefetch(self.eval_loader)):
                 t1 = time.time()
                 out = self.model(data['img'])
                 torch.cuda.synchronize()
@@ -1,6 +1,8 @@
 from .spiralconv import SpiralConv
 from .dsconv import DSConv
+from .meshupsample import MeshUpsample
 
 __all__ = [
     'SpiralConv',
+    'MeshUpsample',
 ]
@@ -20,11 +20,14 @@ class DSConv(nn.Module):
     def __init__(self, in_channels, out_channels, indices, dim=1):
         super(DSConv, self).__init__()
         self.dim = dim
-        self.indices = indices
+        self.register_buffer('indices', indices.long().contiguous())
         self.in_channels = in_channels
         self.out_channels = out_channels
         self.seq_length = indices.size(1)
-        self.spatial_layer = nn.Conv2d(self.in_channels, self.in_channels, int(np.sqrt(self.seq_length)), 1, 0, groups=self.in_channels, bias=False)
+        self.kernel_size = int(np.sqrt(self.seq_length))
+        # an output narrower than in/L (the 3D head): project before gathering, (B, N, L*out) instead of (B, N, L*in)
+        self.project_first = self.seq_length * out_channels <= in_channels
+        self.spatial_layer = nn.Conv2d(self.in_channels, self.in_channels, self.kernel_size, 1, 0, groups=self.in_channels, bias=False)
         self.channel_layer = nn.Linear(self.in_channels, self.out_channels, bias=False)
         torch.nn.init.xavier_uniform_(self.channel_layer.weight)
 
@@ -32,12 +35,24 @@ class DSConv(nn.Module):
         torch.nn.init.xavier_uniform_(self.spatial_layer.weight)
         torch.nn.init.xavier_uniform_(self.channel_layer.weight)
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints from before the indices were a buffer
+        state_dict.setdefault(prefix + 'indices', self.indices)
+        super(DSConv, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, x):
-        n_nodes, _ = self.indices.size()
+        n_nodes, seq_length = self.indices.size()
         bs = x.size(0)
-        x = torch.index_select(x, self.dim, self.indices.to(x.device).view(-1))
-        x = x.view(bs * n_nodes, self.seq_length, -1).transpose(1, 2)
-        x = x.view(x.size(0), x.size(1), int(np.sqrt(self.seq_length)), int(np.sqrt(self.seq_length)))
+        if self.project_first and bs > 1:
+            # spatial and channel weights folded into one (in, L*out) projection, then the projections are gathered
+            weight = self.spatial_layer.weight.view(self.in_channels, seq_length, 1) * self.channel_layer.weight.t().unsqueeze(1)
+            x = torch.matmul(x, weight.view(self.in_channels, -1)).view(bs, -1, self.out_channels)
+            flat = self.indices * seq_length + torch.arange(seq_length, device=x.device)
+            x = torch.index_select(x, self.dim, flat.view(-1))
+            return x.view(bs, n_nodes, seq_length, self.out_channels).sum(2)
+        x = torch.index_select(x, self.dim, self.indices.view(-1))
+        x = x.view(bs * n_nodes, seq_length, -1).transpose(1, 2)
+        x = x.view(x.size(0), x.size(1), self.kernel_size, self.kernel_size)
         x = self.spatial_layer(x).view(bs, n_nodes, -1)
         x = self.channel_layer(x)
 
@@ -0,0 +1,121 @@
+"""
+Mesh upsampling as a fixed-fanout gather
+
+An up transform is a (N_out, N_in) sparse matrix with a few nonzeros per row,
+3 barycentric weights for the hand meshes. Pool gathers x[:, col] * value and
+scatter_adds it into a zero tensor, moving row/col/value to the device first,
+on every call. MeshUpsample converts the matrix once into padded (N_out, K)
+index / weight buffers and computes
+
+    out[:, i] = sum_k x[:, index[i, k]] * weight[i, k]
+
+with K index_selects and in-place multiply-adds, and a backward pass of K
+index_adds that saves only the buffers, not x. Padding entries point at
+vertex 0 with weight 0.
+"""
+
+import torch
+import torch.nn as nn
+
+
+def _fanout(row, col, value, num_rows):
+    ''' padded (num_rows, K) column indices and values of the sparse matrix (row, col, value)
+        K is the largest number of nonzeros of a row, entries keep their order within a row
+    '''
+    row, col, value = row.long().cpu(), col.long().cpu(), value.float().cpu()
+    order = torch.sort(row, stable=True)[1]
+    row, col, value = row[order], col[order], value[order]
+    counts = torch.bincount(row, minlength=num_rows)
+    k = int(counts.max()) if len(row) else 1
+    slot = torch.arange(len(row)) - (torch.cumsum(counts, 0) - counts)[row]
+    index = torch.zeros(num_rows, k, dtype=torch.long)
+    weight = torch.zeros(num_rows, k)
+    index[row, slot] = col
+    weight[row, slot] = value
+    return index, weight
+
+
+def fanout_transform(trans, num_out=None, num_in=None):
+    ''' padded (N_out, K) index / weight buffers of an up transform and N_in
+        trans: sparse (N_out, N_in) tensor or (row, col, value), see utils.read.spiral_tramsform
+        num_out / num_in: default to the size of a sparse tensor, else to the largest row / col + 1
+    '''
+    if isinstance(trans, torch.Tensor):
+        trans = trans.coalesce()
+        num_out, num_in = trans.size()
+        row, col = trans.indices()
+        value = trans.values()
+    else:
+        row, col, value = trans
+    num_out = int(row.max()) + 1 if num_out is None else num_out
+    num_in = int(col.max()) + 1 if num_in is None else num_in
+    index, weight = _fanout(row, col, value, num_out)
+    return index, weight, num_in
+
+
+def _gather_sum(x, index, weight):
+    ''' out[:, i] = sum_k x[:, index[i, k]] * weight[i, k], x: BxNxD '''
+    weight = weight.unsqueeze(-1)
+    out = torch.index_select(x, 1, index[:, 0]) * weight[:, 0]
+    for k in range(1, index.size(1)):
+        out.addcmul_(torch.index_select(x, 1, index[:, k]), weight[:, k])
+    return out
+
+
+def _scatter_sum(grad_out, index, weight, num_in):
+    ''' transpose of _gather_sum, grad_x[:, index[i, k]] += grad_out[:, i] * weight[i, k] '''
+    grad_x = grad_out.new_zeros(grad_out.size(0), num_in, grad_out.size(2))
+    weight = weight.unsqueeze(-1)
+    for k in range(index.size(1)):
+        grad_x.index_add_(1, index[:, k], grad_out * weight[:, k])
+    return grad_x
+
+
+class GatherUpsample(torch.autograd.Function):
+    ''' upsampling with its own backward, only the index / weight buffers are saved, not x '''
+    @staticmethod
+    def forward(ctx, x, index, weight):
+        ctx.save_for_backward(index, weight)
+        ctx.x_size, ctx.x_dtype = x.size(), x.dtype
+        return _gather_sum(x, index, weight)
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        index, weight = ctx.saved_tensors
+        grad_x = None
+        if ctx.needs_input_grad[0]:
+            grad_x = _scatter_sum(grad_out, index, weight, ctx.x_size[1]).to(ctx.x_dtype)
+        return grad_x, None, None
+
+
+class MeshUpsample(nn.Module):
+    def __init__(self, trans, num_out=None, num_in=None):
+        """Init an upsampling of a fixed up transform
+
+        Args:
+            trans: up transform, sparse (N_out, N_in) tensor or (row, col, value)
+            num_out (int, optional): N_out. Defaults to the size of trans.
+            num_in (int, optional): N_in. Defaults to the size of trans.
+        """
+        super(MeshUpsample, self).__init__()
+        index, weight, self.num_in = fanout_transform(trans, num_out, num_in)
+        self.num_out = index.size(0)
+        # derived from the template, not part of checkpoints
+        self.register_buffer('index', index, persistent=False)
+        self.register_buffer('weight', weight, persistent=False)
+
+    def forward(self, x):
+        """
+        Args:
+            x (tensor): BxN_inxD
+
+        Returns:
+            tensor: BxN_outxD
+        """
+        if torch.jit.is_scripting():
+            # autograd.Function is not scriptable, TorchScript differentiates the gather itself
+            return _gather_sum(x, self.index, self.weight)
+        return GatherUpsample.apply(x, self.index, self.weight)
+
+    def __repr__(self):
+        return '{}({}, {}, fanout={})'.format(self.__class__.__name__, self.num_in, self.num_out, self.index.size(1))
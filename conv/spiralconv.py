@@ -6,10 +6,14 @@ class SpiralConv(nn.Module):
     def __init__(self, in_channels, out_channels, indices, dim=1):
         super(SpiralConv, self).__init__()
         self.dim = dim
-        self.indices = indices
+        self.register_buffer('indices', indices.long().contiguous())
         self.in_channels = in_channels
         self.out_channels = out_channels
         self.seq_length = indices.size(1)
+        # narrower output: project every vertex first and gather the projections,
+        # (B, N, L*out) instead of the (B, N, L*in) spiral features. Batches only,
+        # a single mesh is faster as one gather and one matmul
+        self.project_first = out_channels < in_channels
 
         self.layer = nn.Linear(in_channels * self.seq_length, out_channels)
         self.reset_parameters()
@@ -18,21 +22,33 @@ class SpiralConv(nn.Module):
         torch.nn.init.xavier_uniform_(self.layer.weight)
         torch.nn.init.constant_(self.layer.bias, 0)
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints from before the indices were a buffer
+        state_dict.setdefault(prefix + 'indices', self.indices)
+        super(SpiralConv, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, x):
-        n_nodes, _ = self.indices.size()
-        if x.dim() == 2:
-            x = torch.index_select(x, 0, self.indices.to(x.device).view(-1))
-            x = x.view(n_nodes, -1)
-        elif x.dim() == 3:
-            bs = x.size(0)
-            x = torch.index_select(x, self.dim, self.indices.to(x.device).reshape(-1))
-            x = x.view(bs, n_nodes, -1)
-        else:
+        if x.dim() not in (2, 3):
             raise RuntimeError(
                 'x.dim() is expected to be 2 or 3, but received {}'.format(
                     x.dim()))
-        x = self.layer(x)
-        return x
+        single = x.dim() == 2
+        if single:
+            x = x.unsqueeze(0)
+        n_nodes, seq_length = self.indices.size()
+        bs = x.size(0)
+        if self.project_first and bs > 1:
+            # out[:, i] = sum_l x[:, indices[i, l]] @ W_l^T + b, W_l = weight[:, l*in:(l+1)*in]
+            weight = self.layer.weight.view(self.out_channels, seq_length, self.in_channels)
+            weight = weight.permute(2, 1, 0).reshape(self.in_channels, seq_length * self.out_channels)
+            x = torch.matmul(x, weight).view(bs, -1, self.out_channels)  # row v*L+l: x[:, v] @ W_l^T
+            flat = self.indices * seq_length + torch.arange(seq_length, device=x.device)
+            x = torch.index_select(x, self.dim, flat.view(-1)).view(bs, n_nodes, seq_length, self.out_channels)
+            x = x.sum(2) + self.layer.bias
+        else:
+            x = torch.index_select(x, self.dim, self.indices.view(-1))
+            x = self.layer(x.view(bs, n_nodes, -1))
+        return x.squeeze(0) if single else x
 
     def __repr__(self):
         return '{}({}, {}, seq_length={})'.format(self.__class__.__name__,
@@ -56,6 +56,7 @@ _C.DATA.HANCO.ROT = 0
 _C.DATA.HANCO.SCALE = 0.2
 _C.DATA.HANCO.BASE_SCALE = 1.3
 _C.DATA.HANCO.FLIP = False
+_C.DATA.HANCO.SHARD_ROOT = ''  # packed frame shards (utils/hanco_shard.py), '' reads jpg files
 
 _C.TRAIN = CN()
 _C.TRAIN.DATASET = 'FreiHAND'
@@ -67,6 +68,7 @@ _C.TRAIN.WEIGHT_DECAY = 0
 _C.TRAIN.EPOCHS = 38
 _C.TRAIN.BATCH_SIZE = 32
 _C.TRAIN.GPU_ID = [0, ]
+_C.TRAIN.PREFETCH = 2  # batches moved to the device ahead of the model (utils/prefetch.py), 0: off
 
 _C.VAL = CN()
 _C.VAL.DATASET = 'Ge'
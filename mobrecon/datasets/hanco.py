@@ -87,6 +87,7 @@ import torch.utils.data as data
 import numpy as np
 from utils.fh_utils import load_db_annotation, read_mesh, read_img_abs, read_mask_woclip, projectPoints
 from utils.hanco_utils import read_img, read_mask, read_annot
+from utils.hanco_shard import HanCoShards
 
 from utils.vis import base_transform, inv_base_tranmsform, cnt_area
 import cv2
@@ -117,6 +118,7 @@ class HanCo(data.Dataset):
         assert 1 < frame_counts <= 20, f'frame_counts should be in (2, 21), got: {frame_counts}'
 
         self.hanco_root = self.cfg.DATA.HANCO.ROOT
+        self.shards = HanCoShards(self.cfg.DATA.HANCO.SHARD_ROOT) if self.cfg.DATA.HANCO.SHARD_ROOT else None  # packed frames, see utils/hanco_shard.py
 
         self.train_seq, self.test_seq = self._get_valid_sequence(
             hanco_root=self.hanco_root, DEBUG=False
@@ -230,6 +232,23 @@ class HanCo(data.Dataset):
             cam_id = idx % 8
             return seq_id, cam_id
 
+    def _read_frames(self, folder, seq_id, cam_id, start, stop):
+        ''' read images, masks of frames [start, stop)
+            return (F, H, W, 3), (F, H, W) uint8 arrays
+        '''
+        if self.shards is not None:
+            return self.shards.read_frames(folder, seq_id, cam_id, start, stop), \
+                   self.shards.read_masks(seq_id, cam_id, start, stop)
+
+        images, masks = [], []
+        for frame_id in range(start, stop):
+            img = read_img(self.hanco_root, folder, seq_id, cam_id, frame_id)
+            mask = read_mask(self.hanco_root, seq_id, cam_id, frame_id)
+            images += [img]
+            masks += [mask]
+
+        return np.stack(images), np.stack(masks)
+
     def get_training_sample(self, aug_id, seq_id, cam_id):
         ''' Get HanCo sequence, see details at top - FORMAT
             with frame counts: self.frame_counts
@@ -246,14 +265,7 @@ class HanCo(data.Dataset):
         # 20, 10 -> start(0, 11) -> [0, ..., 9], [10, ..., 19]
 
         # read images, masks
-        images, masks = [], []
-        for frame_id in range(start, start + self.frame_counts):
-            img = read_img(self.hanco_root, self.image_aug[aug_id], seq_id, cam_id, frame_id)
-            mask = read_mask(self.hanco_root, seq_id, cam_id, frame_id)
-            images += [img]
-            masks += [mask]
-
-        images, masks = np.stack(images), np.stack(masks)
+        images, masks = self._read_frames(self.image_aug[aug_id], seq_id, cam_id, start, start + self.frame_counts)
 
         # read annots
         Annots = read_annot(self.hanco_root, seq_id, cam_id)
@@ -394,14 +406,7 @@ class HanCo(data.Dataset):
         ))
 
         # read images, masks
-        images, masks = [], []
-        for frame_id in range(max_seq_length):
-            img = read_img(self.hanco_root, 'rgb', seq_id, cam_id, frame_id)
-            mask = read_mask(self.hanco_root, seq_id, cam_id, frame_id)
-            images += [img]
-            masks += [mask]
-
-        images, masks = np.stack(images), np.stack(masks)
+        images, masks = self._read_frames('rgb', seq_id, cam_id, 0, max_seq_length)
 
         # read annots
         Annots = read_annot(self.hanco_root, seq_id, cam_id)
@@ -67,6 +67,7 @@ _C.TRAIN.WEIGHT_DECAY = 0
 _C.TRAIN.EPOCHS = 80  # updated from 38
 _C.TRAIN.BATCH_SIZE = 128  # updated from 32
 _C.TRAIN.GPU_ID = [0, ]
+_C.TRAIN.PREFETCH = 2  # batches moved to the device ahead of the model (utils/prefetch.py), 0: off
 
 _C.VAL = CN()
 _C.VAL.DATASET = 'Ge'
@@ -7,6 +7,7 @@ import json
 from utils.warmup_scheduler import adjust_learning_rate
 from utils.vis import inv_base_tranmsform
 from utils.zimeval import EvalUtil
+from utils.prefetch import DevicePrefetcher
 from utils.transforms import rigid_align
 from my_research.tools.vis import perspective, compute_iou, cnt_area
 from my_research.tools.kinematics import mano_to_mpii, MPIIHandJoints
@@ -89,13 +90,17 @@ class Runner(object):
         for key, val in data.items():
             try:
                 if isinstance(val, list):
-                    data[key] = [d.to(self.device) for d in data[key]]
+                    data[key] = [d.to(self.device, non_blocking=True) for d in data[key]]
                 else:
-                    data[key] = data[key].to(self.device)
+                    data[key] = data[key].to(self.device, non_blocking=True)
             except:
                 pass
         return data
 
+    def prefetch(self, loader):
+        ''' iterate {loader} with batches already moved by phrase_data, see utils/prefetch.py '''
+        return DevicePrefetcher(loader, self.device, self.phrase_data, self.cfg.TRAIN.PREFETCH)
+
     def board_scalar(self, phase, n_iter, lr=None, **kwargs):
         split = '/'
         for key, val in kwargs.items():
@@ -156,7 +161,9 @@ class Runner(object):
         forward_time = 0.
         backward_time = 0.
         start_time = time.time()
-        for step, data in enumerate(self.train_loader):
+        data_wait = 0.
+        loader = self.prefetch(self.train_loader)
+        for step, data in enumerate(loader):  # data already to('GPU')
             ts = time.time()
             adjust_learning_rate(
                 optimizer=self.optimizer,
@@ -168,7 +175,6 @@ class Runner(object):
                 decay_step=self.cfg.TRAIN.DECAY_STEP,  # [20, 40, 60,], when to use lr decay
                 warmup_epochs=self.cfg.TRAIN.WARMUP_EPOCHS
             )
-            data = self.phrase_data(data)  # to('GPU')
             self.optimizer.zero_grad()
             out = self.model(data['img'])
             tf = time.time()
@@ -201,14 +207,17 @@ class Runner(object):
                     'step_duration': duration,
                     'forward_duration': forward_time,
                     'backward_duration': backward_time,
+                    'data_duration': loader.wait_time - data_wait,
                     'lr': self.optimizer.param_groups[0]['lr']
                 }
                 self.writer.print_step_ft(info)
                 forward_time = 0.
                 backward_time = 0.
+                data_wait = loader.wait_time
 
         if self.board is not None:
             self.board_img('train', self.epoch, data, out, losses)
+        self.writer.print_str('Data wait: {}'.format(loader.stats()))
 
         return total_loss / len(self.train_loader)
 
@@ -223,11 +232,10 @@ class Runner(object):
         pa_joint_cam_errors = []
         joint_img_errors = []
         with torch.no_grad():
-            for step, data in enumerate(self.val_loader):
+            for step, data in enumerate(self.prefetch(self.val_loader)):
                 if self.board is None and step % 100 == 0:
                     print(step, len(self.val_loader))
                 # get data then infernce
-                data = self.phrase_data(data)
                 out = self.model(data['img'])
 
                 # get vertex pred
@@ -289,11 +297,10 @@ class Runner(object):
         self.model.eval()
         xyz_pred_list, verts_pred_list = list(), list()
         with torch.no_grad():
-            for step, data in enumerate(self.test_loader):
+            for step, data in enumerate(self.prefetch(self.test_loader)):
                 if self.board is None and step % 100 == 0:
                     print(step, len(self.test_loader))
                 # print(f'Eval on image[{data["idx"].cpu()}]')
-                data = self.phrase_data(data)
                 out = self.model(data['img'])
                 # EXP
                 # print(f'input      : {data["img"].size()}')         # (1, 3, 128, 128)
@@ -26,8 +26,29 @@ _C.DATA.STD = 3
 _C.DATA.IMG_MEAN = 0.5
 _C.DATA.IMG_STD = 0.5
 _C.DATA.COLOR_AUG = True
+_C.DATA.LUT_COLOR_AUG = False  # uint8 lookup-table colour augmentation, once per HanCo window, see utils/augmentation.LUTAugmentation
+_C.DATA.UINT8_IMG = False  # datasets return uint8 img/mask, normalised on the device in Runner.phrase_data; img stays float under the float COLOR_AUG
 _C.DATA.CONTRASTIVE = False
 _C.DATA.FRAME_COUNTS = 8  # for sequencial data
+_C.DATA.RETURN_MASK = True  # False: skip reading/warping masks when bbox_index.npz is built
+_C.DATA.REDUCED_DECODE = False  # decode jpg at 1/2, 1/4 or 1/8 when the augmented crop allows, see utils/img_reader.py
+_C.DATA.PACKED_COLLATE = False  # collate a batch into one buffer per dtype, one pin/copy per dtype, see datasets/collate.py
+_C.DATA.PINNED_POOL_MB = 256  # free pinned buffers kept for reuse by PACKED_COLLATE, least recently used are dropped first
+_C.DATA.EVAL_CROP_CACHE = ''  # directory of the valid/test crop stores (utils/eval_crop_cache.py), '' decodes and crops every evaluation
+
+_C.DATA.SHARD_STREAM = CN()  # TRAIN.DATASET: 'ShardStream', FreiHAND / CompHand samples streamed from tar shards, see datasets/shardstream.py
+_C.DATA.SHARD_STREAM.ROOTS = []  # shard directories written by utils/sample_shard.py
+_C.DATA.SHARD_STREAM.SHUFFLE_BUFFER = 2000  # records per worker mixed in memory, <= 1: shard order only
+
+_C.DATA.LOADER_TUNE = CN()  # probe num_workers / prefetch_factor of the DataLoaders at startup, see datasets/loader_tune.py
+_C.DATA.LOADER_TUNE.USE = False
+_C.DATA.LOADER_TUNE.WORKERS = [0, 2, 4, 6, 8]
+_C.DATA.LOADER_TUNE.PREFETCH_FACTORS = [2, 4]
+_C.DATA.LOADER_TUNE.CPU_BUDGET = 0  # max workers, 0: available cpus - 1
+_C.DATA.LOADER_TUNE.STEPS = 20  # timed batches per setting
+_C.DATA.LOADER_TUNE.WARMUP = 3  # batches per setting before timing, worker start up
+_C.DATA.LOADER_TUNE.TOLERANCE = 0.05  # fewer workers win when this close to the fastest
+_C.DATA.LOADER_TUNE.CACHE = 'data/loader_tune.json'  # choice per (dataset, host, settings that change the cost of a batch), '': probe every run
 
 _C.DATA.FREIHAND = CN()
 _C.DATA.FREIHAND.USE = True
@@ -57,6 +78,10 @@ _C.DATA.HANCO.ROT = 0
 _C.DATA.HANCO.SCALE = 0.2
 _C.DATA.HANCO.BASE_SCALE = 1.3
 _C.DATA.HANCO.FLIP = False
+_C.DATA.HANCO.SHARD_ROOT = ''  # packed frame shards (utils/hanco_shard.py), '' reads jpg files
+_C.DATA.HANCO.FRAME_CACHE_MB = 0  # decoded jpg frames shared by all workers of the train set (utils/frame_cache.py), 0 disables
+_C.DATA.HANCO.LOCALITY_BLOCK = 0  # >0: shuffle blocks of this many windows of the same (seq, cam), see datasets/sampler.py
+_C.DATA.HANCO.LOCALITY_RANDOMNESS = 0.0  # fraction of blocks scattered as single windows, 1.0 == shuffle=True
 
 _C.DATA.HANCO_EVAL = CN()
 _C.DATA.HANCO_EVAL.USE = True
@@ -84,6 +109,7 @@ _C.TRAIN.WEIGHT_DECAY = 0
 _C.TRAIN.EPOCHS = 38
 _C.TRAIN.BATCH_SIZE = 32
 _C.TRAIN.GPU_ID = [0, ]
+_C.TRAIN.PREFETCH = 2  # batches moved to the device ahead of the model (utils/prefetch.py), 0: off
 
 _C.VAL = CN()
 _C.VAL.DATASET = 'Ge'
@@ -0,0 +1,196 @@
+''' Packed batches for the DataLoader
+
+default_collate stacks every field of a batch into a tensor of its own, the
+pin_memory thread copies every field into a freshly pinned tensor, and
+Runner.phrase_data copies every field to the device one by one. With
+DATA.PACKED_COLLATE, BatchCollator writes every field of every sample straight
+into one flat buffer per dtype instead:
+
+    worker      : BatchCollator()          -> PackedBatch, one shared memory block per dtype
+    pin thread  : PackedBatch.pin_memory() -> one copy per dtype into a reused pinned buffer
+    runner      : PackedBatch.to(device)   -> one host to device copy per dtype,
+                                              every field is a view of those buffers
+
+A pinned buffer goes back to the pool once its host to device copy is issued,
+and it is only reused after that copy has finished. The pool keeps at most
+DATA.PINNED_POOL_MB of free buffers and drops the least recently returned ones
+first, so batch sizes that do not repeat (e.g. HanCo test batches, a whole
+sequence each) are not pinned for the life of the process.
+'''
+import threading
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info, default_collate
+
+__all__ = [
+    'PackedBatch',
+    'BatchCollator',
+    'build_collate_fn',
+]
+
+
+def _nbytes(buffer):
+    return buffer.numel() * buffer.element_size()
+
+
+class _PinnedPool(object):
+    ''' free pinned buffers of any (dtype, numel), shared by every PackedBatch of a process
+        limit: bytes of free buffers kept, the least recently returned ones are dropped first
+    '''
+    def __init__(self, limit):
+        self.limit = limit
+        self.free = []  # (buffer, cuda event of its last host to device copy), least recently returned first
+        self.nbytes = 0  # of the free buffers
+        self.lock = threading.Lock()  # pin_memory thread takes, main thread gives
+
+    def take(self, dtype, numel):
+        with self.lock:
+            for i, (buffer, event) in enumerate(self.free):
+                if buffer.dtype == dtype and buffer.numel() == numel and (event is None or event.query()):
+                    del self.free[i]
+                    self.nbytes -= _nbytes(buffer)
+                    return buffer
+        return torch.empty(numel, dtype=dtype).pin_memory()
+
+    def give(self, buffer, event):
+        with self.lock:
+            self.free.append((buffer, event))
+            self.nbytes += _nbytes(buffer)
+            # a dropped buffer with a copy in flight is kept alive by the caching host allocator until it is done
+            while self.nbytes > self.limit:
+                dropped, _ = self.free.pop(0)
+                self.nbytes -= _nbytes(dropped)
+
+
+_PINNED_POOL = _PinnedPool(256 * 2**20)  # limit: DATA.PINNED_POOL_MB, see build_collate_fn
+
+
+def _empty(numel, dtype):
+    if get_worker_info() is None:
+        return torch.empty(numel, dtype=dtype)
+    # allocated in shared memory like default_collate does, so it is not copied again on its way to the main process
+    elem = torch.empty(0, dtype=dtype)
+    return elem.new(elem._typed_storage()._new_shared(numel))
+
+
+def _as_tensor(val):
+    ''' tensor of a field that is packed, None if it is collated by default_collate '''
+    if isinstance(val, torch.Tensor):
+        return val
+    if isinstance(val, float):
+        return torch.tensor(val, dtype=torch.float64)  # same dtype as default_collate
+    if isinstance(val, (bool, int, np.ndarray, np.number, np.bool_)):
+        val = torch.as_tensor(val)
+        return val if not val.dtype.is_complex else None
+    return None
+
+
+class PackedBatch(object):
+    ''' a collated batch, fields are views of one flat buffer per dtype
+
+        buffers: {dtype: (numel,) tensor}
+        layout : {key: (dtype, offset, shape)}, shape includes the batch dimension
+        others : {key: value}, fields that are not tensors (e.g. str), collated by default_collate
+
+        read-only dict interface: batch[key], batch.get(key), key in batch, batch.items()
+        not a Mapping on purpose, pin_memory() would otherwise pin field by field
+    '''
+    def __init__(self, buffers, layout, others):
+        self.buffers = buffers
+        self.layout = layout
+        self.others = others
+        self._pools = {}  # dtype -> _PinnedPool the pinned buffer in self.buffers goes back to
+
+    def _view(self, buffers, key):
+        dtype, offset, shape = self.layout[key]
+        return buffers[dtype][offset:offset + int(np.prod(shape))].view(shape)
+
+    def __getitem__(self, key):
+        if key in self.others:
+            return self.others[key]
+        return self._view(self.buffers, key)
+
+    def __contains__(self, key):
+        return key in self.layout or key in self.others
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.layout) + len(self.others)
+
+    def keys(self):
+        return list(self.layout) + list(self.others)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pin_memory(self, device=None):
+        ''' copy every buffer into a pinned buffer of its pool, called by the DataLoader pin_memory thread '''
+        for dtype, buffer in self.buffers.items():
+            if buffer.is_pinned():
+                continue
+            self.buffers[dtype] = _PINNED_POOL.take(dtype, buffer.numel()).copy_(buffer)
+            self._pools[dtype] = _PINNED_POOL
+        return self
+
+    def to(self, device, non_blocking=False):
+        ''' dict of every field on {device}, one copy per dtype
+            pinned buffers go back to their pools, so the batch must not be read afterwards
+        '''
+        device = torch.device(device)
+        buffers = {}
+        for dtype, buffer in self.buffers.items():
+            if buffer.device == device:
+                # cpu: a pooled buffer is reused, so the fields need their own copy
+                buffers[dtype] = buffer.clone() if dtype in self._pools else buffer
+            else:
+                buffers[dtype] = buffer.to(device, non_blocking=non_blocking)
+
+        if self._pools:
+            event = None
+            if device.type == 'cuda':
+                event = torch.cuda.Event()
+                event.record(torch.cuda.current_stream(device))
+            for dtype, pool in self._pools.items():
+                pool.give(self.buffers[dtype], event)
+            self._pools = {}
+
+        out = {key: self._view(buffers, key) for key in self.layout}
+        out.update(self.others)
+        return out
+
+
+class BatchCollator(object):
+    ''' collate_fn of the DataLoader, samples (dicts) -> PackedBatch
+        same fields, shapes and dtypes as default_collate
+    '''
+    def __call__(self, samples):
+        elem = samples[0]
+        assert isinstance(elem, dict), f'BatchCollator expects dict samples, got {type(elem)}'
+
+        layout, others, sizes = {}, {}, {}
+        for key, val in elem.items():
+            val = _as_tensor(val)
+            if val is None:
+                others[key] = default_collate([sample[key] for sample in samples])
+                continue
+            shape = (len(samples), *val.shape)
+            layout[key] = (val.dtype, sizes.get(val.dtype, 0), shape)
+            sizes[val.dtype] = sizes.get(val.dtype, 0) + int(np.prod(shape))
+
+        batch = PackedBatch({dtype: _empty(numel, dtype) for dtype, numel in sizes.items()}, layout, others)
+        for key in layout:
+            out = batch[key]
+            for i, sample in enumerate(samples):
+                out[i].copy_(_as_tensor(sample[key]))
+        return batch
+
+
+def build_collate_fn(cfg):
+    ''' BatchCollator if DATA.PACKED_COLLATE, otherwise None (default_collate) '''
+    _PINNED_POOL.limit = cfg.DATA.PINNED_POOL_MB * 2**20
+    return BatchCollator() if cfg.DATA.PACKED_COLLATE else None
@@ -17,44 +17,70 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 import torch
 import torch.utils.data as data
 from utils.fh_utils import *
-from utils.vis import base_transform, inv_base_tranmsform, cnt_area
+from utils.vis import base_transform, inv_base_tranmsform, cnt_area, roi_transform, as_tensor
+from utils.bbox_index import load_bbox_index, mask_bbox, square_bbox
+from utils.vert_store import load_vert_store
 import cv2
-from utils.augmentation import Augmentation
+from utils.augmentation import Augmentation, LUTAugmentation
 from termcolor import cprint
 from pathlib import Path
 from utils.read import read_mesh
-from utils.preprocessing import augmentation, augmentation_2d
+from utils.preprocessing import augmentation, augmentation_views, augmentation_2d
 from my_research.models.loss import contrastive_loss_3d, contrastive_loss_2d
 from my_research.build import DATA_REGISTRY
+from my_research.datasets.fields import wants, select_fields
 import vctoolkit as vc
 from my_research.tools.kinematics import MPIIHandJoints, mano_to_mpii
 
 
 @DATA_REGISTRY.register()
 class CompHand(data.Dataset):
-    def __init__(self, cfg, phase='train', writer=None):
+    def __init__(self, cfg, phase='train', writer=None, fields=None):
         """Init a CompHand Dataset
 
         Args:
             cfg : config file
             phase (str, optional): train or eval. Defaults to 'train'.
             writer (optional): log file. Defaults to None.
+            fields (optional): fields a sample carries, None: every field, see my_research/datasets/fields.py
         """
         super(CompHand, self).__init__()
+        self._init_sample_builder(cfg, phase, fields)
+        path_lib = Path(os.path.join(cfg.DATA.COMPHAND.ROOT))
+        self.img_list = sorted(list(path_lib.glob('**/pic256/**/*.png')))
+        self.joint_num = 21
+        self.bbox_index = load_bbox_index(cfg.DATA.COMPHAND.ROOT, length=len(self.img_list))  # see utils/bbox_index.py
+        self.vert_store = load_vert_store(cfg.DATA.COMPHAND.ROOT, length=len(self.img_list))  # see utils/vert_store.py
+        if writer is not None:
+            writer.print_str('Loaded CompHand {} {} samples'.format(self.phase, str(len(self.img_list))))
+        cprint('Loaded CompHand {} {} samples'.format(self.phase, str(len(self.img_list))), 'red')
+
+    def _init_sample_builder(self, cfg, phase, fields):
+        """Everything the samples are built with, besides the dataset files
+        """
         self.cfg = cfg
         self.phase = phase
-        self.color_aug = Augmentation() if cfg.DATA.COLOR_AUG and 'train' in self.phase else None
+        self.color_aug = None
+        if cfg.DATA.COLOR_AUG and 'train' in self.phase:
+            self.color_aug = LUTAugmentation() if cfg.DATA.LUT_COLOR_AUG else Augmentation()
+        # float colour augmentation is not clipped or rounded, those crops stay float
+        self.uint8_img = cfg.DATA.UINT8_IMG and not isinstance(self.color_aug, Augmentation)
         self.j_reg = np.load(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../template/j_reg.npy'))
         self.K = np.array([[373.3511425,   0.,        128.],
                            [  0.,        373.3511425, 128.],
                            [  0.,          0.,          1.]])
         self.trans = np.array([ 0.51977897, 6.54544898, 93.32998466])
-        path_lib = Path(os.path.join(cfg.DATA.COMPHAND.ROOT))
-        self.img_list = sorted(list(path_lib.glob('**/pic256/**/*.png')))
-        self.joint_num = 21
-        if writer is not None:
-            writer.print_str('Loaded CompHand {} {} samples'.format(self.phase, str(len(self.img_list))))
-        cprint('Loaded CompHand {} {} samples'.format(self.phase, str(len(self.img_list))), 'red')
+        self.fields = fields
+        self.return_mask = self.cfg.DATA.RETURN_MASK and wants(fields, 'mask')
+
+    @classmethod
+    def sample_builder(cls, cfg, phase='train', fields=None):
+        """A CompHand that only builds samples of shard records (shard_sample), the tree is not globbed,
+        see my_research/datasets/shardstream.py
+        """
+        builder = cls.__new__(cls)
+        builder._init_sample_builder(cfg, phase, fields)
+        return builder
 
     def __getitem__(self, idx):
         if self.cfg.DATA.CONTRASTIVE:
@@ -62,10 +88,9 @@ class CompHand(data.Dataset):
         else:
             return self.get_training_sample(idx)
 
-    def get_contrastive_sample(self, idx):
-        """Get contrastive CompHand samples for consistency learning
+    def _paths(self, idx):
+        """image, mask and mesh path of sample {idx}
         """
-        # path prepare
         img_path = self.img_list[idx]
         img_name = img_path.parts[-1]
         img_name_split = img_name.split('.')
@@ -73,18 +98,56 @@ class CompHand(data.Dataset):
         mesh_path = os.path.join(*img_path.parts[:-2], str(num) + '.obj').replace('pic256', 'model_mano')
         mask_path = os.path.join(mesh_path.replace('obj', 'png').replace('model_mano', 'mask256'))
         img_path = os.path.join(*img_path.parts)
+        return img_path, mask_path, mesh_path
 
-        # read
+    def _read_record(self, idx):
+        """Read sample {idx}: the decoded img / mask, square bbox and vertices (not flipped yet)
+        """
+        img_path, mask_path, mesh_path = self._paths(idx)
         img = cv2.imread(img_path)[:, ::-1, ::-1]
-        mask = cv2.imread(mask_path)[..., ::-1, 0]
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = list(contours)
-        contours.sort(key=cnt_area, reverse=True)
-        bbox = cv2.boundingRect(contours[0])
-        center = [bbox[0]+bbox[2]*0.5, bbox[1]+bbox[3]*0.5]
-        w, h = bbox[2], bbox[3]
-        bbox = [center[0]-0.5 * max(w, h), center[1]-0.5 * max(w, h), max(w, h), max(w, h)]
-        vert = read_mesh(mesh_path).x.numpy()
+        mask = None
+        if self.return_mask or self.bbox_index is None:
+            mask = cv2.imread(mask_path)[..., ::-1, 0]
+        bbox = self.bbox_index[idx] if self.bbox_index is not None else mask_bbox(mask)
+        vert = self.vert_store[idx] if self.vert_store is not None else read_mesh(mesh_path).x.numpy()
+        return {'img': img, 'mask': mask, 'bbox': square_bbox(bbox), 'verts': vert}
+
+    def shard_record(self, idx):
+        """Encoded files and annotations of sample {idx}, see utils/sample_shard.py
+        """
+        img_path, mask_path, mesh_path = self._paths(idx)
+        if self.bbox_index is not None:
+            bbox = self.bbox_index[idx]
+        else:
+            bbox = mask_bbox(np.ascontiguousarray(cv2.imread(mask_path)[..., ::-1, 0]))
+        vert = self.vert_store[idx] if self.vert_store is not None else read_mesh(mesh_path).x.numpy()
+        with open(img_path, 'rb') as f:
+            img = f.read()
+        with open(mask_path, 'rb') as f:
+            mask = f.read()
+        return {'img': img, 'mask': mask, 'annot': {'bbox': np.array(bbox, dtype=np.int16), 'verts': vert.astype(np.float32)}}
+
+    def shard_sample(self, record):
+        """Training sample of a shard record from utils/sample_shard.iter_shard
+        """
+        img = cv2.imdecode(np.frombuffer(record['img'], np.uint8), cv2.IMREAD_COLOR)[:, ::-1, ::-1]
+        mask = None
+        if self.return_mask:
+            mask = cv2.imdecode(np.frombuffer(record['mask'], np.uint8), cv2.IMREAD_COLOR)[..., ::-1, 0]
+        record = {'img': img, 'mask': mask, 'bbox': square_bbox(record['annot']['bbox'].tolist()), 'verts': record['annot']['verts']}
+        if self.cfg.DATA.CONTRASTIVE:
+            return self._contrastive_sample(record)
+        return self._training_sample(record)
+
+    def get_contrastive_sample(self, idx):
+        """Get contrastive CompHand samples for consistency learning
+        """
+        return self._contrastive_sample(self._read_record(idx))
+
+    def _contrastive_sample(self, record):
+        """Contrastive samples of a record from _read_record or shard_sample
+        """
+        img, mask, bbox, vert = record['img'], record['mask'], record['bbox'], record['verts']
         vert[:, 0] *= -1   # flip
         joint_cam = mano_to_mpii(np.dot(self.j_reg, vert))
         K = self.K.copy()
@@ -101,16 +164,24 @@ class CompHand(data.Dataset):
         joint_img_list = []
         aug_param_list = []
         bb2img_trans_list = []
-        for _ in range(2):
-            # augmentation
-            roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, roi_mask = augmentation(img, bbox, self.phase, exclude_flip=not self.cfg.DATA.COMPHAND.FLIP, input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE), mask=mask,
-                                                                                            base_scale=self.cfg.DATA.COMPHAND.BASE_SCALE, scale_factor=self.cfg.DATA.COMPHAND.SCALE, rot_factor=self.cfg.DATA.COMPHAND.ROT,
-                                                                                            shift_wh=[bbox[2], bbox[3]], gaussian_std=self.cfg.DATA.STD)
+        # augmentation, both views cropped from img / mask by one call
+        views = augmentation_views(img, bbox, self.phase, 2,
+                                   exclude_flip=not self.cfg.DATA.COMPHAND.FLIP,
+                                   input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE),
+                                   mask=mask if self.return_mask else None,
+                                   base_scale=self.cfg.DATA.COMPHAND.BASE_SCALE,
+                                   scale_factor=self.cfg.DATA.COMPHAND.SCALE,
+                                   rot_factor=self.cfg.DATA.COMPHAND.ROT,
+                                   shift_wh=[bbox[2], bbox[3]],
+                                   gaussian_std=self.cfg.DATA.STD)
+        for roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, roi_mask in views:
             if self.color_aug is not None:
                 roi = self.color_aug(roi)
-            roi = base_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
-            roi = torch.from_numpy(roi).float()
-            roi_mask = torch.from_numpy(roi_mask).float()
+            roi = roi_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD, uint8=self.uint8_img)
+            roi = as_tensor(roi, self.uint8_img)
+            if self.return_mask:
+                roi_mask = as_tensor(roi_mask, self.cfg.DATA.UINT8_IMG)
+                mask_list.append(roi_mask.unsqueeze(0))
             bb2img_trans = torch.from_numpy(bb2img_trans).float()
             aug_param = torch.from_numpy(aug_param).float()
 
@@ -135,7 +206,6 @@ class CompHand(data.Dataset):
             calib = torch.from_numpy(calib).float()
 
             roi_list.append(roi)
-            mask_list.append(roi_mask.unsqueeze(0))
             calib_list.append(calib)
             vert_list.append(vert_)
             joint_cam_list.append(joint_cam_)
@@ -144,7 +214,7 @@ class CompHand(data.Dataset):
             bb2img_trans_list.append(bb2img_trans)
 
         roi = torch.cat(roi_list, 0)
-        mask = torch.cat(mask_list, 0)
+        mask = torch.cat(mask_list, 0) if self.return_mask else None
         calib = torch.cat(calib_list, 0)
         joint_cam = torch.cat(joint_cam_list, -1)
         vert = torch.cat(vert_list, -1)
@@ -162,31 +232,17 @@ class CompHand(data.Dataset):
         # out
         res = {'img': roi, 'joint_img': joint_img, 'joint_cam': joint_cam, 'verts': vert, 'mask': mask,
                'root': root, 'calib': calib, 'aug_param': aug_param, 'bb2img_trans': bb2img_trans,}
-        return res
+        return select_fields(res, self.fields)  # only the fields of self.fields
 
     def get_training_sample(self, idx):
         """Get a CompHand sample for training
         """
-        # path prepare
-        img_path = self.img_list[idx]
-        img_name = img_path.parts[-1]
-        img_name_split = img_name.split('.')
-        num = int(img_name_split[1])
-        mesh_path = os.path.join(*img_path.parts[:-2], str(num) + '.obj').replace('pic256', 'model_mano')
-        mask_path = os.path.join(mesh_path.replace('obj', 'png').replace('model_mano', 'mask256'))
-        img_path = os.path.join(*img_path.parts)
+        return self._training_sample(self._read_record(idx))
 
-        # read
-        img = cv2.imread(img_path)[:, ::-1, ::-1]
-        mask = cv2.imread(mask_path)[..., ::-1, 0]
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = list(contours)
-        contours.sort(key=cnt_area, reverse=True)
-        bbox = cv2.boundingRect(contours[0])
-        center = [bbox[0]+bbox[2]*0.5, bbox[1]+bbox[3]*0.5]
-        w, h = bbox[2], bbox[3]
-        bbox = [center[0]-0.5 * max(w, h), center[1]-0.5 * max(w, h), max(w, h), max(w, h)]
-        vert = read_mesh(mesh_path).x.numpy()
+    def _training_sample(self, record):
+        """Training sample of a record from _read_record or shard_sample
+        """
+        img, mask, bbox, vert = record['img'], record['mask'], record['bbox'], record['verts']
         vert[:, 0] *= -1   # flip
         joint_cam = mano_to_mpii(np.dot(self.j_reg, vert))
         K = self.K.copy()
@@ -195,17 +251,17 @@ class CompHand(data.Dataset):
         focal = np.array( [K[0, 0], K[1, 1]], dtype=np.float32)
 
         # augmentation
-        roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, mask = augmentation(img, bbox, self.phase, exclude_flip=not self.cfg.DATA.COMPHAND.FLIP, input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE), mask=mask,
+        roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, mask = augmentation(img, bbox, self.phase, exclude_flip=not self.cfg.DATA.COMPHAND.FLIP, input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE), mask=mask if self.return_mask else None,
                                                                                      base_scale=self.cfg.DATA.COMPHAND.BASE_SCALE, scale_factor=self.cfg.DATA.COMPHAND.SCALE, rot_factor=self.cfg.DATA.COMPHAND.ROT,
                                                                                      shift_wh=[bbox[2], bbox[3]], gaussian_std=self.cfg.DATA.STD)
         if self.color_aug is not None:
             roi = self.color_aug(roi)
-        roi = base_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
+        roi = roi_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD, uint8=self.uint8_img)
         # img = inv_based_tranmsform(roi)
         # cv2.imshow('test', img)
         # cv2.waitKey(0)
-        roi = torch.from_numpy(roi).float()
-        mask = torch.from_numpy(mask).float()
+        roi = as_tensor(roi, self.uint8_img)
+        mask = as_tensor(mask, self.cfg.DATA.UINT8_IMG) if self.return_mask else None
         bb2img_trans = torch.from_numpy(bb2img_trans).float()
 
         # joints
@@ -239,7 +295,7 @@ class CompHand(data.Dataset):
         vert = torch.from_numpy(vert).float()
 
         res = {'img': roi, 'joint_img': joint_img, 'joint_cam': joint_cam, 'verts': vert, 'mask': mask, 'root': root, 'calib': calib}
-        return res
+        return select_fields(res, self.fields)  # only the fields of self.fields
 
     def __len__(self):
         return len(self.img_list)
@@ -0,0 +1,46 @@
+''' Fields a dataset sample has to carry
+
+Datasets build every field they know (img, mask, joint_img, joint_cam, verts,
+root, calib, ...), even if the loss in use only reads a few of them. Instead:
+
+    model.LOSS_FIELDS     : ground truth read by model.loss(), published by the model class
+    Runner.TRAIN_FIELDS   : fields read by Runner.train() besides the loss
+    Runner.EVAL_FIELDS    : fields read by Runner.eval()
+    Runner.PRED_FIELDS    : fields read by Runner.pred() / test()
+
+required_fields() merges them into the set a dataset is built with
+(build_dataset(..., fields=...)). A dataset reads, warps and returns only the
+fields in that set, fields=None means every field (a model without LOSS_FIELDS).
+'''
+
+__all__ = [
+    'INDEX_FIELDS',
+    'required_fields',
+    'wants',
+    'select_fields',
+]
+
+INDEX_FIELDS = ('img', 'start', 'idx', 'seq_id', 'cam_id')  # model input and sample indices, always returned
+
+
+def required_fields(runner_fields, model=None):
+    ''' fields a dataset has to return for {runner_fields} and the loss of {model}
+        None (every field) if {model} does not publish LOSS_FIELDS
+    '''
+    if model is not None:
+        model = getattr(model, 'module', model)  # DataParallel
+        loss_fields = getattr(model, 'LOSS_FIELDS', None)
+        if loss_fields is None:
+            return None
+        runner_fields = tuple(runner_fields) + tuple(loss_fields)
+    return frozenset(INDEX_FIELDS) | frozenset(runner_fields)
+
+
+def wants(fields, name):
+    ''' True if a sample built for {fields} carries {name} '''
+    return fields is None or name in fields
+
+
+def select_fields(sample, fields):
+    ''' drop every field of {sample} (a dict) that is not in {fields}, None values are dropped too '''
+    return {key: val for key, val in sample.items() if val is not None and wants(fields, key)}
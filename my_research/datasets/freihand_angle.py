@@ -17,39 +17,52 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 import torch
 import torch.utils.data as data
 import numpy as np
-from utils.fh_utils import load_db_annotation, read_mesh, read_img, read_img_abs, read_mask_woclip, projectPoints
-from utils.vis import base_transform, inv_base_tranmsform, cnt_area
+from utils.fh_utils import load_db_annotation_cache, read_mesh, read_img, read_img_abs, read_mask_woclip, projectPoints
+from utils.vis import base_transform, inv_base_tranmsform, cnt_area, roi_transform, as_tensor
+from utils.bbox_index import load_bbox_index, mask_bbox, square_bbox
+from utils.vert_store import load_vert_store
+from utils.img_reader import max_crop_reduce
 import cv2
-from utils.augmentation import Augmentation
+from utils.augmentation import Augmentation, LUTAugmentation
 from termcolor import cprint
-from utils.preprocessing import augmentation, augmentation_2d, trans_point2d
+from utils.preprocessing import augmentation, augmentation_views, augmentation_2d, trans_point2d
 from my_research.tools.kinematics import MPIIHandJoints
 from my_research.models.loss import contrastive_loss_3d, contrastive_loss_2d
 import vctoolkit as vc
 from my_research.build import DATA_REGISTRY
+from my_research.datasets.fields import wants, select_fields
 import pandas as pd
 
 @DATA_REGISTRY.register()
 class FreiHAND_Angle(data.Dataset):
 
-    def __init__(self, cfg, phase='train', writer=None):
+    def __init__(self, cfg, phase='train', writer=None, fields=None):
         """Init a FreiHAND Dataset
 
         Args:
             cfg : config file
             phase (str, optional): train or eval. Defaults to 'train'.
             writer (optional): log file. Defaults to None.
+            fields (optional): fields a sample carries, None: every field, see my_research/datasets/fields.py
         """
         super(FreiHAND_Angle, self).__init__()
         self.cfg = cfg
         self.phase = phase
         # self.db_data_anno = tuple(load_db_annotation(self.cfg.DATA.FREIHAND.ROOT, set_name=self.phase))
-        self.db_data_anno = tuple(load_db_annotation(self.cfg.DATA.FREIHAND.ROOT, set_name='train'))
-        self.color_aug = Augmentation() if cfg.DATA.COLOR_AUG and 'train' in self.phase else None
-
-        self.one_version_len = len(self.db_data_anno)
+        self.db_data_anno = load_db_annotation_cache(self.cfg.DATA.FREIHAND.ROOT, set_name='train',
+                                                     versions=4 if 'train' in self.phase else 1)
+        self.color_aug = None
+        if cfg.DATA.COLOR_AUG and 'train' in self.phase:
+            self.color_aug = LUTAugmentation() if cfg.DATA.LUT_COLOR_AUG else Augmentation()
+        # float colour augmentation is not clipped or rounded, those crops stay float
+        self.uint8_img = cfg.DATA.UINT8_IMG and not isinstance(self.color_aug, Augmentation)
+
+        self.one_version_len = self.db_data_anno.one_version_len
+        self.bbox_index = load_bbox_index(self.cfg.DATA.FREIHAND.ROOT, length=self.one_version_len)
+        self.vert_store = load_vert_store(self.cfg.DATA.FREIHAND.ROOT, length=self.one_version_len)
+        self.fields = fields
+        self.return_mask = self.cfg.DATA.RETURN_MASK and wants(fields, 'mask')
         if 'train' in self.phase:
-            self.db_data_anno *= 4
             # get valid image sequences
             self.valid_seq = self._get_valid_seq(os.path.join(cfg.DATA.FREIHAND.ROOT, 'selected_freihand.csv'))
             self.valid_seq_len = len(self.valid_seq)
@@ -96,20 +109,43 @@ class FreiHAND_Angle(data.Dataset):
         else:
             raise Exception('phase error')
 
+    def _read_verts(self, idx):
+        """Read the (778, 3) ground-truth vertices of training sample {idx}, see utils/vert_store.py
+        """
+        if self.vert_store is not None:
+            return self.vert_store[idx]
+        return read_mesh(idx, self.cfg.DATA.FREIHAND.ROOT).x.numpy()
+
+    def _read_img(self, idx, bbox):
+        """Read training image {idx}, return (img, img_reduce)
+
+        with DATA.REDUCED_DECODE, img is decoded at 1/img_reduce resolution as long as
+        the smallest augmented crop around {bbox} keeps DATA.SIZE pixels, see utils/img_reader.py
+        """
+        if not self.cfg.DATA.REDUCED_DECODE:
+            return read_img_abs(idx, self.cfg.DATA.FREIHAND.ROOT, 'training'), 1
+        min_crop = bbox[2] * (self.cfg.DATA.FREIHAND.BASE_SCALE - self.cfg.DATA.FREIHAND.SCALE)
+        return read_img_abs(idx, self.cfg.DATA.FREIHAND.ROOT, 'training',
+                            max_reduce=max_crop_reduce(min_crop, self.cfg.DATA.SIZE))
+
+    def _read_mask_bbox(self, idx):
+        """Read the mask and the square hand bbox of training sample {idx}
+
+        mask is None if it is not returned and bbox_index is built, see utils/bbox_index.py
+        """
+        mask = None
+        if self.return_mask or self.bbox_index is None:
+            mask = read_mask_woclip(idx, self.cfg.DATA.FREIHAND.ROOT, 'training')
+        bbox = self.bbox_index[idx] if self.bbox_index is not None else mask_bbox(mask)
+        return mask, square_bbox(bbox)
+
     def get_contrastive_sample(self, idx, negativeness):
         """Get contrastive FreiHAND samples for consistency learning
         """
         # read
-        img = read_img_abs(idx, self.cfg.DATA.FREIHAND.ROOT, 'training')
-        vert = read_mesh(idx % self.one_version_len, self.cfg.DATA.FREIHAND.ROOT).x.numpy()
-        mask = read_mask_woclip(idx % self.one_version_len, self.cfg.DATA.FREIHAND.ROOT, 'training')
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = list(contours)
-        contours.sort(key=cnt_area, reverse=True)
-        bbox = cv2.boundingRect(contours[0])
-        center = [bbox[0]+bbox[2]*0.5, bbox[1]+bbox[3]*0.5]
-        w, h = bbox[2], bbox[3]
-        bbox = [center[0]-0.5 * max(w, h), center[1]-0.5 * max(w, h), max(w, h), max(w, h)]
+        vert = self._read_verts(idx % self.one_version_len) if wants(self.fields, 'verts') else None
+        mask, bbox = self._read_mask_bbox(idx % self.one_version_len)
+        img, img_reduce = self._read_img(idx, bbox)
         K, mano, joint_cam = self.db_data_anno[idx]
         K, joint_cam, mano = np.array(K), np.array(joint_cam), np.array(mano)
         # print(f'K:\n{K}')
@@ -125,30 +161,33 @@ class FreiHAND_Angle(data.Dataset):
         joint_img_list = []
         aug_param_list = []
         bb2img_trans_list = []
-        for _ in range(2):
-            # augmentation
-            roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, roi_mask = augmentation(img.copy(), bbox, self.phase,
-                                                                                            exclude_flip=not self.cfg.DATA.FREIHAND.FLIP,
-                                                                                            input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE),
-                                                                                            mask=mask.copy(),
-                                                                                            base_scale=self.cfg.DATA.FREIHAND.BASE_SCALE,
-                                                                                            scale_factor=self.cfg.DATA.FREIHAND.SCALE,
-                                                                                            rot_factor=self.cfg.DATA.FREIHAND.ROT,
-                                                                                            shift_wh=[bbox[2], bbox[3]],
-                                                                                            gaussian_std=self.cfg.DATA.STD)
+        # augmentation, both views cropped from img / mask by one call
+        views = augmentation_views(img, bbox, self.phase, 2,
+                                   exclude_flip=not self.cfg.DATA.FREIHAND.FLIP,
+                                   input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE),
+                                   mask=mask if self.return_mask else None,
+                                   base_scale=self.cfg.DATA.FREIHAND.BASE_SCALE,
+                                   scale_factor=self.cfg.DATA.FREIHAND.SCALE,
+                                   rot_factor=self.cfg.DATA.FREIHAND.ROT,
+                                   shift_wh=[bbox[2], bbox[3]],
+                                   gaussian_std=self.cfg.DATA.STD,
+                                   img_reduce=img_reduce)
+        for roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, roi_mask in views:
             if self.color_aug is not None:
                 roi = self.color_aug(roi)
-            roi = base_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
+            roi = roi_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD, uint8=self.uint8_img)
             # img = inv_based_tranmsform(roi)
             # cv2.imshow('test', img)
             # cv2.waitKey(0)
-            roi = torch.from_numpy(roi).float()
-            roi_mask = torch.from_numpy(roi_mask).float()
+            roi = as_tensor(roi, self.uint8_img)
+            if self.return_mask:
+                roi_mask = as_tensor(roi_mask, self.cfg.DATA.UINT8_IMG)
+                mask_list.append(roi_mask.unsqueeze(0))
             bb2img_trans = torch.from_numpy(bb2img_trans).float()
             aug_param = torch.from_numpy(aug_param).float()
 
             # joints
-            joint_img_, princpt_ = augmentation_2d(img, joint_img, princpt, img2bb_trans, do_flip)
+            joint_img_, princpt_ = augmentation_2d(img, joint_img, princpt, img2bb_trans, do_flip, img_reduce=img_reduce)
             joint_img_ = torch.from_numpy(joint_img_[:, :2]).float() / self.cfg.DATA.SIZE
 
             # 3D rot
@@ -157,7 +196,7 @@ class FreiHAND_Angle(data.Dataset):
                                     [np.sin(np.deg2rad(-rot)), np.cos(np.deg2rad(-rot)), 0],
                                     [0, 0, 1]], dtype=np.float32)
             joint_cam_ = torch.from_numpy(np.dot(rot_aug_mat, joint_cam.T).T).float()
-            vert_ = torch.from_numpy(np.dot(rot_aug_mat, vert.T).T).float()
+            vert_ = torch.from_numpy(np.dot(rot_aug_mat, vert.T).T).float() if vert is not None else None
 
             # K
             focal_ = focal * roi.size(1) / (bbox[2]*aug_param[1])
@@ -168,7 +207,6 @@ class FreiHAND_Angle(data.Dataset):
             calib = torch.from_numpy(calib).float()
 
             roi_list.append(roi)
-            mask_list.append(roi_mask.unsqueeze(0))
             calib_list.append(calib)
             vert_list.append(vert_)
             joint_cam_list.append(joint_cam_)
@@ -178,10 +216,10 @@ class FreiHAND_Angle(data.Dataset):
 
         # print(f'calib:\n{calib_list[0]}')
         roi = torch.cat(roi_list, 0)
-        mask = torch.cat(mask_list, 0)
+        mask = torch.cat(mask_list, 0) if self.return_mask else None
         calib = torch.cat(calib_list, 0)
         joint_cam = torch.cat(joint_cam_list, -1)
-        vert = torch.cat(vert_list, -1)
+        vert = torch.cat(vert_list, -1) if vert is not None else None
         joint_img = torch.cat(joint_img_list, -1)
         aug_param = torch.cat(aug_param_list, 0)
         bb2img_trans = torch.cat(bb2img_trans_list, -1)
@@ -189,31 +227,24 @@ class FreiHAND_Angle(data.Dataset):
         # postprocess root and joint_cam
         root = joint_cam[0].clone()
         joint_cam -= root
-        vert -= root
         joint_cam /= 0.2
-        vert /= 0.2
+        if vert is not None:
+            vert -= root
+            vert /= 0.2
 
         # out
         res = {'img': roi, 'joint_img': joint_img, 'joint_cam': joint_cam, 'verts': vert, 'mask': mask,
                'root': root, 'calib': calib, 'aug_param': aug_param, 'bb2img_trans': bb2img_trans,
                'negative': negativeness,}
-
-        return res
+        return select_fields(res, self.fields)  # only the fields of self.fields
 
     def get_training_sample(self, idx, negativeness):
         """Get a FreiHAND sample for training
         """
         # read
-        img = read_img_abs(idx, self.cfg.DATA.FREIHAND.ROOT, 'training')
-        vert = read_mesh(idx % self.one_version_len, self.cfg.DATA.FREIHAND.ROOT).x.numpy()
-        mask = read_mask_woclip(idx % self.one_version_len, self.cfg.DATA.FREIHAND.ROOT, 'training')
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = list(contours)
-        contours.sort(key=cnt_area, reverse=True)
-        bbox = cv2.boundingRect(contours[0])
-        center = [bbox[0]+bbox[2]*0.5, bbox[1]+bbox[3]*0.5]
-        w, h = bbox[2], bbox[3]
-        bbox = [center[0]-0.5 * max(w, h), center[1]-0.5 * max(w, h), max(w, h), max(w, h)]
+        vert = self._read_verts(idx % self.one_version_len) if wants(self.fields, 'verts') else None
+        mask, bbox = self._read_mask_bbox(idx % self.one_version_len)
+        img, img_reduce = self._read_img(idx, bbox)
         K, mano, joint_cam = self.db_data_anno[idx]
         K, joint_cam, mano = np.array(K), np.array(joint_cam), np.array(mano)
         joint_img = projectPoints(joint_cam, K)
@@ -224,24 +255,25 @@ class FreiHAND_Angle(data.Dataset):
         roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, mask = augmentation(img, bbox, self.phase,
                                                                                         exclude_flip=not self.cfg.DATA.FREIHAND.FLIP,
                                                                                         input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE),
-                                                                                        mask=mask,
+                                                                                        mask=mask if self.return_mask else None,
                                                                                         base_scale=self.cfg.DATA.FREIHAND.BASE_SCALE,
                                                                                         scale_factor=self.cfg.DATA.FREIHAND.SCALE,
                                                                                         rot_factor=self.cfg.DATA.FREIHAND.ROT,
                                                                                         shift_wh=[bbox[2], bbox[3]],
-                                                                                        gaussian_std=self.cfg.DATA.STD)
+                                                                                        gaussian_std=self.cfg.DATA.STD,
+                                                                                        img_reduce=img_reduce)
         if self.color_aug is not None:
             roi = self.color_aug(roi)
-        roi = base_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
+        roi = roi_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD, uint8=self.uint8_img)
         # img = inv_based_tranmsform(roi)
         # cv2.imshow('test', img)
         # cv2.waitKey(0)
-        roi = torch.from_numpy(roi).float()
-        mask = torch.from_numpy(mask).float()
+        roi = as_tensor(roi, self.uint8_img)
+        mask = as_tensor(mask, self.cfg.DATA.UINT8_IMG) if self.return_mask else None
         bb2img_trans = torch.from_numpy(bb2img_trans).float()
 
         # joints
-        joint_img, princpt = augmentation_2d(img, joint_img, princpt, img2bb_trans, do_flip)
+        joint_img, princpt = augmentation_2d(img, joint_img, princpt, img2bb_trans, do_flip, img_reduce=img_reduce)
         joint_img = torch.from_numpy(joint_img[:, :2]).float() / self.cfg.DATA.SIZE
 
         # 3D rot
@@ -257,7 +289,7 @@ class FreiHAND_Angle(data.Dataset):
         因為 內部的 rot 是指旋轉 bbox! 旋轉後的 bbox 再經由 affine trans 轉到輸出圖片座標時，事實上做的旋轉是倒過來的
         '''
         joint_cam = np.dot(rot_aug_mat, joint_cam.T).T
-        vert = np.dot(rot_aug_mat, vert.T).T
+        vert = np.dot(rot_aug_mat, vert.T).T if vert is not None else None
 
         # K
         focal = focal * roi.size(1) / (bbox[2]*aug_param[1])
@@ -270,20 +302,20 @@ class FreiHAND_Angle(data.Dataset):
         # postprocess root and joint_cam
         root = joint_cam[0].copy()
         joint_cam -= root
-        vert -= root
         joint_cam /= 0.2
-        vert /= 0.2
+        if vert is not None:
+            vert -= root
+            vert /= 0.2
         root = torch.from_numpy(root).float()
         joint_cam = torch.from_numpy(joint_cam).float()
-        vert = torch.from_numpy(vert).float()
+        vert = torch.from_numpy(vert).float() if vert is not None else None
 
         # out
         res = {'img': roi, 'joint_img': joint_img, 'joint_cam': joint_cam, 'verts': vert,
                'mask': mask, 'root': root, 'calib': calib,
                'negative': negativeness,
               }
-
-        return res
+        return select_fields(res, self.fields)  # only the fields of self.fields
 
     def get_eval_sample(self, idx):
         """Get FreiHAND sample for evaluation
@@ -310,8 +342,8 @@ class FreiHAND_Angle(data.Dataset):
                                                                                         shift_wh=[bbox[2], bbox[3]],
                                                                                         gaussian_std=self.cfg.DATA.STD)
         # aug_param: [旋轉徑度, bbox 放大倍率(框到更多手外圍的圖), 平移 x 佔畫面比例, 平移 y 佔畫面比例]
-        roi = base_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
-        roi = torch.from_numpy(roi).float()
+        roi = roi_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD, uint8=self.uint8_img)
+        roi = as_tensor(roi, self.uint8_img)
 
         # s     : 放大倍率 = roi.size(1) / (bbox[2]*aug_param[1])
         # Um, Vm: 平移距離 = roi.size(1) * aug_param[2], ...[3]
@@ -331,7 +363,7 @@ class FreiHAND_Angle(data.Dataset):
         # print(f'calib:\n{calib}')
         calib = torch.from_numpy(calib).float()
 
-        return {'img': roi, 'calib': calib, 'idx': idx}
+        return select_fields({'img': roi, 'calib': calib, 'idx': idx}, self.fields)
 
     def __len__(self):
         if self.phase == 'train':
@@ -17,17 +17,23 @@ import cv2
 import numpy as np
 import torch
 import torch.utils.data
-from utils.vis import base_transform, inv_base_tranmsform, uv2map
+from utils.vis import base_transform, inv_base_tranmsform, uv2map, roi_transform, as_tensor
+from utils.img_reader import imread
+from utils.eval_crop_cache import load_eval_crop_store
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 from termcolor import cprint
 from my_research.build import DATA_REGISTRY
+from my_research.datasets.fields import wants, select_fields
 from my_research.tools.vis import perspective
 
 @DATA_REGISTRY.register()
 class Ge(torch.utils.data.Dataset):
-    def __init__(self, cfg, phase='eval', writer=None):
+    EVAL_CROP_FIELDS = ('img',)  # stored by utils/eval_crop_cache.py, the targets are in params.mat / pose_gt.mat
+
+    def __init__(self, cfg, phase='eval', writer=None, fields=None):
         self.cfg = cfg
+        self.fields = fields  # see my_research/datasets/fields.py
         self.phase = phase
         self.mean = torch.tensor([0.0016, 0.0025, 0.7360]).float()
         self.std = torch.tensor(0.20)
@@ -57,15 +63,31 @@ class Ge(torch.utils.data.Dataset):
         mat_gt = sio.loadmat(os.path.join(self.root, 'pose_gt.mat'))
         self.pose_gts = torch.from_numpy(mat_gt["pose_gt"])  # N x K x 3
         assert len(self.image_paths) == self.pose_gts.shape[0]
+        self.eval_crops = load_eval_crop_store(cfg, self, self.eval_aug_cfg(), self.EVAL_CROP_FIELDS)  # see utils/eval_crop_cache.py
 
         if writer is not None:
             writer.print_str('Loaded Ge test {} samples'.format(len(self.image_paths)))
         cprint('Loaded Ge test {} samples'.format(len(self.image_paths)), 'red')
 
 
+    def eval_aug_cfg(self):
+        ''' None, the whole image is resized instead of cropped, see utils/eval_crop_cache.py '''
+        return None
+
+    def eval_crop_settings(self):
+        ''' settings besides the crop that the stored eval fields depend on, see utils/eval_crop_cache.py '''
+        return {'root': os.path.abspath(self.root)}
+
     def __getitem__(self, idx):
-        img = cv2.imread(osp.join(self.root, self.image_paths[idx]))[:, ::-1, ::-1]
-        img = base_transform(img, self.size, std=self.img_std, mean=self.img_mean)
+        if self.eval_crops is not None:
+            img = self.eval_crops.read(idx, self.cfg.DATA.UINT8_IMG, std=self.img_std, mean=self.img_mean)['img']
+        elif self.cfg.DATA.REDUCED_DECODE:
+            # the whole image is resized to self.size, see utils/img_reader.py
+            img, _ = imread(osp.join(self.root, self.image_paths[idx]), max_reduce=8, min_size=(self.size, self.size))
+            img = roi_transform(img[:, ::-1], self.size, std=self.img_std, mean=self.img_mean, uint8=self.cfg.DATA.UINT8_IMG)
+        else:
+            img = cv2.imread(osp.join(self.root, self.image_paths[idx]))[:, ::-1, ::-1]
+            img = roi_transform(img, self.size, std=self.img_std, mean=self.img_mean, uint8=self.cfg.DATA.UINT8_IMG)
         bbox = self.bboxes[idx].clone()
         bbox[0] = 1280 - bbox[0] - bbox[2]
         xyz = self.pose_gts[idx].clone() / 100
@@ -84,15 +106,19 @@ class Ge(torch.utils.data.Dataset):
         calib[1, 2] = scale * (v0 - bbox[1] + 0.5) - 0.5
         calib = torch.from_numpy(calib).float()
         uv = perspective(xyz.clone().T.unsqueeze(0), calib.unsqueeze(0))[0].numpy().T[:, :2]
-        uv_map = uv2map(uv.astype(np.int32), img.shape[1:])
-        uv_map = cv2.resize(uv_map.transpose(1, 2, 0), (img.shape[2]//2, img.shape[1]//2)).transpose(2, 0, 1)
+        uv_map = None
+        if wants(self.fields, 'joint_img_map'):
+            uv_map = uv2map(uv.astype(np.int32), img.shape[1:])
+            uv_map = cv2.resize(uv_map.transpose(1, 2, 0), (img.shape[2]//2, img.shape[1]//2)).transpose(2, 0, 1)
+            uv_map = torch.from_numpy(uv_map).float()
         uv = uv / img.shape[1:][::-1]
         xyz -= xyz_root
-        img, uv_point, uv_map = [torch.from_numpy(x).float() for x in [img, uv, uv_map]]
+        img = as_tensor(img, self.cfg.DATA.UINT8_IMG)
+        uv_point = torch.from_numpy(uv).float()
 
         res = {'img': img, 'joint_img': uv_point, 'joint_cam': xyz, 'root': xyz_root, 'calib': calib, 'joint_img_map': uv_map}
 
-        return res
+        return select_fields(res, self.fields)  # only the fields of self.fields
 
     def visualization(self, idx, data):
         gs = gridspec.GridSpec(1, 2)
@@ -86,21 +86,32 @@ import torch
 import torch.utils.data as data
 import numpy as np
 from utils.fh_utils import load_db_annotation, read_mesh, read_img_abs, read_mask_woclip, projectPoints
-from utils.hanco_utils import read_img, read_mask, read_annot
-
-from utils.vis import base_transform, inv_base_tranmsform, cnt_area
+from utils.hanco_utils import read_img, read_mask, read_annot, load_manifest
+from utils.hanco_shard import HanCoShards, IMAGE_FOLDERS, MASK_FOLDER
+from utils.frame_cache import SharedFrameCache
+from utils.hanco_annot import load_annot_store
+from utils.bbox_index import load_bbox_index, mask_bbox, square_bbox
+from utils.eval_crop_cache import load_eval_crop_store
+from utils.img_reader import max_crop_reduce
+
+from utils.vis import base_transform, inv_base_tranmsform, cnt_area, roi_transform, roi_transform_window, as_tensor
 import cv2
-from utils.augmentation import Augmentation
+from utils.augmentation import Augmentation, LUTAugmentation
 from termcolor import cprint
-from utils.preprocessing import augmentation, augmentation_2d, trans_point2d
+from utils.preprocessing import augmentation, augmentation_window, augmentation_2d, augmentation_2d_batch, trans_point2d
 from my_research.tools.kinematics import MPIIHandJoints
 from my_research.models.loss import contrastive_loss_3d, contrastive_loss_2d
 import vctoolkit as vc
 from my_research.build import DATA_REGISTRY
+from my_research.datasets.fields import wants, select_fields
+
+HANCO_FRAME_BYTES = 224 * 224 * 3  # HanCo frames are (224, 224, 3)
 
 @DATA_REGISTRY.register()
 class HanCo(data.Dataset):
-    def __init__(self, cfg, phase='train', frame_counts=8, writer=None):
+    EVAL_CROP_FIELDS = ('img', 'mask', 'joint_cam', 'joint_img', 'verts', 'root', 'calib')  # stored by utils/eval_crop_cache.py
+
+    def __init__(self, cfg, phase='train', frame_counts=8, writer=None, fields=None):
         '''Init a FreiHAND Dataset
 
         Args:
@@ -108,6 +119,7 @@ class HanCo(data.Dataset):
             frame_counts: (int, optional): transformer got how many frames at a time. Default to 8.
                 not required in 'test' phase
             phase (str, optional): train or eval. Defaults to 'train'.
+            fields (optional): fields a sample carries, None: every field, see my_research/datasets/fields.py
         '''
         super(HanCo, self).__init__()
         self.cfg = cfg
@@ -120,6 +132,18 @@ class HanCo(data.Dataset):
         assert 1 < frame_counts <= 20, f'frame_counts should be in (2, 21), got: {frame_counts}'
 
         self.hanco_root = self.cfg.DATA.HANCO.ROOT
+        self.shards = HanCoShards(self.cfg.DATA.HANCO.SHARD_ROOT) if self.cfg.DATA.HANCO.SHARD_ROOT else None  # packed frames, see utils/hanco_shard.py
+        self.manifest = load_manifest(self.hanco_root)  # frame counts & split criterions, built once
+        self.seq_lengths = self.manifest['frame_counts']  # [seq_id, cam_id] -> frame counts
+        self.bbox_index = load_bbox_index(self.hanco_root, length=int(self.seq_lengths.sum()))  # see utils/bbox_index.py
+        self.fields = fields
+        self.return_mask = self.cfg.DATA.RETURN_MASK and wants(fields, 'mask')
+        self.annot_store = load_annot_store(self.hanco_root)  # memory-mapped numpy_seq, see utils/hanco_annot.py
+        self.frame_cache = None  # decoded frames shared by all DataLoader workers, see utils/frame_cache.py
+        # training only, valid / test read every frame once per epoch (or their eval_crops)
+        if self.cfg.DATA.HANCO.FRAME_CACHE_MB > 0 and self.shards is None and self.phase == 'train':
+            self.frame_cache = SharedFrameCache(self.cfg.DATA.HANCO.FRAME_CACHE_MB * 2**20, slot_bytes=HANCO_FRAME_BYTES,
+                                                folders=IMAGE_FOLDERS + [MASK_FOLDER])
 
         split_info_path = os.path.join(self.hanco_root, 'dataset_split_info.npz')
         if os.path.isfile(split_info_path):
@@ -139,12 +163,25 @@ class HanCo(data.Dataset):
                 test_seq=self.test_seq, valid_seq_start_frame=self.valid_seq_start_frame,
                 frame_count=self.frame_counts, ratio=0.03)
 
+        # seq_id -> position in {train, valid, test}_seq
+        self.train_seq_pos = {int(seq_id): i for i, seq_id in enumerate(self.train_seq)}
+        self.valid_seq_pos = {int(seq_id): i for i, seq_id in enumerate(self.valid_seq)}
+        self.test_seq_pos  = {int(seq_id): i for i, seq_id in enumerate(self.test_seq)}
+
         self.len_train_seq_cam = len(self.train_seq) * 8  # (sequence X cam) counts of all augment folders
         self.len_valid_seq_cam = len(self.valid_seq) * 8
 
         self.image_aug = ['rgb', 'rgb_color_auto', 'rgb_color_sample', 'rgb_homo', 'rgb_merged']
 
-        self.color_aug = Augmentation() if cfg.DATA.COLOR_AUG and 'train' in self.phase else None
+        self.color_aug = None
+        if cfg.DATA.COLOR_AUG and 'train' in self.phase:
+            self.color_aug = LUTAugmentation() if cfg.DATA.LUT_COLOR_AUG else Augmentation()
+        # float colour augmentation is not clipped or rounded, those crops stay float
+        self.uint8_img = cfg.DATA.UINT8_IMG and not isinstance(self.color_aug, Augmentation)
+        self.eval_crops = None  # valid windows / test sequences, see utils/eval_crop_cache.py
+        if self.phase != 'train':
+            self.eval_crops = load_eval_crop_store(cfg, self, self.eval_aug_cfg(),
+                                                   [name for name in self.EVAL_CROP_FIELDS if wants(fields, name)])
         cprint(f'Loaded HanCo {self.phase} {self.__len__()} sequences', 'red')
         if self.phase == 'train':
             # need train/valid/test HanCo data while training
@@ -164,35 +201,17 @@ class HanCo(data.Dataset):
 
         Details: see Top[Descriptions of Criterions, Decide Train/Test set]
         '''
-        meta_file = os.path.join(hanco_root, 'meta.json')
-        with open(meta_file, 'r') as file:
-            meta_data = json.load(file)
-        # keys are: 'is_train': 綠幕, 'subject_id': 人物, 'is_valid': MANO 有人工檢驗過,
-        #           'object_id': 手握                  , 'has_fit':  有 MANO 參數
-
-        # Crit 3: has MANO fit
-        hasfit_seq = []
-        for i, seq in enumerate(meta_data['has_fit']):
-            ''' seq: List[bool] '''
-            if sum(seq) == len(seq):
-                hasfit_seq += [i]
-
-        # Crit 2: has full augment images
+        # Crit 3: has MANO fit, Crit 2: has full augment images
         #         all augment have same sequences, so check 1 type is enough
-        dir_rgb_color_auto = os.path.join(hanco_root, 'rgb_color_auto')
-
-        full_aug_seq = [int(folder) for folder in os.listdir(dir_rgb_color_auto)]
+        # both are computed once in self.manifest, see utils/hanco_utils.build_manifest
+        train_set = set(self.manifest['train_seq'].tolist())
+        test_set  = set(self.manifest['test_seq'].tolist())
 
-        set_hasfit_seq = set(hasfit_seq)
-        set_full_aug_seq = set(full_aug_seq)
-
-        # Train / Test set
-        train_set = set_hasfit_seq & set_full_aug_seq
-        test_set  = set_hasfit_seq - set_full_aug_seq
+        set_hasfit_seq = set(np.flatnonzero(self.manifest['has_fit']).tolist())
+        set_full_aug_seq = set(np.flatnonzero(self.manifest['full_aug']).tolist())
 
         # Check
-        dir_mask = os.path.join(hanco_root, 'mask_hand')
-        set_mask_seq = set(int(folder) for folder in os.listdir(dir_mask))
+        set_mask_seq = set(np.flatnonzero(self.manifest['has_mask']).tolist())
 
         assert train_set & test_set == set(), '(X) train & test set should have NO intersection'
         assert all(0 <= e < 1518 for e in train_set), '(X) index in train_set, not in range(0, 1518)'
@@ -237,9 +256,7 @@ class HanCo(data.Dataset):
         ''' min seq len = 23 '''
         valid_seq_start = []
         for seq_id in valid_seq:
-            max_seq_length = len(os.listdir(
-                os.path.join(self.hanco_root, 'rgb', f'{seq_id:04d}', 'cam0')
-            ))
+            max_seq_length = int(self.seq_lengths[seq_id, 0])
             start = np.random.randint(
                 max_seq_length // 3, max_seq_length -self.frame_counts +1,
                 size=5 * 8
@@ -272,24 +289,50 @@ class HanCo(data.Dataset):
             except:
                 raise Exception(f'--- [Error] at {self.phase}: data[{idx}] --- aug: {aug_id}, seq: {seq_id}, cam: {cam_id}')
         elif self.phase == 'valid':
+            if self.eval_crops is not None:
+                return self._cached_sample(idx, start=self.valid_seq_start_frame[idx])
             aug_id, seq_id, cam_id = self._inverse_compute_index(idx)
             return self.get_training_sample(aug_id, seq_id, cam_id,
                         start=self.valid_seq_start_frame[idx])  # valid_start = shape(IA Seq Cam)
         elif self.phase == 'test':
             seq_id, cam_id = self._inverse_compute_index(idx)
+            if self.eval_crops is not None:
+                return self._cached_sample(idx, start=0)
             return self.get_testing_sample(seq_id, cam_id)
 
+    def eval_aug_cfg(self):
+        ''' cfg.DATA.<dataset> whose BASE_SCALE crops the valid/test samples, see utils/eval_crop_cache.py '''
+        return self.cfg.DATA.HANCO if self.phase == 'valid' else self.cfg.DATA.FREIHAND
+
+    def eval_crop_settings(self):
+        ''' settings besides the crop that the stored eval fields depend on, see utils/eval_crop_cache.py
+            joint_cam / verts are stored relative to the root and divided by HANCO.SCALE
+        '''
+        return {'root': os.path.abspath(self.hanco_root), 'target_scale': self.cfg.DATA.HANCO.SCALE}
+
+    def _cached_sample(self, idx, **indices):
+        ''' valid/test sample {idx} from self.eval_crops, the same fields as get_[training, testing]_sample
+            indices: start (and seq_id, cam_id), as the sample without the store carries them
+        '''
+        window = self.eval_crops.read(idx, self.cfg.DATA.UINT8_IMG, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
+        ret = dict(indices)
+        ret['img'] = as_tensor(window['img'], self.uint8_img)
+        ret['mask'] = as_tensor(window['mask'], self.cfg.DATA.UINT8_IMG) if self.return_mask else None
+        for name in ('joint_cam', 'joint_img', 'verts', 'root', 'calib'):
+            ret[name] = torch.from_numpy(window[name]).float() if name in window else None
+        return select_fields(ret, self.fields)  # only the fields of self.fields
+
     def _compute_index(self, aug_id, seq_id, cam_id):
         ''' aug_id, seq_id, cam_id -> index
         '''
         if self.phase == 'train':
             return aug_id * self.len_train_seq_cam + \
-                   self.train_seq.index(seq_id) * 8 + cam_id
+                   self.train_seq_pos[seq_id] * 8 + cam_id
         elif self.phase == 'valid':
             return aug_id * self.len_valid_seq_cam + \
-                   self.valid_seq.index(seq_id) * 8 + cam_id
+                   self.valid_seq_pos[seq_id] * 8 + cam_id
         elif self.phase == 'test':
-            return self.test_seq.index(seq_id) * 8 + cam_id
+            return self.test_seq_pos[seq_id] * 8 + cam_id
 
     def _inverse_compute_index(self, idx):
         ''' index -> (aug_id), seq_id, cam_id
@@ -309,6 +352,60 @@ class HanCo(data.Dataset):
             cam_id = idx % 8
             return seq_id, cam_id
 
+    def locality_order(self):
+        ''' every index, sorted by (seq_id, cam_id, aug_id), for my_research/datasets/sampler.py
+            train/valid index = aug_id * (#seq * 8) + seq_pos * 8 + cam_id
+            test index is already sorted by (seq_id, cam_id)
+        '''
+        if self.phase == 'test':
+            return np.arange(len(self))
+        return np.arange(len(self)).reshape(len(self.image_aug), -1).T.reshape(-1)
+
+    def _read_frames(self, folder, seq_id, cam_id, start, stop, with_mask=True, max_reduce=1):
+        ''' read images, masks of frames [start, stop)
+            return (F, H, W, 3), (F, H, W) uint8 arrays, reduce
+            masks is None if not {with_mask}
+            max_reduce: jpg images are decoded at 1/reduce resolution, reduce <= max_reduce,
+                        masks are always full resolution, see utils/img_reader.py
+        '''
+        if self.shards is not None:
+            return self.shards.read_frames(folder, seq_id, cam_id, start, stop), \
+                   self.shards.read_masks(seq_id, cam_id, start, stop) if with_mask else None, 1
+
+        images, masks, reduce = [], [], 1
+        for frame_id in range(start, stop):
+            if max_reduce > 1:
+                # frames of a (seq_id, cam_id) have the same size, so the same reduce
+                img, reduce = read_img(self.hanco_root, folder, seq_id, cam_id, frame_id, max_reduce=max_reduce)
+                images += [img]
+            else:
+                images += [self._read_cached(folder, seq_id, cam_id, frame_id)]
+            if with_mask:
+                masks += [self._read_cached(MASK_FOLDER, seq_id, cam_id, frame_id)]
+
+        return np.stack(images), np.stack(masks) if with_mask else None, reduce
+
+    def _read_cached(self, folder, seq_id, cam_id, frame_id):
+        ''' decoded image (or mask if folder == 'mask_hand') of one frame, through self.frame_cache if enabled '''
+        key = (folder, seq_id, cam_id, frame_id)
+        frame = self.frame_cache.get(key) if self.frame_cache is not None else None
+        if frame is None:
+            if folder == MASK_FOLDER:
+                frame = read_mask(self.hanco_root, seq_id, cam_id, frame_id)
+            else:
+                frame = read_img(self.hanco_root, folder, seq_id, cam_id, frame_id)
+            if self.frame_cache is not None:
+                self.frame_cache.put(key, frame)
+        return frame
+
+    def _read_annot(self, seq_id, cam_id):
+        ''' numpy_seq annotations of (seq_id, cam_id), see utils.hanco_utils.read_annot
+            zero-copy views of self.annot_store if it is built
+        '''
+        if self.annot_store is not None:
+            return self.annot_store.read(seq_id, cam_id)
+        return read_annot(self.hanco_root, seq_id, cam_id)
+
     def get_training_sample(self, aug_id, seq_id, cam_id, start=None):
         ''' Get HanCo sequence, see details at top - FORMAT
             with frame counts: self.frame_counts
@@ -319,9 +416,7 @@ class HanCo(data.Dataset):
         # _ = f'{seq_id:04d}', f'cam{cam_id}', f'{frame_id:08d}'
 
         # compute frame counts in seq: seq_id
-        max_seq_length = len(os.listdir(
-            os.path.join(self.hanco_root, 'rgb', f'{seq_id:04d}', f'cam{cam_id}')
-        ))
+        max_seq_length = int(self.seq_lengths[seq_id, cam_id])
 
         # get sequence: [start, ..., start+self.frame_counts -1][ ... ]
         if start is None:
@@ -331,105 +426,42 @@ class HanCo(data.Dataset):
             f'start frame too large with frame_count={self.frame_counts}, ({start} / {max_seq_length})'
 
         # read images, masks
-        images, masks = [], []
-        for frame_id in range(start, start + self.frame_counts):
-            img = read_img(self.hanco_root, self.image_aug[aug_id], seq_id, cam_id, frame_id)
-            mask = read_mask(self.hanco_root, seq_id, cam_id, frame_id)
-            images += [img]
-            masks += [mask]
-
-        images, masks = np.stack(images), np.stack(masks)
+        # masks are only needed for bboxes if bbox_index is not built
+        max_reduce = 1
+        if self.bbox_index is not None:
+            bboxes = self.bbox_index.window(seq_id, cam_id, start, start + self.frame_counts)
+            if self.cfg.DATA.REDUCED_DECODE:
+                # the smallest augmented crop in the window still keeps DATA.SIZE pixels
+                min_crop = min(max(bbox[2], bbox[3]) for bbox in bboxes) * (self.cfg.DATA.HANCO.BASE_SCALE - self.cfg.DATA.HANCO.SCALE)
+                max_reduce = max_crop_reduce(min_crop, self.cfg.DATA.SIZE)
+        images, masks, img_reduce = self._read_frames(self.image_aug[aug_id], seq_id, cam_id, start, start + self.frame_counts,
+                                                      with_mask=self.return_mask or self.bbox_index is None,
+                                                      max_reduce=max_reduce)
 
         # read annots
-        Annots = read_annot(self.hanco_root, seq_id, cam_id)
+        Annots = self._read_annot(seq_id, cam_id)
         Roots = Annots['global_t'][start:start + self.frame_counts]
-        Verts = Annots['verts'][start:start + self.frame_counts] + Roots
+        Verts = Annots['verts'][start:start + self.frame_counts] + Roots if wants(self.fields, 'verts') else None
         Joints = Annots['joint'][start:start + self.frame_counts] + Roots
         Intrinsics = Annots['intrinsic'][start:start + self.frame_counts]
 
-        # Complete list of ndarray {roi, mask, joint_cam, joint_img, verts, root, calib}
-        roi_list, mask_list, joint_cam_list, joint_img_list, verts_list, root_list, calib_list = [], [], [], [], [], [], []
-
-        for i in range(self.frame_counts):
-            # augment for data[i]: image, mask, annots
-            img = images[i]
-            mask = masks[i]
-            vert = Verts[i]
-
-            bbox = self._get_init_bbox_from_mask(mask=mask)
-            K, joint_cam = Intrinsics[i], Joints[i] # (3, 3), (21, 3)
-
-            # Copied from FreiHAND.get_training_sample()
-            joint_img = projectPoints(joint_cam, K) # (21, 2)
-            princpt = K[0:2, 2].astype(np.float32)
-            focal = np.array( [K[0, 0], K[1, 1]], dtype=np.float32)
-
-            roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, mask = augmentation(img, bbox, self.phase,
-                                                                                            exclude_flip=not self.cfg.DATA.HANCO.FLIP,
-                                                                                            input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE),
-                                                                                            mask=mask,
-                                                                                            base_scale=self.cfg.DATA.HANCO.BASE_SCALE,
-                                                                                            scale_factor=self.cfg.DATA.HANCO.SCALE,
-                                                                                            rot_factor=self.cfg.DATA.HANCO.ROT,
-                                                                                            shift_wh=[bbox[2], bbox[3]],
-                                                                                            gaussian_std=self.cfg.DATA.STD)
-            if self.color_aug is not None:
-                roi = self.color_aug(roi)
-            roi = base_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
-
-            # joints
-            joint_img, princpt = augmentation_2d(img, joint_img, princpt, img2bb_trans, do_flip)
-            joint_img = joint_img[:, :2] / self.cfg.DATA.SIZE
-
-            # 3D rot
-            rot = aug_param[0]
-            assert rot == 0, 'should not rotate in hanco dataset'
-            rot_aug_mat = np.array([[np.cos(np.deg2rad(-rot)), -np.sin(np.deg2rad(-rot)), 0],
-                                    [np.sin(np.deg2rad(-rot)), np.cos(np.deg2rad(-rot)), 0],
-                                    [0, 0, 1]], dtype=np.float32)
-            ''' 拇指朝 z+ 方向旋轉 (-rot) 度
-            | cos(-rot) | -sin(-rot) | 0 |
-            | sin(-rot) |  cos(-rot) | 0 |
-            |     0     |    0       | 1 |
-
-            因為 內部的 rot 是指旋轉 bbox! 旋轉後的 bbox 再經由 affine trans 轉到輸出圖片座標時，事實上做的旋轉是倒過來的
-            '''
-            joint_cam = np.dot(rot_aug_mat, joint_cam.T).T
-            vert = np.dot(rot_aug_mat, vert.T).T
-
-            # K
-            focal = focal * self.cfg.DATA.SIZE / (bbox[2]*aug_param[1])
-            calib = np.array([
-                [ focal[0],    0    , princpt[0], 0],
-                [    0    , focal[1], princpt[1], 0],
-                [    0    ,    0    ,     1     , 0],
-                [    0    ,    0    ,     0     , 1]
-            ], dtype=np.float64)
-
-            # postprocess root and joint_cam
-            root = Roots[i]
-            joint_cam -= root
-            vert -= root
-            joint_cam /= self.cfg.DATA.HANCO.SCALE  # edited from 0.2
-            vert /= self.cfg.DATA.HANCO.SCALE  # edited from 0.2
-
-            # add to list
-            roi_list += [roi]
-            mask_list += [mask]
-            joint_cam_list += [joint_cam]
-            joint_img_list += [joint_img]
-            verts_list += [vert]
-            root_list += [root[0]]
-            calib_list += [calib]
-
-        # Prepare torch.Tensor from ndarray lists
-        roi_tensor = torch.from_numpy(np.stack(roi_list)).float()
-        mask_tensor = torch.from_numpy(np.stack(mask_list)).float()
-        joint_cam_tensor = torch.from_numpy(np.stack(joint_cam_list)).float()
-        joint_img_tensor = torch.from_numpy(np.stack(joint_img_list)).float()
-        verts_tensor = torch.from_numpy(np.stack(verts_list)).float()
-        root_tensor = torch.from_numpy(np.stack(root_list)).float()
-        calib_tensor = torch.from_numpy(np.stack(calib_list)).float()
+        if self.bbox_index is not None:
+            bboxes = [self._get_init_bbox_from_mask(bbox=bbox) for bbox in bboxes]
+        else:
+            bboxes = [self._get_init_bbox_from_mask(mask=mask) for mask in masks]
+
+        # augment the whole window: image, mask, annots
+        window = self._build_window(images, masks, bboxes, Joints, Verts, Roots, Intrinsics, self.cfg.DATA.HANCO,
+                                    img_reduce=img_reduce, color_aug=self.color_aug)
+
+        # Prepare torch.Tensor from (F, ...) ndarrays
+        roi_tensor = as_tensor(window['img'], self.uint8_img)
+        mask_tensor = as_tensor(window['mask'], self.cfg.DATA.UINT8_IMG) if self.return_mask else None
+        joint_cam_tensor = torch.from_numpy(window['joint_cam']).float()
+        joint_img_tensor = torch.from_numpy(window['joint_img']).float()
+        verts_tensor = torch.from_numpy(window['verts']).float() if Verts is not None else None
+        root_tensor = torch.from_numpy(window['root']).float()
+        calib_tensor = torch.from_numpy(window['calib']).float()
 
         ret = {
             'start': start,
@@ -445,26 +477,91 @@ class HanCo(data.Dataset):
 
             'calib': calib_tensor,
         }
+        return select_fields(ret, self.fields)  # only the fields of self.fields
 
-        return ret
-
-    def _get_init_bbox_from_mask(self, mask=None, img=None):
+    def _get_init_bbox_from_mask(self, mask=None, img=None, bbox=None):
         ''' only called by get_[training, contrastive, testing]_sample
+            bbox: Optional, precomputed mask bbox from self.bbox_index
         '''
-        if self.phase in ['train', 'valid']:
+        if bbox is not None:
+            pass
+        elif self.phase in ['train', 'valid']:
             assert mask is not None, 'phase: train|valid, {mask} should not be None ' + f'got: {mask}'
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            contours = list(contours)
-            contours.sort(key=cnt_area, reverse=True)
-            bbox = cv2.boundingRect(contours[0])
+            bbox = mask_bbox(mask)
         else:
             assert img is not None, 'phase: train, {img} should not be None ' + f'got: {img}'
             bbox = [img.shape[1]//2-50, img.shape[0]//2-50, 100, 100]  # img: (224, 224), bbox=[62, 62, 100, 100]
 
-        center = [bbox[0]+bbox[2]*0.5, bbox[1]+bbox[3]*0.5]
-        w, h = bbox[2], bbox[3]
-        bbox = [center[0]-0.5 * max(w, h), center[1]-0.5 * max(w, h), max(w, h), max(w, h)]  # square(left, top, w, h)
-        return bbox
+        return square_bbox(bbox)  # square(left, top, w, h)
+
+    def _build_window(self, images, masks, bboxes, Joints, Verts, Roots, Intrinsics, aug_cfg, img_reduce=1, color_aug=None):
+        ''' fields of the F frames of a window as (F, ...) ndarrays, every step on the whole window
+            bboxes: F square bboxes, Joints / Verts (None if not wanted) / Roots (F, 1, 3) / Intrinsics: camera space annots
+            aug_cfg: cfg.DATA.<dataset> with FLIP, BASE_SCALE, SCALE, ROT
+            color_aug: None, Augmentation (per frame) or LUTAugmentation (one draw for the window)
+        '''
+        bboxes = np.asarray(bboxes, dtype=np.float64)
+        rois, img2bb_trans, _, aug_param, do_flip, _, masks = augmentation_window(images, bboxes, self.phase,
+                                                                                  exclude_flip=not aug_cfg.FLIP,
+                                                                                  input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE),
+                                                                                  masks=masks if self.return_mask else None,
+                                                                                  base_scale=aug_cfg.BASE_SCALE,
+                                                                                  scale_factor=aug_cfg.SCALE,
+                                                                                  rot_factor=aug_cfg.ROT,
+                                                                                  gaussian_std=self.cfg.DATA.STD,
+                                                                                  img_reduce=img_reduce)
+        if isinstance(color_aug, LUTAugmentation):
+            rois = color_aug(rois)
+        elif color_aug is not None:
+            rois = np.stack([color_aug(roi) for roi in rois])
+        rois = roi_transform_window(rois, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD, uint8=self.uint8_img)
+
+        # joints, K
+        Joint_imgs = projectPoints(Joints, Intrinsics)  # (F, 21, 2)
+        joint_img, calib = self._window_2d(images[0].shape, Joint_imgs, Intrinsics, img2bb_trans, do_flip,
+                                           bboxes[:, 2] * aug_param[:, 1], img_reduce)  # 放大倍率為：result(roi) / origin(bbox*scale, 擴大 bbox 擷取框框的部份)
+
+        # 3D rot
+        rot = aug_param[:, 0]
+        assert not np.any(rot), 'should not rotate in hanco dataset'
+        cos, sin = np.cos(np.deg2rad(-rot)), np.sin(np.deg2rad(-rot))
+        rot_aug_mat = np.zeros((len(rot), 3, 3), dtype=np.float32)
+        rot_aug_mat[:, 0, 0], rot_aug_mat[:, 0, 1] = cos, -sin
+        rot_aug_mat[:, 1, 0], rot_aug_mat[:, 1, 1] = sin, cos
+        rot_aug_mat[:, 2, 2] = 1
+        ''' 拇指朝 z+ 方向旋轉 (-rot) 度
+        | cos(-rot) | -sin(-rot) | 0 |
+        | sin(-rot) |  cos(-rot) | 0 |
+        |     0     |    0       | 1 |
+
+        因為 內部的 rot 是指旋轉 bbox! 旋轉後的 bbox 再經由 affine trans 轉到輸出圖片座標時，事實上做的旋轉是倒過來的
+        '''
+        joint_cam = np.matmul(Joints, rot_aug_mat.transpose(0, 2, 1))
+        verts = np.matmul(Verts, rot_aug_mat.transpose(0, 2, 1)) if Verts is not None else None
+
+        # postprocess root and joint_cam
+        joint_cam = (joint_cam - Roots) / self.cfg.DATA.HANCO.SCALE  # edited from 0.2
+        if verts is not None:
+            verts = (verts - Roots) / self.cfg.DATA.HANCO.SCALE  # edited from 0.2
+
+        return {'img': rois, 'mask': masks, 'joint_cam': joint_cam, 'joint_img': joint_img, 'verts': verts,
+                'root': Roots[:, 0], 'calib': calib}
+
+    def _window_2d(self, img_shape, joint_img, K, img2bb_trans, do_flip, crop_size, img_reduce=1):
+        ''' joint_img (F, 21, 2) / DATA.SIZE and calib (F, 4, 4) of the F cropped frames of a window
+            joint_img: projected joints of the full images, K: (F, 3, 3)
+            img2bb_trans, do_flip, crop_size (bbox size * aug scale): of every frame, from augmentation
+        '''
+        princpt = K[:, 0:2, 2].astype(np.float32)
+        focal = np.stack([K[:, 0, 0], K[:, 1, 1]], -1).astype(np.float32)
+        joint_img, princpt = augmentation_2d_batch(img_shape, joint_img, princpt, img2bb_trans, do_flip, img_reduce=img_reduce)
+
+        focal = focal * self.cfg.DATA.SIZE / np.asarray(crop_size)[:, None]
+        calib = np.tile(np.eye(4), (len(focal), 1, 1))
+        calib[:, 0, 0] = focal[:, 0]
+        calib[:, 1, 1] = focal[:, 1]
+        calib[:, 0:2, 2] = princpt
+        return joint_img[..., :2] / self.cfg.DATA.SIZE, calib
 
     def get_testing_sample(self, seq_id, cam_id):
         ''' Get HanCo sequence, see details at top - FORMAT
@@ -474,96 +571,31 @@ class HanCo(data.Dataset):
         # _ = f'{seq_id:04d}', f'cam{cam_id}', f'{frame_id:08d}'
 
         # compute frame counts in seq: seq_id
-        max_seq_length = len(os.listdir(
-            os.path.join(self.hanco_root, 'rgb', f'{seq_id:04d}', f'cam{cam_id}')
-        ))
+        max_seq_length = int(self.seq_lengths[seq_id, cam_id])
 
         # read images, masks
-        images, masks = [], []
-        for frame_id in range(max_seq_length):
-            img = read_img(self.hanco_root, 'rgb', seq_id, cam_id, frame_id)
-            mask = read_mask(self.hanco_root, seq_id, cam_id, frame_id)
-            images += [img]
-            masks += [mask]
-
-        images, masks = np.stack(images), np.stack(masks)
+        images, masks, img_reduce = self._read_frames('rgb', seq_id, cam_id, 0, max_seq_length, with_mask=self.return_mask)
 
         # read annots
-        Annots = read_annot(self.hanco_root, seq_id, cam_id)
+        Annots = self._read_annot(seq_id, cam_id)
         Roots = Annots['global_t']
-        Verts = Annots['verts'] + Roots
+        Verts = Annots['verts'] + Roots if wants(self.fields, 'verts') else None
         Joints = Annots['joint'] + Roots
         Intrinsics = Annots['intrinsic']
 
-        # Complete list of ndarray {roi, mask, joint_cam, joint_img, verts, root, calib}
-        roi_list, mask_list, joint_cam_list, joint_img_list, verts_list, root_list, calib_list = [], [], [], [], [], [], []
-
-        for i in range(max_seq_length):
-            img = images[i]
-            K = Intrinsics[i]
-            mask = masks[i]  # Ground-Truth
-            vert = Verts[i]  # Ground-Truth
-            joint_cam = Joints[i]  # Ground-Truth
-
-            bbox = self._get_init_bbox_from_mask(img=images[i])
-
-            joint_img = projectPoints(joint_cam, K) # (21, 2), Ground-Truth
-
-            princpt = K[0:2, 2].astype(np.float32)
-            focal = np.array( [K[0, 0], K[1, 1]], dtype=np.float32)
-
-            # aug, also crop {roi, mask} to bbox
-            roi, img2bb_trans, bb2img_trans, aug_param, do_flip, scale, mask = augmentation(img, bbox, self.phase,
-                                                                                            exclude_flip=not self.cfg.DATA.FREIHAND.FLIP,
-                                                                                            input_img_shape=(self.cfg.DATA.SIZE, self.cfg.DATA.SIZE),
-                                                                                            mask=mask,
-                                                                                            base_scale=self.cfg.DATA.FREIHAND.BASE_SCALE,
-                                                                                            scale_factor=self.cfg.DATA.FREIHAND.SCALE,
-                                                                                            rot_factor=self.cfg.DATA.FREIHAND.ROT,
-                                                                                            shift_wh=[bbox[2], bbox[3]],
-                                                                                            gaussian_std=self.cfg.DATA.STD)
-            # no color aug
-            roi = base_transform(roi, self.cfg.DATA.SIZE, mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
-
-            # update after BBOXING, just like get_training_sample() do
-            joint_img, princpt = augmentation_2d(img, joint_img, princpt, img2bb_trans, do_flip)
-            joint_img = joint_img[:, :2] / self.cfg.DATA.SIZE
-
-            # No 3D rot
-
-            # K
-            focal = focal * self.cfg.DATA.SIZE / (bbox[2]*aug_param[1])  # 放大倍率為：result(roi) / origin(bbox*scale, 擴大 bbox 擷取框框的部份)
-            calib = np.array([
-                [ focal[0],    0    , princpt[0], 0],
-                [    0    , focal[1], princpt[1], 0],
-                [    0    ,    0    ,     1     , 0],
-                [    0    ,    0    ,     0     , 1]
-            ], dtype=np.float64)
-
-            # postprocess root and joint_cam
-            root = Roots[i]
-            joint_cam -= root
-            vert -= root
-            joint_cam /= self.cfg.DATA.HANCO.SCALE
-            vert /= self.cfg.DATA.HANCO.SCALE
-
-            # add to list
-            roi_list += [roi]
-            mask_list += [mask]
-            joint_cam_list += [joint_cam]
-            joint_img_list += [joint_img]
-            verts_list += [vert]
-            root_list += [root[0]]
-            calib_list += [calib]
-
-        # Prepare torch.Tensor from ndarray lists
-        roi_tensor  = torch.from_numpy(np.stack(roi_list)).float()
-        mask_tensor = torch.from_numpy(np.stack(mask_list)).float()
-        joint_cam_tensor = torch.from_numpy(np.stack(joint_cam_list)).float()
-        joint_img_tensor = torch.from_numpy(np.stack(joint_img_list)).float()
-        verts_tensor = torch.from_numpy(np.stack(verts_list)).float()
-        root_tensor = torch.from_numpy(np.stack(root_list)).float()
-        calib_tensor = torch.from_numpy(np.stack(calib_list)).float()
+        # aug, also crop {roi, mask} to bbox, no color aug
+        bboxes = [self._get_init_bbox_from_mask(img=img) for img in images]
+        window = self._build_window(images, masks, bboxes, Joints, Verts, Roots, Intrinsics, self.cfg.DATA.FREIHAND,
+                                    img_reduce=img_reduce)  # Ground-Truth
+
+        # Prepare torch.Tensor from (F, ...) ndarrays
+        roi_tensor  = as_tensor(window['img'], self.uint8_img)
+        mask_tensor = as_tensor(window['mask'], self.cfg.DATA.UINT8_IMG) if self.return_mask else None
+        joint_cam_tensor = torch.from_numpy(window['joint_cam']).float()
+        joint_img_tensor = torch.from_numpy(window['joint_img']).float()
+        verts_tensor = torch.from_numpy(window['verts']).float() if Verts is not None else None
+        root_tensor = torch.from_numpy(window['root']).float()
+        calib_tensor = torch.from_numpy(window['calib']).float()
 
         ret = {
             'start': 0,
@@ -579,8 +611,7 @@ class HanCo(data.Dataset):
 
             'calib': calib_tensor,
         }
-
-        return ret
+        return select_fields(ret, self.fields)  # only the fields of self.fields
 
     def visualization(self, res, idx):
         """ Visualization of correctness
@@ -0,0 +1,190 @@
+''' Pick num_workers / prefetch_factor of the DataLoader by measuring them
+
+The best number of workers depends on the dataset (FreiHAND single frames vs
+HanCo windows of 8 frames) and on the host. With DATA.LOADER_TUNE.USE, main.py
+and seq_main.py probe the training dataset once at startup:
+
+    for every (num_workers, prefetch_factor) of DATA.LOADER_TUNE within the cpu budget:
+        iterate WARMUP batches (worker start up), then time STEPS batches -> samples/s
+
+The fastest setting wins, a setting with fewer workers is preferred when it is
+within TOLERANCE of the fastest. The measured table is logged, and the choice is
+saved in DATA.LOADER_TUNE.CACHE under (dataset, batch size, frames, host) and a
+hash of everything else that changes the cost of a batch (COST_SETTINGS, the
+dataset class and fields, the collate_fn and sampler type), so later runs on
+the same host with the same settings read it instead of probing again.
+'''
+import os
+import json
+import time
+import socket
+import hashlib
+from functools import reduce
+from torch.utils.data import DataLoader
+
+__all__ = [
+    'cpu_budget',
+    'probe_loader',
+    'tune_loader_kwargs',
+]
+
+
+def cpu_budget(budget=0):
+    ''' max number of workers, {budget} <= 0: cpus available to this process minus the main process '''
+    if budget > 0:
+        return budget
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not on linux
+        cpus = os.cpu_count() or 1
+    return max(cpus - 1, 0)
+
+
+# options that change the cpu cost of a sample or a batch, a choice probed under other values is not reused
+COST_SETTINGS = (
+    'DATA.SIZE',
+    'DATA.RETURN_MASK',
+    'DATA.COLOR_AUG',
+    'DATA.LUT_COLOR_AUG',
+    'DATA.UINT8_IMG',
+    'DATA.REDUCED_DECODE',
+    'DATA.PACKED_COLLATE',
+    'DATA.SHARD_STREAM.ROOTS',
+    'DATA.SHARD_STREAM.SHUFFLE_BUFFER',
+    'DATA.HANCO.SHARD_ROOT',
+    'DATA.HANCO.FRAME_CACHE_MB',
+    'DATA.HANCO.LOCALITY_BLOCK',
+)
+
+
+def _type_name(obj):
+    return None if obj is None else type(obj).__qualname__
+
+
+def _cost_settings(cfg, dataset, loader_kwargs):
+    fields = getattr(dataset, 'fields', None)
+    settings = {name: reduce(getattr, name.split('.'), cfg) for name in COST_SETTINGS}
+    settings.update({
+        'dataset': type(dataset).__qualname__,
+        'fields': sorted(fields) if fields is not None else None,
+        'collate_fn': _type_name(loader_kwargs.get('collate_fn')),
+        'sampler': _type_name(loader_kwargs.get('sampler')),
+        'pin_memory': bool(loader_kwargs.get('pin_memory', False)),
+    })
+    return settings
+
+
+def _cache_key(cfg, dataset, batch_size, settings):
+    frames = getattr(dataset, 'frame_counts', 1)
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return f'{cfg.TRAIN.DATASET}/bs{batch_size}/f{frames}/{digest}@{socket.gethostname()}'
+
+
+def _read_cache(path):
+    if not path or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):  # broken cache, probe again
+        return {}
+
+
+def _write_cache(path, cache):
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)  # runs started together never read half a file
+
+
+def _settings(workers, prefetch_factors, budget):
+    settings = []
+    for num_workers in sorted(set(workers)):
+        if num_workers > budget:
+            continue
+        if num_workers == 0:
+            settings.append((0, None))  # prefetch_factor is only used by workers
+            continue
+        for prefetch_factor in sorted(set(prefetch_factors)):
+            settings.append((num_workers, prefetch_factor))
+    return settings or [(0, None)]
+
+
+def probe_loader(dataset, loader_kwargs, num_workers, prefetch_factor, steps=20, warmup=3):
+    ''' samples per second of a DataLoader(dataset, **loader_kwargs) with this setting '''
+    kwargs = dict(loader_kwargs, num_workers=num_workers)
+    if num_workers > 0:
+        kwargs['prefetch_factor'] = prefetch_factor
+    loader = DataLoader(dataset, **kwargs)
+    steps = min(steps, max(len(loader) - warmup, 1))
+
+    it = iter(loader)
+    samples, start = 0, None
+    try:
+        for _ in range(warmup):
+            next(it)
+        start = time.perf_counter()
+        for _ in range(steps):
+            batch = next(it)
+            samples += len(batch['img']) if isinstance(batch, dict) and 'img' in batch else loader.batch_size
+        duration = time.perf_counter() - start
+    except StopIteration:  # tiny dataset, measured what there was
+        duration = time.perf_counter() - start if samples else 0.
+    finally:
+        del it  # shut the workers down before the next setting starts its own
+    return samples / duration if duration > 0 else 0.
+
+
+def tune_loader_kwargs(cfg, dataset, loader_kwargs, writer=None):
+    ''' {num_workers, prefetch_factor} for DataLoader(dataset, **loader_kwargs, ...)
+
+        loader_kwargs: every other argument of the training DataLoader (batch_size,
+                       sampler, collate_fn, ...), used as is by the probe
+    '''
+    tune = cfg.DATA.LOADER_TUNE
+
+    def log(message):
+        print(message)
+        if writer is not None:
+            writer.print_str(message)
+
+    batch_size = loader_kwargs.get('batch_size', 1)
+    settings = _cost_settings(cfg, dataset, loader_kwargs)
+    key = _cache_key(cfg, dataset, batch_size, settings)
+    budget = cpu_budget(tune.CPU_BUDGET)
+
+    cache = _read_cache(tune.CACHE)
+    if key in cache and cache[key]['num_workers'] <= budget:
+        best = cache[key]
+        log(f'DataLoader tune: {key} from {tune.CACHE}: num_workers={best["num_workers"]}, prefetch_factor={best["prefetch_factor"]}')
+        return _as_kwargs(best)
+
+    table = []
+    for num_workers, prefetch_factor in _settings(tune.WORKERS, tune.PREFETCH_FACTORS, budget):
+        throughput = probe_loader(dataset, loader_kwargs, num_workers, prefetch_factor, steps=tune.STEPS, warmup=tune.WARMUP)
+        table.append({'num_workers': num_workers, 'prefetch_factor': prefetch_factor, 'samples_per_s': throughput})
+
+    fastest = max(row['samples_per_s'] for row in table)
+    best = min((row for row in table if row['samples_per_s'] >= fastest * (1 - tune.TOLERANCE)),
+               key=lambda row: (row['num_workers'], row['prefetch_factor'] or 0))
+
+    lines = [f'DataLoader tune: {key}, cpu budget {budget} workers']
+    for row in table:
+        mark = '*' if row is best else ' '
+        lines.append(f' {mark} num_workers {row["num_workers"]: >2} | prefetch_factor {str(row["prefetch_factor"]): >4} | {row["samples_per_s"]:8.1f} samples/s')
+    log('\n'.join(lines))
+
+    cache = _read_cache(tune.CACHE)  # another run may have written meanwhile
+    cache[key] = dict(best, settings=settings)  # settings: for reading the cache, the key holds their hash
+    _write_cache(tune.CACHE, cache)
+    return _as_kwargs(best)
+
+
+def _as_kwargs(best):
+    kwargs = {'num_workers': int(best['num_workers'])}
+    if kwargs['num_workers'] > 0:
+        kwargs['prefetch_factor'] = int(best['prefetch_factor'])
+    return kwargs
@@ -12,13 +12,13 @@ from my_research.build import DATA_REGISTRY
 
 @DATA_REGISTRY.register()
 class MultipleDatasets(Dataset):  # combine 2 datasets
-    def __init__(self, cfg, phase='train', writer=None):
+    def __init__(self, cfg, phase='train', writer=None, fields=None):
         self.cfg = cfg
         self.dbs = []
         if self.cfg.DATA.FREIHAND.USE:
-            self.dbs.append( FreiHAND(self.cfg, phase, writer) )
+            self.dbs.append( FreiHAND(self.cfg, phase, writer, fields=fields) )
         if self.cfg.DATA.COMPHAND.USE:
-            self.dbs.append( CompHand(self.cfg, phase, writer) )
+            self.dbs.append( CompHand(self.cfg, phase, writer, fields=fields) )
         self.db_num = len(self.dbs)
         self.max_db_data_num = max([len(db) for db in self.dbs])
         self.db_len_cumsum = np.cumsum([len(db) for db in self.dbs])
@@ -0,0 +1,67 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import numpy as np
+import torch
+from torch.utils.data import Sampler, IterableDataset
+
+
+class SequenceBlockSampler(Sampler):
+    ''' Shuffle blocks of neighbouring samples instead of single samples
+
+        order     : every index of the dataset, sorted so that neighbours read the
+                    same folders, e.g. HanCo.locality_order() -> (seq, cam, aug)
+        block_size: consecutive indices of {order} that stay together
+        randomness: fraction of blocks that are broken up and scattered over the
+                    whole epoch, 0: only whole blocks, 1: same as shuffle=True
+
+        a worker builds a whole batch, so with block_size <= batch size it reads
+        runs of windows from the same (seq, cam), while the batch still mixes
+        batch_size / block_size sequences
+    '''
+    def __init__(self, order, block_size=4, randomness=0.0):
+        assert block_size >= 1, f'block_size should be >= 1, got {block_size}'
+        assert 0.0 <= randomness <= 1.0, f'randomness should be in [0, 1], got {randomness}'
+        self.order = np.asarray(order, dtype=np.int64)
+        self.block_size = int(block_size)
+        self.randomness = float(randomness)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        # seeded like RandomSampler, so torch.manual_seed reproduces an epoch
+        seed = int(torch.empty((), dtype=torch.int64).random_().item())
+        rng = np.random.default_rng(seed)
+
+        blocks = [self.order[i:i + self.block_size] for i in range(0, len(self.order), self.block_size)]
+        blocks = [blocks[i] for i in rng.permutation(len(blocks))]
+
+        # scatter the indices of randomly chosen blocks as single-sample blocks
+        scattered = rng.random(len(blocks)) < self.randomness
+        kept = [block for block, s in zip(blocks, scattered) if not s]
+        singles = [np.array([idx]) for block, s in zip(blocks, scattered) if s for idx in block]
+        if singles:
+            blocks = kept + singles
+            blocks = [blocks[i] for i in rng.permutation(len(blocks))]
+
+        for block in blocks:
+            yield from block.tolist()
+
+
+def build_train_sampler(cfg, dataset):
+    ''' SequenceBlockSampler if DATA.HANCO.LOCALITY_BLOCK > 0 and {dataset} can sort itself
+        by locality, otherwise None (DataLoader shuffle=True)
+    '''
+    if cfg.DATA.HANCO.LOCALITY_BLOCK <= 0 or not hasattr(dataset, 'locality_order'):
+        return None
+    return SequenceBlockSampler(dataset.locality_order(),
+                                block_size=cfg.DATA.HANCO.LOCALITY_BLOCK,
+                                randomness=cfg.DATA.HANCO.LOCALITY_RANDOMNESS)
+
+
+def train_shuffle(dataset, sampler):
+    ''' shuffle argument of the training DataLoader, False with a sampler or for an IterableDataset,
+        which shuffles itself (datasets/shardstream.py)
+    '''
+    return sampler is None and not isinstance(dataset, IterableDataset)
@@ -0,0 +1,105 @@
+''' FreiHAND / CompHand training samples streamed from tar shards
+
+The shards of utils/sample_shard.py are read front to back instead of opening
+one file per sample. Every epoch:
+
+    shards of all DATA.SHARD_STREAM.ROOTS  -> permuted with a seed shared by all workers
+    worker i of n                          -> shards[i::n], each shard read once by one worker
+    records                                -> shuffle buffer of DATA.SHARD_STREAM.SHUFFLE_BUFFER records
+    record                                 -> FreiHAND / CompHand.shard_sample, the same sample as __getitem__
+
+A record leaves the buffer at a random position and is replaced by the next
+record of the stream, so samples are mixed across shards up to the buffer size.
+Records are kept encoded in the buffer, they are decoded when they leave it.
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import numpy as np
+import torch
+import torch.utils.data as data
+from termcolor import cprint
+from utils.sample_shard import load_shard_index, iter_shard
+from my_research.datasets.comphand import CompHand
+from my_research.datasets.freihand import FreiHAND
+from my_research.build import DATA_REGISTRY
+
+SHARD_DATASETS = {
+    'FreiHAND': FreiHAND,
+    'CompHand': CompHand,
+}
+
+
+def shuffle_buffer(records, size, rng):
+    ''' {records} in random order, at most {size} of them are held at a time '''
+    buffer = []
+    for record in records:
+        if len(buffer) < size:
+            buffer.append(record)
+            continue
+        i = rng.integers(len(buffer))
+        buffer[i], record = record, buffer[i]
+        yield record
+    for i in rng.permutation(len(buffer)):
+        yield buffer[i]
+
+
+@DATA_REGISTRY.register()
+class ShardStream(data.IterableDataset):
+    def __init__(self, cfg, phase='train', writer=None, fields=None):
+        """Init a stream over the shards of DATA.SHARD_STREAM.ROOTS
+
+        Args:
+            cfg : config file
+            phase (str, optional): train or eval. Defaults to 'train'. Shards and records are only shuffled in train.
+            writer (optional): log file. Defaults to None.
+            fields (optional): fields a sample carries, None: every field, see my_research/datasets/fields.py
+        """
+        super(ShardStream, self).__init__()
+        self.cfg = cfg
+        self.phase = phase
+        self.shuffle = 'train' in phase
+        self.buffer_size = cfg.DATA.SHARD_STREAM.SHUFFLE_BUFFER
+        self.shards = []  # (path, dataset name, count)
+        self.builders = {}  # dataset name -> sample builder
+        for root in cfg.DATA.SHARD_STREAM.ROOTS:
+            index = load_shard_index(root)
+            name = index['dataset']
+            if name not in self.builders:
+                self.builders[name] = SHARD_DATASETS[name].sample_builder(cfg, phase, fields)
+            self.shards += [(shard['path'], name, shard['count']) for shard in index['shards']]
+        assert self.shards, 'no shards, set DATA.SHARD_STREAM.ROOTS, see utils/sample_shard.py'
+        self.length = sum(count for _, _, count in self.shards)
+
+        message = 'Loaded ShardStream {} {} samples in {} shards of {}'.format(self.phase, self.length, len(self.shards), sorted(self.builders))
+        if writer is not None:
+            writer.print_str(message)
+        cprint(message, 'red')
+
+    def __len__(self):
+        return self.length
+
+    def _seeds(self):
+        ''' (epoch seed shared by all workers, seed of this worker, worker id, #workers) '''
+        info = data.get_worker_info()
+        if info is None:
+            # seeded like RandomSampler, so torch.manual_seed reproduces an epoch
+            seed = int(torch.empty((), dtype=torch.int64).random_().item()) % 2**32
+            return seed, seed, 0, 1
+        # info.seed = base_seed + worker id, base_seed is drawn once per epoch by the main process
+        return (info.seed - info.id) % 2**32, info.seed % 2**32, info.id, info.num_workers
+
+    def _records(self, shards):
+        for i in shards:
+            path, name, _ = self.shards[i]
+            for record in iter_shard(path):
+                yield name, record
+
+    def __iter__(self):
+        epoch_seed, worker_seed, worker_id, num_workers = self._seeds()
+        order = np.random.default_rng(epoch_seed).permutation(len(self.shards)) if self.shuffle else np.arange(len(self.shards))
+        records = self._records(order[worker_id::num_workers])
+        if self.shuffle and self.buffer_size > 1:
+            records = shuffle_buffer(records, self.buffer_size, np.random.default_rng(worker_seed))
+        for name, record in records:
+            yield self.builders[name].shard_sample(record)
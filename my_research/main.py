@@ -2,6 +2,10 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from my_research.build import build_model, build_dataset
+from my_research.datasets.sampler import build_train_sampler, train_shuffle
+from my_research.datasets.fields import required_fields
+from my_research.datasets.collate import build_collate_fn
+from my_research.datasets.loader_tune import tune_loader_kwargs
 from my_research.configs.config import get_cfg
 from options.cfg_options import CFGOptions
 from my_research.runner import Runner
@@ -127,17 +131,19 @@ def main(args):
         input('[ERROR] wrong cfg PHASE while loading model')
 
     # data
-    kwargs = {"pin_memory": True, "num_workers": 3, "drop_last": True}  # num_worker: 8
+    kwargs = {"pin_memory": True, "num_workers": 3, "drop_last": True, "collate_fn": build_collate_fn(cfg)}  # num_worker: 8
     if cfg.PHASE in ['train',]:
-        train_dataset = build_dataset(cfg, 'train', writer=writer)
-        train_sampler = None
-        train_loader = DataLoader(train_dataset, batch_size=cfg.TRAIN.BATCH_SIZE, shuffle=(train_sampler is None), sampler=train_sampler, **kwargs)
+        train_dataset = build_dataset(cfg, 'train', writer=writer, fields=required_fields(Runner.TRAIN_FIELDS, model))
+        train_sampler = build_train_sampler(cfg, train_dataset)  # None: shuffle, unless the dataset streams itself
+        if cfg.DATA.LOADER_TUNE.USE:  # num_workers / prefetch_factor of every loader below
+            kwargs.update(tune_loader_kwargs(cfg, train_dataset, dict(kwargs, batch_size=cfg.TRAIN.BATCH_SIZE, shuffle=train_shuffle(train_dataset, train_sampler), sampler=train_sampler), writer=writer))
+        train_loader = DataLoader(train_dataset, batch_size=cfg.TRAIN.BATCH_SIZE, shuffle=train_shuffle(train_dataset, train_sampler), sampler=train_sampler, **kwargs)
     else:
         print('Need not trainloader')
         train_loader = None
 
     if cfg.PHASE in ['train', 'eval']:
-        eval_dataset = build_dataset(cfg, 'val', writer=writer)
+        eval_dataset = build_dataset(cfg, 'val', writer=writer, fields=required_fields(Runner.EVAL_FIELDS))
         eval_sampler = None
         eval_loader = DataLoader(eval_dataset, batch_size=cfg.VAL.BATCH_SIZE, shuffle=False, sampler=eval_sampler, **kwargs)
     else:
@@ -145,7 +151,7 @@ def main(args):
         eval_loader = None
 
     if cfg.PHASE in ['train', 'pred']:
-        test_dataset = build_dataset(cfg, 'test', writer=writer)
+        test_dataset = build_dataset(cfg, 'test', writer=writer, fields=required_fields(Runner.PRED_FIELDS))
         test_loader = DataLoader(test_dataset, batch_size=cfg.TEST.BATCH_SIZE, shuffle=False, **kwargs)
     else:
         print('Need not testloader')
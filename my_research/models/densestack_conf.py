@@ -212,6 +212,9 @@ class DenseStack2(nn.Module):
 
 @MODEL_REGISTRY.register()
 class DenseStack_Conf_Backbone(nn.Module):
+    # ground truth read by loss(), datasets skip the others, see my_research/datasets/fields.py
+    LOSS_FIELDS = ('joint_img',)
+
     def __init__(self, input_channel=128, out_channel=24, latent_size=256, kpts_num=21, pretrain=True):
     # def __init__(self, cfg):
         # Defaults
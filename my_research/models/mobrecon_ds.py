@@ -27,6 +27,10 @@ from my_research.build import MODEL_REGISTRY
 
 @MODEL_REGISTRY.register()
 class MobRecon_DS(nn.Module):
+    # ground truth read by loss(), datasets skip the others, see my_research/datasets/fields.py
+    # aug_param, bb2img_trans: DATA.CONTRASTIVE only
+    LOSS_FIELDS = ('joint_img', 'verts', 'aug_param', 'bb2img_trans')
+
     def __init__(self, cfg):
         """Init a MobRecon-DenseStack model
 
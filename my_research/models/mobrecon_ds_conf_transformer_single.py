@@ -26,11 +26,15 @@ from my_research.models.loss import l1_loss, normal_loss, edge_length_loss, cont
 from utils.read import spiral_tramsform
 from conv.spiralconv import SpiralConv
 from conv.dsconv import DSConv
+from conv.meshupsample import MeshUpsample
 from my_research.build import MODEL_REGISTRY
 
 
 @MODEL_REGISTRY.register()
 class MobRecon_DS_conf_Transformer_Single(nn.Module):
+    # ground truth read by loss(), datasets skip the others, see my_research/datasets/fields.py
+    LOSS_FIELDS = ('joint_img', 'verts', 'joint_cam')
+
     def __init__(self, cfg):
         """Init a MobRecon-DenseStack + conf + transformer model
 
@@ -168,6 +172,8 @@ class SequencialReg2DDecode3D(nn.Module):
         self.spiral_indices = spiral_indices
         self.up_transform = up_transform
         self.num_vert = [u[0].size(0)//3 for u in self.up_transform] + [self.up_transform[-1][0].size(0)//6]
+        # fixed-fanout index / weight buffers, see conv/meshupsample.py
+        self.up_transform = nn.ModuleList([MeshUpsample(u, n_out, n_in) for u, n_out, n_in in zip(up_transform, self.num_vert, self.num_vert[1:])])
         self.uv_channel = uv_channel
         # self.de_layer_conv = conv_layer(self.latent_size, self.out_channels[- 1] -3,  # reserve 3 places for [uvc]
         #                                 1, bn=False, relu=False)
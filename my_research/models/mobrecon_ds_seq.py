@@ -29,6 +29,9 @@ from my_research.build import MODEL_REGISTRY
 # ! NOTICE that: using UVC backbone, but no loss is applied on Confidence
 @MODEL_REGISTRY.register()
 class MobRecon_DS_SEQ(nn.Module):
+    # ground truth read by loss(), datasets skip the others, see my_research/datasets/fields.py
+    LOSS_FIELDS = ('joint_img', 'verts')
+
     def __init__(self, cfg):
         """Init a MobRecon-DenseStack model
 
@@ -14,6 +14,7 @@
 import torch.nn as nn
 import torch
 from conv.spiralconv import SpiralConv
+from conv.meshupsample import MeshUpsample
 
 
 # Basic modules
@@ -131,12 +132,14 @@ def Pool(x, trans, dim=1):
 
     Args:
         x (tensor): input tensor, BxNxD
-        trans (tuple): upsample indices and valus
+        trans (tuple): upsample indices and valus, or a MeshUpsample built from them
         dim (int, optional): upsample axis. Defaults to 1.
 
     Returns:
         tensor: upsampled tensor, BxN'xD
     """
+    if isinstance(trans, MeshUpsample):
+        return trans(x)
     row, col, value = trans[0].to(x.device), trans[1].to(x.device), trans[2].to(x.device)
     value = value.unsqueeze(-1)
     out = torch.index_select(x, dim, col) * value
@@ -188,6 +191,8 @@ class Reg2DDecode3D(nn.Module):
         self.spiral_indices = spiral_indices
         self.up_transform = up_transform
         self.num_vert = [u[0].size(0)//3 for u in self.up_transform] + [self.up_transform[-1][0].size(0)//6]
+        # fixed-fanout index / weight buffers, see conv/meshupsample.py
+        self.up_transform = nn.ModuleList([MeshUpsample(u, n_out, n_in) for u, n_out, n_in in zip(up_transform, self.num_vert, self.num_vert[1:])])
         self.uv_channel = uv_channel
         self.de_layer_conv = conv_layer(self.latent_size, self.out_channels[- 1], 1, bn=False, relu=False)
         self.de_layer = nn.ModuleList()
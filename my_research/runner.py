@@ -5,7 +5,9 @@ import torch
 import cv2
 import json
 from utils.warmup_scheduler import adjust_learning_rate
-from utils.vis import inv_base_tranmsform
+from utils.vis import inv_base_tranmsform, normalize_img
+from my_research.datasets.collate import PackedBatch
+from utils.prefetch import DevicePrefetcher
 from utils.zimeval import EvalUtil
 from utils.transforms import rigid_align
 from my_research.tools.vis import perspective, compute_iou, cnt_area
@@ -15,6 +17,11 @@ import vctoolkit as vc
 
 
 class Runner(object):
+    # fields read from the loaders besides img and model.LOSS_FIELDS, see my_research/datasets/fields.py
+    TRAIN_FIELDS = ('joint_img', 'root', 'calib')  # train(), draw_results()
+    EVAL_FIELDS = ('joint_img', 'joint_cam', 'mask_gt')  # eval()
+    PRED_FIELDS = ('calib', 'negative')  # pred(), pred_negative()
+
     def __init__(self, cfg, args, model, train_loader, val_loader, test_loader, optimizer, writer, device, board, start_epoch=0):
         super(Runner, self).__init__()
         self.cfg = cfg
@@ -92,16 +99,27 @@ class Runner(object):
         '''
         將 data[each key] 中的每一筆 data 都傳到 .to('GPU') 裡面
         '''
+        if isinstance(data, PackedBatch):
+            data = data.to(self.device, non_blocking=True)  # DATA.PACKED_COLLATE: one copy per dtype
         for key, val in data.items():
             try:
                 if isinstance(val, list):
-                    data[key] = [d.to(self.device) for d in data[key]]
+                    data[key] = [d.to(self.device, non_blocking=True) for d in data[key]]
                 else:
-                    data[key] = data[key].to(self.device)
+                    data[key] = data[key].to(self.device, non_blocking=True)
             except:
                 pass
+        # DATA.UINT8_IMG: batched base_transform of uint8 images, see utils/vis.roi_transform
+        if isinstance(data.get('img'), torch.Tensor) and data['img'].dtype == torch.uint8:
+            data['img'] = normalize_img(data['img'], mean=self.cfg.DATA.IMG_MEAN, std=self.cfg.DATA.IMG_STD)
+        if isinstance(data.get('mask'), torch.Tensor) and data['mask'].dtype == torch.uint8:
+            data['mask'] = data['mask'].float()
         return data
 
+    def prefetch(self, loader):
+        ''' iterate {loader} with batches already moved by phrase_data, see utils/prefetch.py '''
+        return DevicePrefetcher(loader, self.device, self.phrase_data, self.cfg.TRAIN.PREFETCH)
+
     def board_scalar(self, phase, n_iter, lr=None, **kwargs):
         split = '/'
         for key, val in kwargs.items():
@@ -169,10 +187,11 @@ class Runner(object):
         forward_time = 0.
         backward_time = 0.
         start_time = time.time()
-        for step, data in enumerate(self.train_loader):
+        data_wait = 0.
+        loader = self.prefetch(self.train_loader)
+        for step, data in enumerate(loader):  # data already to('GPU')
             ts = time.time()
             adjust_learning_rate(self.optimizer, self.epoch, step, len(self.train_loader), self.cfg.TRAIN.LR, self.cfg.TRAIN.LR_DECAY, self.cfg.TRAIN.DECAY_STEP, self.cfg.TRAIN.WARMUP_EPOCHS)
-            data = self.phrase_data(data)  # to('GPU')
             self.optimizer.zero_grad()
             out = self.model(data['img'])
             tf = time.time()
@@ -222,14 +241,20 @@ class Runner(object):
                     'step_duration': duration,
                     'forward_duration': forward_time,
                     'backward_duration': backward_time,
+                    'data_duration': loader.wait_time - data_wait,
                     'lr': self.optimizer.param_groups[0]['lr']
                 }
                 self.writer.print_step_ft(info)
                 forward_time = 0.
                 backward_time = 0.
+                data_wait = loader.wait_time
 
         if self.board is not None:
             self.board_img('train', self.epoch, data, out, losses)
+        self.writer.print_str('Data wait: {}'.format(loader.stats()))
+        frame_cache = getattr(self.train_loader.dataset, 'frame_cache', None)
+        if frame_cache is not None:
+            self.writer.print_str('Frame cache: {}'.format(frame_cache.stats()))
 
         return total_loss / len(self.train_loader)
 
@@ -244,11 +269,10 @@ class Runner(object):
         pa_joint_cam_errors = []
         joint_img_errors = []
         with torch.no_grad():
-            for step, data in enumerate(self.val_loader):
+            for step, data in enumerate(self.prefetch(self.val_loader)):
                 if self.board is None and step % 100 == 0:
                     print(step, len(self.val_loader))
                 # get data then infernce
-                data = self.phrase_data(data)
                 out = self.model(data['img'])
 
                 # get vertex pred
@@ -312,11 +336,10 @@ class Runner(object):
         self.model.eval()
         xyz_pred_list, verts_pred_list = list(), list()
         with torch.no_grad():
-            for step, data in enumerate(self.test_loader):
+            for step, data in enumerate(self.prefetch(self.test_loader)):
                 if self.board is None and step % 100 == 0:
                     print(step, len(self.test_loader))
                 # print(f'Eval on image[{data["idx"].cpu()}]')
-                data = self.phrase_data(data)
                 out = self.model(data['img'])
                 # EXP
                 # print(f'input      : {data["img"].size()}')         # (1, 3, 128, 128)
@@ -393,10 +416,9 @@ class Runner(object):
         heads_negativeness = [[] for _ in range(HeadCount+1)]
         counter = 0
         with torch.no_grad():
-            for step, data in enumerate(self.test_loader):
+            for step, data in enumerate(self.prefetch(self.test_loader)):
                 if self.board is None and step % 100 == 0:
                     print(step, len(self.test_loader))
-                data = self.phrase_data(data)
                 out = self.model(data['img'])
 
                 # out['negative'].shape = (B, 2), 2 heads
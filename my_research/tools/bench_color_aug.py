@@ -0,0 +1,53 @@
+''' Throughput of the colour augmentation, float chain vs lookup tables
+
+Augmentation is the float PhotometricDistort chain used per frame, LUTAugmentation
+(DATA.LUT_COLOR_AUG) the uint8 version, per frame and on a whole HanCo window.
+Inputs are float crops like generate_patch_image returns them, the time includes
+roi_transform so both paths end in the same (3, size, size) image.
+
+    python my_research/tools/bench_color_aug.py --size 128 --frame_counts 8
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import argparse
+import numpy as np
+from utils.augmentation import Augmentation, LUTAugmentation
+from utils.vis import roi_transform
+
+
+def bench(fn, windows, repeat):
+    ''' mean time per frame in us '''
+    fn(windows[0])
+    t = time.perf_counter()
+    for _ in range(repeat):
+        for window in windows:
+            fn(window)
+    return (time.perf_counter() - t) / (repeat * sum(len(w) for w in windows)) * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the colour augmentation')
+    parser.add_argument('--size', type=int, default=128)
+    parser.add_argument('--frame_counts', type=int, default=8)
+    parser.add_argument('--windows', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--uint8', action='store_true', help='roi_transform(uint8=True), DATA.UINT8_IMG')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    windows = [rng.integers(0, 256, (args.frame_counts, args.size, args.size, 3)).astype(np.float32) for _ in range(args.windows)]
+    chain, lut = Augmentation(), LUTAugmentation()
+
+    def transform(roi):
+        return roi_transform(roi, args.size, uint8=args.uint8)
+
+    results = {
+        'chain  per frame': bench(lambda w: [transform(chain(roi)) for roi in w], windows, args.repeat),
+        'lut    per frame': bench(lambda w: [transform(lut(roi)) for roi in w], windows, args.repeat),
+        'lut    window   ': bench(lambda w: [transform(roi) for roi in lut(w)], windows, args.repeat),
+    }
+    base = results['chain  per frame']
+    for name, us in results.items():
+        print(f'{name} | {us:8.1f} us/frame | {1e6 / us:9.0f} frames/s | x{base / us:5.2f}')
@@ -0,0 +1,98 @@
+''' CPU time of HanCo.get_training_sample / get_testing_sample on synthetic windows
+
+Frames, masks, bboxes and annotations are random arrays served from memory, so
+the time is only the sample construction (crop, colour aug, roi_transform,
+projection, calib, rotation), not reading or decoding.
+
+    python my_research/tools/bench_hanco_window.py --frame_counts 8 --windows 200
+    python my_research/tools/bench_hanco_window.py --opts DATA.LUT_COLOR_AUG True DATA.UINT8_IMG True
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import argparse
+import numpy as np
+from my_research.configs.config import get_cfg
+from my_research.datasets.hanco import HanCo
+from utils.augmentation import Augmentation, LUTAugmentation
+
+
+class _Window(object):
+    ''' bbox_index.window() of random bboxes '''
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+
+    def window(self, seq_id, cam_id, start, stop):
+        return self.bboxes[start:stop].tolist()
+
+
+def synthetic_hanco(cfg, phase, frame_counts, seq_length, size=224, seed=0):
+    ''' HanCo without files, every (seq_id, cam_id) is the same random sequence of {seq_length} frames '''
+    rng = np.random.default_rng(seed)
+    images = rng.integers(0, 256, (seq_length, size, size, 3), dtype=np.uint8)
+    masks = rng.integers(0, 256, (seq_length, size, size), dtype=np.uint8)
+    centers = rng.uniform(0.4, 0.6, (seq_length, 2)) * size
+    sizes = rng.uniform(0.25, 0.45, (seq_length, 1)) * size
+    bboxes = np.concatenate([centers - sizes / 2, sizes, sizes], -1)
+    annots = {
+        'global_t': rng.normal(0, 0.05, (seq_length, 1, 3)) + [0, 0, 0.6],
+        'joint': rng.normal(0, 0.05, (seq_length, 21, 3)),
+        'verts': rng.normal(0, 0.05, (seq_length, 778, 3)),
+        'intrinsic': np.tile(np.array([[400., 0, size / 2], [0, 400., size / 2], [0, 0, 1]]), (seq_length, 1, 1)),
+    }
+
+    dataset = HanCo.__new__(HanCo)
+    dataset.cfg = cfg
+    dataset.phase = phase
+    dataset.frame_counts = frame_counts
+    dataset.fields = None
+    dataset.return_mask = cfg.DATA.RETURN_MASK
+    dataset.image_aug = ['rgb']
+    dataset.seq_lengths = np.full((1, 8), seq_length)
+    dataset.bbox_index = _Window(bboxes)
+    dataset.color_aug = None
+    if cfg.DATA.COLOR_AUG and 'train' in phase:
+        dataset.color_aug = LUTAugmentation() if cfg.DATA.LUT_COLOR_AUG else Augmentation()
+    dataset.uint8_img = cfg.DATA.UINT8_IMG and not isinstance(dataset.color_aug, Augmentation)
+    dataset._read_frames = lambda folder, seq_id, cam_id, start, stop, with_mask=True, max_reduce=1: \
+        (images[start:stop], masks[start:stop] if with_mask else None, 1)
+    dataset._read_annot = lambda seq_id, cam_id: annots
+    return dataset
+
+
+def bench(fn, count, warmup=5):
+    ''' mean, std of ms per call '''
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(count):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return np.mean(times) * 1000, np.std(times) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark HanCo window construction')
+    parser.add_argument('--config_file', type=str, default='')
+    parser.add_argument('--opts', type=str, nargs='+', default=[])
+    parser.add_argument('--frame_counts', type=int, default=8)
+    parser.add_argument('--seq_length', type=int, default=40)
+    parser.add_argument('--windows', type=int, default=200)
+    args = parser.parse_args()
+
+    cfg = get_cfg()
+    if args.config_file:
+        cfg.merge_from_file(args.config_file)
+    cfg.merge_from_list(args.opts)
+    cfg.freeze()
+    np.random.seed(0)
+
+    train = synthetic_hanco(cfg, 'train', args.frame_counts, args.seq_length)
+    mean, std = bench(lambda: train.get_training_sample(0, 0, 0), args.windows)
+    print(f'get_training_sample | {args.frame_counts} frames | {mean:7.3f} +- {std:6.3f} ms/window | {mean / args.frame_counts:6.3f} ms/frame')
+
+    test = synthetic_hanco(cfg, 'test', args.frame_counts, args.seq_length)
+    mean, std = bench(lambda: test.get_testing_sample(0, 0), max(args.windows // 10, 1))
+    print(f'get_testing_sample  | {args.seq_length} frames | {mean:7.3f} +- {std:6.3f} ms/seq    | {mean / args.seq_length:6.3f} ms/frame')
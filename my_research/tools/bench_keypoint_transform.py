@@ -0,0 +1,115 @@
+''' Keypoint projection and 2D augmentation, per joint / per frame vs batched arrays
+
+The reference functions below are the former scalar paths: projectPoints of
+one frame (utils/fh_utils.py, utils/hanco_utils.py) and augmentation_2d with a
+trans_point2d call per joint, run frame by frame over a window. The batched
+projectPoints, trans_points2d and augmentation_2d_batch are checked against
+them on random windows (with and without flips, img_reduce 1 / 2 / 4, joints
+with a depth column), then timed per window.
+
+    python my_research/tools/bench_keypoint_transform.py --frame_counts 8 --trials 50
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import argparse
+import numpy as np
+from utils import fh_utils, hanco_utils
+from utils.preprocessing import augmentation_2d, augmentation_2d_batch, gen_trans_from_patch_cv, trans_point2d, trans_points2d
+
+
+def reference_project_points(xyz, K):
+    xyz = np.array(xyz)
+    K = np.array(K)
+    uv = np.matmul(K, xyz.T).T
+    return uv[:, :2] / uv[:, -1:]
+
+
+def reference_augmentation_2d(img_shape, joint_img, princpt, trans, do_flip, img_reduce=1):
+    joint_img = joint_img.copy()
+    princpt = princpt.copy()
+    original_img_shape = (img_shape[0] * img_reduce, img_shape[1] * img_reduce)
+    if do_flip:
+        joint_img[:, 0] = original_img_shape[1] - joint_img[:, 0] - 1
+        princpt[0] = original_img_shape[1] - princpt[0] - 1
+    for i in range(len(joint_img)):
+        joint_img[i, :2] = trans_point2d(joint_img[i, :2], trans)
+    princpt = trans_point2d(princpt, trans)
+    return joint_img, princpt
+
+
+def random_window(rng, frame_counts, img_reduce, size=224, num_joints=21):
+    ''' joints, intrinsics, crop affines and flips of a window of decoded (H, W) = (480 / img_reduce, 640 / img_reduce) frames '''
+    img_shape = (480 // img_reduce, 640 // img_reduce, 3)
+    joint_cam = rng.normal(0, 0.05, (frame_counts, num_joints, 3)) + [0, 0, 0.6]
+    K = np.tile(np.eye(3), (frame_counts, 1, 1))
+    K[:, [0, 1], [0, 1]] = rng.uniform(500, 700, (frame_counts, 2))
+    K[:, 0:2, 2] = rng.uniform(280, 360, (frame_counts, 2))
+    trans = np.stack([gen_trans_from_patch_cv(*rng.uniform(100, 200, 2), *[rng.uniform(80, 200)] * 2, size, size,
+                                              rng.uniform(1.1, 1.5), rng.uniform(-60, 60), (0, 0))
+                      for _ in range(frame_counts)])
+    do_flip = rng.random(frame_counts) < 0.5
+    return img_shape, joint_cam, K, trans, do_flip
+
+
+def bench(fn, repeat):
+    ''' mean time per call in ms '''
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='check and benchmark batched keypoint transforms')
+    parser.add_argument('--frame_counts', type=int, default=8)
+    parser.add_argument('--trials', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for img_reduce in (1, 2, 4):
+        for _ in range(args.trials):
+            img_shape, joint_cam, K, trans, do_flip = random_window(rng, args.frame_counts, img_reduce)
+
+            # projection: the batch against every frame, bit-identical
+            ref = np.stack([reference_project_points(joint_cam[i], K[i]) for i in range(args.frame_counts)])
+            for utils_module in (fh_utils, hanco_utils):
+                assert np.array_equal(utils_module.projectPoints(joint_cam, K), ref), utils_module.__name__
+                assert np.array_equal(utils_module.projectPoints(joint_cam[0], K[0]), ref[0]), utils_module.__name__
+
+            # trans_points2d against trans_point2d per point
+            ref_pts = np.array([[trans_point2d(p, trans[i]) for p in ref[i]] for i in range(args.frame_counts)])
+            assert np.allclose(trans_points2d(ref, trans), ref_pts, rtol=0, atol=1e-9)
+
+            # augmentation_2d(_batch) against the per joint loop, joints with and without a depth column;
+            # the reference flips the float32 princpt in float32, the batch in float64
+            princpt = K[:, 0:2, 2].astype(np.float32)
+            for joint_img in (ref, np.concatenate([ref, joint_cam[..., 2:]], -1)):
+                refs = [reference_augmentation_2d(img_shape, joint_img[i], princpt[i], trans[i], do_flip[i], img_reduce)
+                        for i in range(args.frame_counts)]
+                joint_new, princpt_new = augmentation_2d_batch(img_shape, joint_img, princpt, trans, do_flip, img_reduce=img_reduce)
+                for i, (joint_ref, princpt_ref) in enumerate(refs):
+                    assert np.allclose(joint_new[i], joint_ref, rtol=0, atol=1e-9), (img_reduce, i, do_flip[i])
+                    assert np.allclose(princpt_new[i], princpt_ref, rtol=0, atol=1e-4), (img_reduce, i, do_flip[i])
+                    joint_one, princpt_one = augmentation_2d(np.empty(img_shape, np.uint8), joint_img[i], princpt[i].copy(),
+                                                             trans[i], do_flip[i], img_reduce=img_reduce)
+                    assert np.allclose(joint_one, joint_ref, rtol=0, atol=1e-9) and np.allclose(princpt_one, princpt_ref, rtol=0, atol=1e-4)
+                assert np.array_equal(princpt, K[:, 0:2, 2].astype(np.float32)), 'princpt modified in place'
+        print(f'img_reduce {img_reduce} | {args.trials} windows of {args.frame_counts} frames | projection identical | 2D augmentation equal')
+
+    img_shape, joint_cam, K, trans, do_flip = random_window(rng, args.frame_counts, 1)
+    princpt = K[:, 0:2, 2].astype(np.float32)
+
+    def reference_window():
+        for i in range(args.frame_counts):
+            joint_img = reference_project_points(joint_cam[i], K[i])
+            reference_augmentation_2d(img_shape, joint_img, princpt[i], trans[i], do_flip[i])
+
+    def batched_window():
+        augmentation_2d_batch(img_shape, fh_utils.projectPoints(joint_cam, K), princpt, trans, do_flip)
+
+    t_ref, t_new = bench(reference_window, args.repeat), bench(batched_window, args.repeat)
+    print(f'window of {args.frame_counts} frames | per frame {t_ref:7.3f} ms | batched {t_new:7.3f} ms | x{t_ref / t_new:5.1f}')
@@ -0,0 +1,76 @@
+''' Step time of the training DataLoader, without the model
+
+Every step takes the next batch of the loader and moves it to the device with
+Runner.phrase_data, so the time includes waiting for workers, collate, pinning
+and the host to device copies. --compute_ms emulates the forward/backward pass.
+
+    # default_collate vs BatchCollator (DATA.PACKED_COLLATE), see my_research/datasets/collate.py
+    python my_research/tools/bench_loader.py --config_file my_research/configs/mobrecon_ds.yml
+    python my_research/tools/bench_loader.py --config_file my_research/configs/mobrecon_ds_conf_transformer.yml \
+        --frame_counts 8 --opts TRAIN.DATASET HanCo
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import argparse
+from types import SimpleNamespace
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from my_research.configs.config import get_cfg
+from my_research.build import build_dataset
+from my_research.datasets.collate import build_collate_fn
+from my_research.runner import Runner
+
+
+def bench(cfg, args, device):
+    ''' mean, std of the step time in ms and the mean time of phrase_data in ms '''
+    kwargs = {'frame_counts': args.frame_counts} if args.frame_counts > 0 else {}
+    exec('from my_research.datasets.{} import {}'.format(cfg.TRAIN.DATASET.lower(), cfg.TRAIN.DATASET))
+    dataset = build_dataset(cfg, 'train', **kwargs)
+    loader = DataLoader(dataset, batch_size=args.batch_size or cfg.TRAIN.BATCH_SIZE, shuffle=True,
+                        num_workers=args.num_workers, pin_memory=device.type == 'cuda', drop_last=True,
+                        collate_fn=build_collate_fn(cfg))
+    runner = SimpleNamespace(cfg=cfg, device=device)
+
+    step_times, phrase_times = [], []
+    it = iter(loader)
+    for step in range(args.warmup + args.steps):
+        t = time.perf_counter()
+        data = next(it)
+        tp = time.perf_counter()
+        data = Runner.phrase_data(runner, data)
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        te = time.perf_counter()
+        if args.compute_ms > 0:
+            time.sleep(args.compute_ms / 1000)
+        if step >= args.warmup:
+            step_times.append(te - t)
+            phrase_times.append(te - tp)
+    del it
+    return np.mean(step_times) * 1000, np.std(step_times) * 1000, np.mean(phrase_times) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the training DataLoader')
+    parser.add_argument('--config_file', type=str, required=True)
+    parser.add_argument('--opts', type=str, nargs='+', default=[])
+    parser.add_argument('--frame_counts', type=int, default=0, help='HanCo window length, 0: not passed to the dataset')
+    parser.add_argument('--batch_size', type=int, default=0, help='0: TRAIN.BATCH_SIZE')
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--compute_ms', type=float, default=0)
+    parser.add_argument('--collate', type=str, nargs='+', default=['default', 'packed'], choices=['default', 'packed'])
+    args = parser.parse_args()
+
+    device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+    for collate in args.collate:
+        cfg = get_cfg()
+        cfg.merge_from_file(args.config_file)
+        cfg.merge_from_list(args.opts + ['DATA.PACKED_COLLATE', collate == 'packed'])
+        cfg.freeze()
+        mean, std, phrase = bench(cfg, args, device)
+        print(f'{cfg.TRAIN.DATASET} | {collate: <7} collate | step {mean:7.2f} +- {std:6.2f} ms | phrase_data {phrase:6.2f} ms | {device}')
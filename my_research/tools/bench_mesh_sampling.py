@@ -0,0 +1,178 @@
+''' Mesh hierarchy regeneration, per face / per vertex loops vs batched numpy
+
+The reference functions below are the former utils/mesh_sampling.py: an svd and
+outer products per face for the vertex quadrics, two scans of the edge queue
+per collapse, and a lstsq per target vertex for the up transforms. They are
+swapped into utils.mesh_sampling to regenerate the hierarchy of the template
+as before; the down / up matrices of both runs are checked to be identical,
+then the regeneration and every changed step are timed.
+
+    python my_research/tools/bench_mesh_sampling.py --template_fp template/template.ply --ds_factors 2 2 2 2
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import heapq
+import math
+import argparse
+import numpy as np
+import scipy.sparse as sp
+from psbody.mesh import Mesh
+from utils import mesh_sampling
+
+
+def reference_vertex_quadrics(mesh):
+    v_quadrics = np.zeros((len(mesh.v), 4, 4))
+    for f_idx in range(len(mesh.f)):
+        vert_idxs = mesh.f[f_idx]
+        verts = np.hstack((mesh.v[vert_idxs], np.array([1, 1, 1]).reshape(-1, 1)))
+        u, s, v = np.linalg.svd(verts)
+        eq = v[-1, :].reshape(-1, 1)
+        eq = eq / (np.linalg.norm(eq[0:3]))
+        for k in range(3):
+            v_quadrics[mesh.f[f_idx, k], :, :] += np.outer(eq, eq)
+    return v_quadrics
+
+
+def reference_setup_deformation_transfer(source, target, use_normals=False):
+    rows = np.zeros(3 * target.v.shape[0])
+    cols = np.zeros(3 * target.v.shape[0])
+    coeffs_v = np.zeros(3 * target.v.shape[0])
+    nearest_faces, nearest_parts, nearest_vertices = source.compute_aabb_tree().nearest(target.v, True)
+    nearest_faces = nearest_faces.ravel().astype(np.int64)
+    nearest_parts = nearest_parts.ravel().astype(np.int64)
+    nearest_vertices = nearest_vertices.ravel()
+    for i in range(target.v.shape[0]):
+        nearest_f = source.f[nearest_faces[i]]
+        nearest_v = nearest_vertices[3 * i:3 * i + 3]
+        rows[3 * i:3 * i + 3] = i * np.ones(3)
+        cols[3 * i:3 * i + 3] = nearest_f
+        n_id = nearest_parts[i]
+        if n_id == 0:
+            A = np.vstack((source.v[nearest_f])).T
+            coeffs_v[3 * i:3 * i + 3] = np.linalg.lstsq(A, nearest_v, rcond=-1)[0]
+        elif n_id > 0 and n_id <= 3:
+            A = np.vstack((source.v[nearest_f[n_id - 1]], source.v[nearest_f[n_id % 3]])).T
+            tmp_coeffs = np.linalg.lstsq(A, target.v[i], rcond=-1)[0]
+            coeffs_v[3 * i + n_id - 1] = tmp_coeffs[0]
+            coeffs_v[3 * i + n_id % 3] = tmp_coeffs[1]
+        else:
+            coeffs_v[3 * i + n_id - 4] = 1.0
+    return sp.csc_matrix((coeffs_v, (rows, cols)), shape=(target.v.shape[0], source.v.shape[0]))
+
+
+def reference_qslim_decimator_transformer(mesh, factor=None, n_verts_desired=None):
+    if n_verts_desired is None:
+        n_verts_desired = math.ceil(len(mesh.v) * factor)
+    Qv = reference_vertex_quadrics(mesh)
+    vert_adj = mesh_sampling.get_vertices_per_edge(mesh.v, mesh.f)
+    vert_adj = sp.csc_matrix((vert_adj[:, 0] * 0 + 1, (vert_adj[:, 0], vert_adj[:, 1])),
+                             shape=(len(mesh.v), len(mesh.v)))
+    vert_adj = (vert_adj + vert_adj.T).tocoo()
+
+    def collapse_cost(Qv, r, c, v):
+        Qsum = Qv[r, :, :] + Qv[c, :, :]
+        p1 = np.vstack((v[r].reshape(-1, 1), np.array([1]).reshape(-1, 1)))
+        p2 = np.vstack((v[c].reshape(-1, 1), np.array([1]).reshape(-1, 1)))
+        destroy_c_cost = p1.T.dot(Qsum).dot(p1)
+        destroy_r_cost = p2.T.dot(Qsum).dot(p2)
+        return {'destroy_c_cost': destroy_c_cost, 'destroy_r_cost': destroy_r_cost,
+                'collapse_cost': min([destroy_c_cost, destroy_r_cost]), 'Qsum': Qsum}
+
+    queue = []
+    for k in range(vert_adj.nnz):
+        r, c = vert_adj.row[k], vert_adj.col[k]
+        if r > c:
+            continue
+        heapq.heappush(queue, (collapse_cost(Qv, r, c, mesh.v)['collapse_cost'], (r, c)))
+
+    nverts_total = len(mesh.v)
+    faces = mesh.f.copy()
+    while nverts_total > n_verts_desired:
+        e = heapq.heappop(queue)
+        r, c = e[1]
+        if r == c:
+            continue
+        cost = collapse_cost(Qv, r, c, mesh.v)
+        if cost['collapse_cost'] > e[0]:
+            heapq.heappush(queue, (cost['collapse_cost'], e[1]))
+            continue
+        if cost['destroy_c_cost'] < cost['destroy_r_cost']:
+            to_destroy, to_keep = c, r
+        else:
+            to_destroy, to_keep = r, c
+        np.place(faces, faces == to_destroy, to_keep)
+        which1 = [idx for idx in range(len(queue)) if queue[idx][1][0] == to_destroy]
+        which2 = [idx for idx in range(len(queue)) if queue[idx][1][1] == to_destroy]
+        for k in which1:
+            queue[k] = (queue[k][0], (to_keep, queue[k][1][1]))
+        for k in which2:
+            queue[k] = (queue[k][0], (queue[k][1][0], to_keep))
+        Qv[r, :, :] = cost['Qsum']
+        Qv[c, :, :] = cost['Qsum']
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])].copy()
+        nverts_total = len(np.unique(faces.flatten()))
+    return mesh_sampling._get_sparse_transform(faces, len(mesh.v))
+
+
+REFERENCE = {
+    'vertex_quadrics': reference_vertex_quadrics,
+    'setup_deformation_transfer': reference_setup_deformation_transfer,
+    'qslim_decimator_transformer': reference_qslim_decimator_transformer,
+}
+
+
+def regenerate(mesh, ds_factors, reference):
+    ''' generate_transform_matrices with the reference or the current functions '''
+    current = {name: getattr(mesh_sampling, name) for name in REFERENCE}
+    if reference:
+        for name, fn in REFERENCE.items():
+            setattr(mesh_sampling, name, fn)
+    try:
+        return mesh_sampling.generate_transform_matrices(mesh, ds_factors)
+    finally:
+        for name, fn in current.items():
+            setattr(mesh_sampling, name, fn)
+
+
+def timed(fn, repeat=1):
+    ''' last result and mean time per call in s '''
+    t = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return out, (time.perf_counter() - t) / repeat
+
+
+def same(a, b):
+    return a.shape == b.shape and (a != b).nnz == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark mesh hierarchy regeneration')
+    parser.add_argument('--template_fp', type=str, default='template/template.ply')
+    parser.add_argument('--ds_factors', type=int, nargs='+', default=[2, 2, 2, 2])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    mesh = Mesh(filename=args.template_fp)
+    (M, _, D, U, _, _), t_ref = timed(lambda: regenerate(mesh, args.ds_factors, True))
+    (M_new, _, D_new, U_new, _, _), t_new = timed(lambda: regenerate(mesh, args.ds_factors, False))
+    for level, (d, d_new, u, u_new) in enumerate(zip(D, D_new, U, U_new)):
+        assert same(d, d_new), f'level {level}: down transforms differ'
+        assert np.allclose(u.toarray(), u_new.toarray(), rtol=0, atol=1e-6), f'level {level}: up transforms differ'
+        print(f'level {level} | {d.shape[1]:5d} -> {d.shape[0]:5d} vertices | D identical | U max diff {abs(u - u_new).max():.1e}')
+
+    # the changed steps per level, nearest() of the aabb tree is left out of the up transforms
+    for level, (source, target) in enumerate(zip(M[1:], M[:-1])):
+        q, t_q = timed(lambda: reference_vertex_quadrics(target), args.repeat)
+        q_new, t_q_new = timed(lambda: mesh_sampling.vertex_quadrics(target), args.repeat)
+        assert np.allclose(q, q_new, rtol=1e-12, atol=0), f'level {level}: quadrics differ'
+        nearest = source.compute_aabb_tree().nearest(target.v, True)
+        cached = type('Source', (), {'v': source.v, 'f': source.f, 'compute_aabb_tree': lambda self: self,
+                                     'nearest': lambda self, v, part: nearest})()
+        _, t_u = timed(lambda: reference_setup_deformation_transfer(cached, target), args.repeat)
+        _, t_u_new = timed(lambda: mesh_sampling.setup_deformation_transfer(cached, target), args.repeat)
+        print(f'level {level} | quadrics {t_q * 1e3:7.2f} -> {t_q_new * 1e3:6.2f} ms x{t_q / t_q_new:5.1f}'
+              f' | barycentric solves {t_u * 1e3:7.2f} -> {t_u_new * 1e3:6.2f} ms x{t_u / t_u_new:5.1f}')
+    print(f'generate_transform_matrices | reference {t_ref * 1e3:8.1f} ms | batched {t_new * 1e3:8.1f} ms | x{t_ref / t_new:5.2f}')
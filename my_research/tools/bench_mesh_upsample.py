@@ -0,0 +1,83 @@
+''' Mesh upsampling on CPU, Pool (index_select + scatter_add) vs MeshUpsample (fixed-fanout gather)
+
+Both run the up transforms of template/transform.pkl level by level, like the
+decoder does, with feature dims of MODEL.SPIRAL.OUT_CHANNELS. Forward only and
+forward + backward, outputs and gradients are checked against Pool first.
+
+    python my_research/tools/bench_mesh_upsample.py --batch_sizes 1 8 32 128 256
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import pickle
+import argparse
+import torch
+from my_research.models.modules import Pool
+from conv.meshupsample import MeshUpsample
+
+
+def load_up_transform(transform_fp):
+    ''' up transforms as (row, col, value), as the models pass them to Pool '''
+    with open(transform_fp, 'rb') as f:
+        tmp = pickle.load(f, encoding='latin1')
+    up_transform = []
+    for u in tmp['up_transform']:
+        u = u.tocoo()
+        up_transform.append((torch.LongTensor(u.row), torch.LongTensor(u.col), torch.FloatTensor(u.data)))
+    return up_transform
+
+
+def decode(xs, up_transform):
+    ''' upsample every level, xs[i] is the input of up_transform[i] '''
+    return [Pool(x, trans) for x, trans in zip(xs, up_transform)]
+
+
+def bench(fn, repeat):
+    ''' mean time per call in ms '''
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark mesh upsampling')
+    parser.add_argument('--transform_fp', type=str, default='template/transform.pkl')
+    parser.add_argument('--out_channels', type=int, nargs='+', default=[32, 64, 128, 256])
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 8, 32, 128, 256])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=0, help='torch.set_num_threads, 0: torch default')
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    up_transform = load_up_transform(args.transform_fp)
+    num_vert = [u[0].size(0)//3 for u in up_transform] + [up_transform[-1][0].size(0)//6]
+    upsample = [MeshUpsample(u, n_out, n_in) for u, n_out, n_in in zip(up_transform, num_vert, num_vert[1:])]
+    print(upsample)
+
+    for bs in args.batch_sizes:
+        xs = [torch.randn(bs, n, c, requires_grad=True) for n, c in zip(num_vert[1:], args.out_channels)]
+        outs = {}
+        for name, trans in (('pool', up_transform), ('gather', upsample)):
+            out = decode(xs, trans)
+            sum(o.square().sum() for o in out).backward()
+            outs[name] = out, [x.grad.clone() for x in xs]
+            for x in xs:
+                x.grad = None
+        for a, b in zip(*(sum(outs[name], []) for name in ('pool', 'gather'))):
+            assert torch.allclose(a, b, atol=1e-5), (a - b).abs().max()
+
+        def step(trans):
+            out = decode(xs, trans)
+            sum(o.sum() for o in out).backward()
+
+        results = {}
+        for name, trans in (('pool', up_transform), ('gather', upsample)):
+            with torch.no_grad():
+                results[name + ' fwd'] = bench(lambda: decode(xs, trans), args.repeat)
+            results[name + ' fwd+bwd'] = bench(lambda: step(trans), args.repeat)
+        print(f'batch {bs:4d} | ' + ' | '.join(f'{name} {ms:7.3f} ms' for name, ms in results.items())
+              + f' | fwd x{results["pool fwd"] / results["gather fwd"]:4.2f} | fwd+bwd x{results["pool fwd+bwd"] / results["gather fwd+bwd"]:4.2f}')
@@ -0,0 +1,55 @@
+''' Model construction time with and without the cached spiral indices
+
+spiral_tramsform(cache=False) extracts the spirals of every mesh level again,
+as every model constructor did before; cache=True reads them from the npz
+next to template/transform.pkl (built by the first call). build_model runs
+with the cache, the time without it is the same build plus the difference.
+
+    python my_research/tools/bench_model_build.py --config_file my_research/configs/mobrecon_ds.yml
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import argparse
+import importlib
+from my_research.configs.config import get_cfg
+from my_research.build import build_model
+from utils.read import spiral_tramsform, spiral_cache_path
+
+
+def timed(fn, repeat):
+    ''' mean time per call in s '''
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time model construction')
+    parser.add_argument('--config_file', type=str, default='my_research/configs/mobrecon_ds.yml')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--opts', type=str, nargs='+', default=[])
+    args = parser.parse_args()
+
+    cfg = get_cfg()
+    cfg.merge_from_file(args.config_file)
+    cfg.merge_from_list(args.opts)
+    cfg.freeze()
+    importlib.import_module('my_research.models.{}'.format(cfg.MODEL.NAME.lower()))  # registers the model, like main.py
+
+    # the fp every model constructor uses
+    template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../template'))
+    transform_fp, template_fp = os.path.join(template_dir, 'transform.pkl'), os.path.join(template_dir, 'template.ply')
+    spiral_args = (transform_fp, template_fp, cfg.MODEL.SPIRAL.DOWN_SCALE, cfg.MODEL.SPIRAL.LEN, cfg.MODEL.SPIRAL.DILATION)
+
+    cache_fp = spiral_cache_path(*spiral_args)
+    print(f'cache: {cache_fp} ({"exists" if os.path.exists(cache_fp) else "built by the first call"})')
+    uncached = timed(lambda: spiral_tramsform(*spiral_args, cache=False), args.repeat)
+    spiral_tramsform(*spiral_args)
+    cached = timed(lambda: spiral_tramsform(*spiral_args), args.repeat)
+    build = timed(lambda: build_model(cfg), args.repeat)
+
+    print(f'spiral_tramsform | uncached {uncached * 1e3:8.1f} ms | cached {cached * 1e3:8.1f} ms | x{uncached / cached:6.1f}')
+    print(f'{cfg.MODEL.NAME:16s} | before   {(build + uncached - cached) * 1e3:8.1f} ms | after  {build * 1e3:8.1f} ms | x{(build + uncached - cached) / build:6.1f}')
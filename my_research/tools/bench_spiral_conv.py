@@ -0,0 +1,90 @@
+''' SpiralConv / DSConv per decoder layer on CPU, against the previous formulation
+
+The reference forwards below are the former implementations: gather the whole
+(B, N, L*C) spiral, then nn.Linear (SpiralConv) or the depth-wise Conv2d over a
+sqrt(L) x sqrt(L) patch (DSConv). Every layer of Reg2DDecode3D with
+MODEL.SPIRAL.OUT_CHANNELS is checked for equal outputs and gradients first,
+then timed forward only and forward + backward.
+
+    python my_research/tools/bench_spiral_conv.py --conv DSConv --batch_sizes 1 32 128
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import argparse
+import torch
+from conv import SpiralConv, DSConv
+
+
+def reference_spiral_conv(conv, x):
+    n_nodes, _ = conv.indices.size()
+    x = torch.index_select(x, 1, conv.indices.reshape(-1))
+    return conv.layer(x.view(x.size(0), n_nodes, -1))
+
+
+def reference_dsconv(conv, x):
+    n_nodes, _ = conv.indices.size()
+    bs, k = x.size(0), int(conv.seq_length ** 0.5)
+    x = torch.index_select(x, 1, conv.indices.view(-1))
+    x = x.view(bs * n_nodes, conv.seq_length, -1).transpose(1, 2)
+    x = x.reshape(x.size(0), x.size(1), k, k)
+    x = conv.spatial_layer(x).view(bs, n_nodes, -1)
+    return conv.channel_layer(x)
+
+
+def decoder_layers(num_vert, out_channels):
+    ''' (N, in, out) of the SpiralDeblocks and the head of Reg2DDecode3D, up transforms keep N_in == N '''
+    layers = []
+    for idx in range(len(out_channels)):
+        in_channels = out_channels[-idx - 1] if idx == 0 else out_channels[-idx]
+        layers.append((num_vert[-idx - 2], in_channels, out_channels[-idx - 1]))
+    return layers + [(num_vert[0], out_channels[0], 3)]
+
+
+def bench(fn, repeat):
+    ''' mean time per call in ms '''
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark spiral convolutions')
+    parser.add_argument('--conv', type=str, choices=['SpiralConv', 'DSConv'], default='DSConv')
+    parser.add_argument('--num_vert', type=int, nargs='+', default=[778, 389, 195, 98, 49])
+    parser.add_argument('--out_channels', type=int, nargs='+', default=[32, 64, 128, 256])
+    parser.add_argument('--seq_length', type=int, default=9)
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 32, 128])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    conv_cls, reference = {'SpiralConv': (SpiralConv, reference_spiral_conv), 'DSConv': (DSConv, reference_dsconv)}[args.conv]
+
+    torch.manual_seed(0)
+    for n, c_in, c_out in decoder_layers(args.num_vert, args.out_channels):
+        conv = conv_cls(c_in, c_out, torch.randint(0, n, (n, args.seq_length)))
+        for bs in args.batch_sizes:
+            x = torch.randn(bs, n, c_in, requires_grad=True)
+            grad_out = torch.randn(bs, n, c_out)
+            grads = []
+            for fn in (reference, conv_cls.forward):
+                x.grad = None
+                conv.zero_grad(set_to_none=True)
+                out = fn(conv, x)
+                out.backward(grad_out)
+                grads.append([out.detach()] + [p.grad.clone() for p in (x, *conv.parameters())])
+            for a, b in zip(*grads):
+                assert (a - b).abs().max() <= 1e-4 * a.abs().max(), (conv, (a - b).abs().max())
+
+            def step(fn):
+                fn(conv, x).sum().backward()
+
+            results = {}
+            for name, fn in (('ref', reference), ('new', conv_cls.forward)):
+                with torch.no_grad():
+                    results[name + ' fwd'] = bench(lambda: fn(conv, x), args.repeat)
+                results[name + ' fwd+bwd'] = bench(lambda: step(fn), args.repeat)
+            print(f'{conv} N {n:4d} batch {bs:4d} | ' + ' | '.join(f'{name} {ms:8.3f} ms' for name, ms in results.items())
+                  + f' | fwd x{results["ref fwd"] / results["new fwd"]:4.2f} | fwd+bwd x{results["ref fwd+bwd"] / results["new fwd+bwd"]:4.2f}')
@@ -0,0 +1,109 @@
+''' Spiral extraction, ring walking per vertex vs all spirals grown together
+
+reference_extract_spirals is the former utils/generate_spiral_seq.py: for every
+vertex, rings are walked with mesh.vv and list membership tests. The hand
+template (778 vertices) and its 1-to-4 midpoint subdivisions (3k / 12k
+vertices) are checked for identical spirals first, then timed.
+
+    python my_research/tools/bench_spiral_seq.py --seq_length 9 --dilation 1 --subdivide 2
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import time
+import argparse
+import numpy as np
+import openmesh as om
+from sklearn.neighbors import KDTree
+from utils.generate_spiral_seq import extract_spirals
+
+
+def _reference_next_ring(mesh, last_ring, other):
+    res = []
+
+    def is_new_vertex(idx):
+        return (idx not in last_ring and idx not in other and idx not in res)
+
+    for vh1 in last_ring:
+        vh1 = om.VertexHandle(vh1)
+        after_last_ring = False
+        for vh2 in mesh.vv(vh1):
+            if after_last_ring:
+                if is_new_vertex(vh2.idx()):
+                    res.append(vh2.idx())
+            if vh2.idx() in last_ring:
+                after_last_ring = True
+        for vh2 in mesh.vv(vh1):
+            if vh2.idx() in last_ring:
+                break
+            if is_new_vertex(vh2.idx()):
+                res.append(vh2.idx())
+    return res
+
+
+def reference_extract_spirals(mesh, seq_length, dilation=1):
+    spirals = []
+    for vh0 in mesh.vertices():
+        reference_one_ring = []
+        for vh1 in mesh.vv(vh0):
+            reference_one_ring.append(vh1.idx())
+        spiral = [vh0.idx()]
+        one_ring = list(reference_one_ring)
+        last_ring = one_ring
+        next_ring = _reference_next_ring(mesh, last_ring, spiral)
+        spiral.extend(last_ring)
+        while len(spiral) + len(next_ring) < seq_length * dilation:
+            if len(next_ring) == 0:
+                break
+            last_ring = next_ring
+            next_ring = _reference_next_ring(mesh, last_ring, spiral)
+            spiral.extend(last_ring)
+        if len(next_ring) > 0:
+            spiral.extend(next_ring)
+        else:
+            kdt = KDTree(mesh.points(), metric='euclidean')
+            spiral = kdt.query(np.expand_dims(mesh.points()[spiral[0]],
+                                              axis=0),
+                               k=seq_length * dilation,
+                               return_distance=False).tolist()
+            spiral = [item for subspiral in spiral for item in subspiral]
+        spirals.append(spiral[:seq_length * dilation][::dilation])
+    return spirals
+
+
+def subdivide(vertices, faces):
+    ''' 1-to-4 midpoint subdivision, a new vertex on every edge '''
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    edges, edge_id = np.unique(edges, axis=0, return_inverse=True)
+    mid = len(vertices) + edge_id.reshape(3, -1).T  # midpoints of (v0 v1, v1 v2, v2 v0)
+    vertices = np.concatenate([vertices, vertices[edges].mean(1)])
+    v0, v1, v2 = faces.T
+    m01, m12, m20 = mid.T
+    faces = np.concatenate([np.stack(f, 1) for f in ((v0, m01, m20), (v1, m12, m01), (v2, m20, m12), (m01, m12, m20))])
+    return vertices, faces
+
+
+def timed(fn):
+    t = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark spiral extraction')
+    parser.add_argument('--template_fp', type=str, default='template/template.ply')
+    parser.add_argument('--seq_length', type=int, default=9)
+    parser.add_argument('--dilation', type=int, default=1)
+    parser.add_argument('--subdivide', type=int, default=2, help='also run this many subdivisions of the template')
+    args = parser.parse_args()
+
+    mesh = om.read_trimesh(args.template_fp)
+    vertices, faces = mesh.points(), mesh.face_vertex_indices()
+    for level in range(args.subdivide + 1):
+        if level:
+            vertices, faces = subdivide(vertices, faces)
+            mesh = om.TriMesh(vertices, faces)
+        ref, t_ref = timed(lambda: reference_extract_spirals(mesh, args.seq_length, args.dilation))
+        new, t_new = timed(lambda: extract_spirals(mesh, args.seq_length, args.dilation))
+        assert np.array_equal(np.array(ref), new), f'{mesh.n_vertices()} vertices: spirals differ'
+        print(f'{mesh.n_vertices():6d} vertices | reference {t_ref * 1e3:9.1f} ms | bulk {t_new * 1e3:8.1f} ms | x{t_ref / t_new:6.1f} | identical')
@@ -43,6 +43,7 @@ class BaseOptions():
         parser.add_argument('--batch_size', type=int, default=32)
         parser.add_argument('--epochs', type=int, default=38)
         parser.add_argument('--resume', type=str, default='')
+        parser.add_argument('--prefetch', type=int, default=2, help='batches moved to the device ahead of the model, 0: off (cmr)')
 
         # others
         # parser.add_argument('--seed', type=int, default=1)
@@ -194,6 +194,63 @@ class Augmentation(object):
         return self.augment(img)
 
 
+class LUTAugmentation(object):
+    """Augmentation (PhotometricDistort) on uint8 images with lookup tables
+
+    the same random ops, each applied with probability 0.5:
+        brightness + contrast : one 256 entry LUT before and after the HSV round trip
+        saturation + hue      : one 3 channel LUT in HSV_FULL, the round trip is skipped
+                                when neither of them is drawn
+    every step is clipped to [0, 255], the float chain (Augmentation) is never clipped
+
+    img: (H, W, 3) or a window (F, H, W, 3), uint8 or float in [0, 255]
+         (e.g. crops of generate_patch_image), one random draw for the whole {img}
+    return: uint8 image(s) of the same shape
+    """
+    def __init__(self, brightness=32, contrast=(0.5, 1.5), saturation=(0.5, 1.5), hue=18.0):
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+        self.values = np.arange(256, dtype=np.float32)
+
+    def sample(self):
+        """ brightness delta, contrast (before, after) HSV, saturation scale, hue delta in degrees
+            drawn in the order of PhotometricDistort, the same seed draws the same params
+        """
+        delta = random.uniform(-self.brightness, self.brightness) if random.randint(2) else 0.
+        contrast_first = random.randint(2)
+        alpha_pre = random.uniform(*self.contrast) if contrast_first and random.randint(2) else 1.
+        sat = random.uniform(*self.saturation) if random.randint(2) else 1.
+        hue = random.uniform(-self.hue, self.hue) if random.randint(2) else 0.
+        alpha_post = random.uniform(*self.contrast) if not contrast_first and random.randint(2) else 1.
+        return delta, (alpha_pre, alpha_post), sat, hue
+
+    def _lut(self, values):
+        return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+    def __call__(self, img):
+        shape = img.shape
+        img = np.ascontiguousarray(img).reshape(-1, shape[-2], 3)  # a window as one tall image
+        if img.dtype != np.uint8:
+            img = cv2.convertScaleAbs(img)  # rounded and saturated, crops are never negative
+
+        delta, (alpha_pre, alpha_post), sat, hue = self.sample()
+        pre = np.clip((self.values + delta) * alpha_pre, 0, 255)
+        if sat != 1. or hue != 0.:
+            if delta != 0. or alpha_pre != 1.:
+                img = cv2.LUT(img, self._lut(pre))
+            hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV_FULL)  # h: [0, 256) for 360 degrees
+            lut = np.stack([np.rint(self.values + hue * 256 / 360) % 256, self.values * sat, self.values], -1)
+            hsv = cv2.LUT(hsv, self._lut(lut).reshape(256, 1, 3))
+            img = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB_FULL)
+            if alpha_post != 1.:
+                img = cv2.LUT(img, self._lut(self.values * alpha_post))
+        elif delta != 0. or alpha_pre != 1. or alpha_post != 1.:
+            img = cv2.LUT(img, self._lut(np.rint(pre) * alpha_post))  # no HSV step, one LUT for both
+        return img.reshape(shape)
+
+
 def crop_roi(img, bbox, out_sz, padding=(0, 0, 0)):
     '''
     crop to bbox: [x_min, y_min, x_max, y_max] &&
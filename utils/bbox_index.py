@@ -0,0 +1,147 @@
+''' Precomputed hand bounding boxes
+
+Every training sample crops around the bounding rect of the largest contour in
+its hand mask. The rect only depends on the mask file, so it is extracted once
+per dataset into {root}/bbox_index.npz:
+
+    'bbox':    (#frames, 4) int16, [left, top, w, h] of cv2.boundingRect
+    'offsets': (#seq, 8) int64, HanCo only, first frame of (seq_id, cam_id) in 'bbox'
+
+Build:
+    python utils/bbox_index.py --dataset HanCo --root data/HanCo
+    python utils/bbox_index.py --dataset FreiHAND --root data/FreiHAND
+    python utils/bbox_index.py --dataset CompHand --root data/CompHand
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+import cv2
+from utils.vis import cnt_area
+
+__all__ = [
+    'BBoxIndex',
+    'mask_bbox',
+    'square_bbox',
+    'load_bbox_index',
+]
+
+BBOX_INDEX_NAME = 'bbox_index.npz'
+
+
+def mask_bbox(mask):
+    ''' bounding rect [left, top, w, h] of the largest contour in {mask} '''
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = list(contours)
+    contours.sort(key=cnt_area, reverse=True)
+    return cv2.boundingRect(contours[0])
+
+
+def square_bbox(bbox):
+    ''' [left, top, w, h] -> square [left, top, w, h] with the same center '''
+    center = [bbox[0]+bbox[2]*0.5, bbox[1]+bbox[3]*0.5]
+    w, h = bbox[2], bbox[3]
+    return [center[0]-0.5 * max(w, h), center[1]-0.5 * max(w, h), max(w, h), max(w, h)]
+
+
+class BBoxIndex(object):
+    ''' lookup of precomputed mask bboxes
+
+        index[i]                                  -> [left, top, w, h] of frame i
+        index.window(seq_id, cam_id, start, stop) -> F x [left, top, w, h], HanCo only
+    '''
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.bbox = data['bbox']
+            self.offsets = data['offsets'] if 'offsets' in data.files else None
+
+    def __len__(self):
+        return len(self.bbox)
+
+    def __getitem__(self, idx):
+        return [int(v) for v in self.bbox[idx]]
+
+    def window(self, seq_id, cam_id, start, stop):
+        offset = self.offsets[seq_id, cam_id]
+        return self.bbox[offset + start:offset + stop].tolist()
+
+
+def load_bbox_index(root, length=None):
+    ''' BBoxIndex of {root}/bbox_index.npz, None if it is not built yet
+
+        length: expected frame counts, a stale index is ignored
+    '''
+    path = os.path.join(root, BBOX_INDEX_NAME)
+    if not os.path.isfile(path):
+        return None
+    bbox_index = BBoxIndex(path)
+    if length is not None and len(bbox_index) != length:
+        print(f'Ignore {path}: {len(bbox_index)} bboxes, but dataset has {length} frames')
+        return None
+    return bbox_index
+
+
+def _save(root, **arrays):
+    path = os.path.join(root, BBOX_INDEX_NAME)
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    print(f'Saved {len(arrays["bbox"])} bboxes to {path}')
+
+
+def build_hanco_bbox_index(hanco_root):
+    from tqdm import tqdm
+    from utils.hanco_utils import read_mask, load_manifest
+
+    frame_counts = load_manifest(hanco_root)['frame_counts'].astype(np.int64)
+    offsets = (np.cumsum(frame_counts.ravel()) - frame_counts.ravel()).reshape(frame_counts.shape)
+    bbox = np.zeros((frame_counts.sum(), 4), dtype=np.int16)
+    for seq_id in tqdm(range(frame_counts.shape[0])):
+        if not os.path.isdir(os.path.join(hanco_root, 'mask_hand', f'{seq_id:04d}')):
+            continue
+        for cam_id in range(frame_counts.shape[1]):
+            for frame_id in range(frame_counts[seq_id, cam_id]):
+                mask = read_mask(hanco_root, seq_id, cam_id, frame_id)
+                bbox[offsets[seq_id, cam_id] + frame_id] = mask_bbox(mask)
+    _save(hanco_root, bbox=bbox, offsets=offsets)
+
+
+def build_freihand_bbox_index(freihand_root):
+    ''' bboxes of training/mask, shared by all 4 image versions '''
+    from tqdm import tqdm
+    from utils.fh_utils import read_mask_woclip, db_size
+
+    bbox = np.zeros((db_size('training'), 4), dtype=np.int16)
+    for idx in tqdm(range(len(bbox))):
+        bbox[idx] = mask_bbox(read_mask_woclip(idx, freihand_root, 'training'))
+    _save(freihand_root, bbox=bbox)
+
+
+def build_comphand_bbox_index(comphand_root):
+    ''' bboxes of mask256, in the (sorted) order of CompHand.img_list '''
+    from tqdm import tqdm
+    from pathlib import Path
+
+    img_list = sorted(list(Path(comphand_root).glob('**/pic256/**/*.png')))
+    bbox = np.zeros((len(img_list), 4), dtype=np.int16)
+    for idx, img_path in enumerate(tqdm(img_list)):
+        num = int(img_path.parts[-1].split('.')[1])
+        mesh_path = os.path.join(*img_path.parts[:-2], str(num) + '.obj').replace('pic256', 'model_mano')
+        mask_path = os.path.join(mesh_path.replace('obj', 'png').replace('model_mano', 'mask256'))
+        mask = cv2.imread(mask_path)[..., ::-1, 0]
+        bbox[idx] = mask_bbox(np.ascontiguousarray(mask))
+    _save(comphand_root, bbox=bbox)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='extract hand bboxes from masks')
+    parser.add_argument('--dataset', type=str, choices=['HanCo', 'FreiHAND', 'CompHand'], required=True)
+    parser.add_argument('--root', type=str, required=True)
+    args = parser.parse_args()
+
+    {
+        'HanCo': build_hanco_bbox_index,
+        'FreiHAND': build_freihand_bbox_index,
+        'CompHand': build_comphand_bbox_index,
+    }[args.dataset](args.root)
@@ -0,0 +1,224 @@
+''' Deterministic valid/test crops in memory-mapped arrays
+
+Outside of training the crops do not change: augmentation(data_split != 'train')
+uses the base scale, no rotation, no shift, no flip and no colour augmentation.
+Yet every evaluation of a checkpoint decodes and warps every frame again. The
+final crops and targets of an eval split are written once into
+{DATA.EVAL_CROP_CACHE}/{dataset}_{phase}/:
+
+    meta.json       crop settings, data root and target scale the store was built with,
+                    a store of other settings is ignored
+    offsets.npy     (#samples + 1,) int64, frames [offsets[i], offsets[i+1]) of sample i
+    <field>.npy     (#frames, ...) every field of type(dataset).EVAL_CROP_FIELDS
+                    img: (#frames, 3, SIZE, SIZE) uint8, roi_transform(uint8=True)
+
+Single-frame datasets (FreiHAND, Ge) have one frame per sample, HanCo windows
+and test sequences have F. Crops are warped to (SIZE, SIZE), so normalising the
+uint8 crop gives the same float32 image as base_transform.
+
+Build:
+    python utils/eval_crop_cache.py --config_file my_research/configs/mobrecon_ds.yml --phase val --opts DATA.EVAL_CROP_CACHE data/eval_crops
+    python utils/eval_crop_cache.py --config_file my_research/configs/mobrecon_ds.yml --phase test --opts DATA.EVAL_CROP_CACHE data/eval_crops
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import shutil
+import numpy as np
+
+__all__ = [
+    'EvalCropStore',
+    'eval_crop_meta',
+    'load_eval_crop_store',
+    'build_eval_crop_store',
+]
+
+META_NAME = 'meta.json'
+OFFSETS_NAME = 'offsets.npy'
+
+
+def eval_crop_meta(cfg, dataset, aug_cfg):
+    ''' everything the crops and targets of {dataset} depend on
+        aug_cfg: cfg.DATA.<dataset> whose BASE_SCALE crops the eval samples, None if they are not cropped
+        dataset.eval_crop_settings(): the rest, e.g. the data root and the scale of stored targets
+    '''
+    return {
+        'dataset': type(dataset).__name__,
+        'phase': dataset.phase,
+        'eval_crop_fields': list(type(dataset).EVAL_CROP_FIELDS),
+        'settings': dataset.eval_crop_settings(),
+        'length': len(dataset),
+        'frame_counts': getattr(dataset, 'frame_counts', None),
+        'size': cfg.DATA.SIZE,
+        'base_scale': aug_cfg.BASE_SCALE if aug_cfg is not None else None,
+        'reduced_decode': cfg.DATA.REDUCED_DECODE,
+    }
+
+
+def _store_path(root, meta):
+    return os.path.join(root, f'{meta["dataset"]}_{meta["phase"]}')
+
+
+class EvalCropStore(object):
+    ''' store.read(idx) -> {field: ndarray} of sample idx, writable copies
+            window stores: (F, ...) arrays, otherwise the arrays of the single frame
+
+        the arrays are mapped lazily, so every DataLoader worker maps the files by itself
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_NAME), 'r') as f:
+            self.meta = json.load(f)
+        self.fields = list(self.meta['fields'])
+        self.window = self.meta['frame_counts'] is not None
+        self._arrays = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {name: np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+                            for name in self.fields + ['offsets']}
+        return self._arrays
+
+    def __len__(self):
+        return len(self.arrays['offsets']) - 1
+
+    def read(self, idx, uint8=False, mean=0.5, std=0.5):
+        ''' fields of sample {idx}, img is normalised like base_transform unless {uint8} '''
+        start, stop = self.arrays['offsets'][idx:idx + 2]
+        sample = {}
+        for name in self.fields:
+            sample[name] = np.array(self.arrays[name][start:stop] if self.window else self.arrays[name][start])
+        if not uint8:
+            img = sample['img'].astype(np.float32) / 255
+            img -= mean
+            img /= std
+            sample['img'] = img
+        return sample
+
+
+def load_eval_crop_store(cfg, dataset, aug_cfg, fields):
+    ''' EvalCropStore of {dataset}, None if DATA.EVAL_CROP_CACHE is '', it is not built yet
+        or it is built with other crop settings
+
+        fields: every field the dataset reads from the store, a store without one of them is ignored
+    '''
+    if not cfg.DATA.EVAL_CROP_CACHE:
+        return None
+    meta = eval_crop_meta(cfg, dataset, aug_cfg)
+    path = _store_path(cfg.DATA.EVAL_CROP_CACHE, meta)
+    if not os.path.isfile(os.path.join(path, META_NAME)):
+        return None
+    store = EvalCropStore(path)
+    built = {k: v for k, v in store.meta.items() if k != 'fields'}
+    if built != meta:
+        print(f'Ignore {path}: built with {built}, but dataset has {meta}')
+        return None
+    missing = [name for name in fields if name not in store.fields]
+    if missing:
+        print(f'Ignore {path}: {missing} not stored, rebuild it with DATA.RETURN_MASK for masks')
+        return None
+    return store
+
+
+class _RawField(object):
+    ''' (#frames, *shape) array written sample by sample, turned into a .npy file once #frames is known
+        window: samples are (F, *shape) with any F, otherwise one (*shape) frame
+    '''
+    def __init__(self, path, arr, window):
+        self.path = path
+        self.window = window
+        self.shape = arr.shape[1:] if window else arr.shape
+        self.dtype = arr.dtype
+        self.frames = 0
+        self.file = open(path + '.raw', 'wb')
+
+    def write(self, arr):
+        shape = arr.shape[1:] if self.window else arr.shape
+        assert shape == self.shape and arr.dtype == self.dtype, \
+            f'{self.path}: expected {self.dtype}{self.shape} frames, got {arr.dtype}{shape}'
+        self.file.write(np.ascontiguousarray(arr).tobytes())
+        self.frames += len(arr) if self.window else 1
+
+    def close(self):
+        self.file.close()
+        with open(self.path + '.npy', 'wb') as f, open(self.path + '.raw', 'rb') as raw:
+            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(self.dtype),
+                                                     'fortran_order': False, 'shape': (self.frames,) + self.shape})
+            shutil.copyfileobj(raw, f, 16 * 2**20)
+        os.remove(self.path + '.raw')
+
+
+def build_eval_crop_store(root, meta, samples, fields):
+    ''' write {samples} (dicts of ndarrays / tensors, in dataset order) into the store of {meta} under {root}
+        fields: fields of a sample to store, None values are skipped
+    '''
+    from tqdm import tqdm
+    path = _store_path(root, meta)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    window = meta['frame_counts'] is not None
+
+    writers, offsets = {}, [0]
+    for sample in tqdm(samples, total=meta['length']):
+        frames = 1
+        for name in fields:
+            arr = sample.get(name)
+            if arr is None:
+                continue
+            arr = arr.numpy() if hasattr(arr, 'numpy') else np.asarray(arr)
+            if name not in writers:
+                writers[name] = _RawField(os.path.join(tmp_path, name), arr, window)
+            writers[name].write(arr)
+            frames = len(arr) if window else 1
+        offsets.append(offsets[-1] + frames)
+    assert len(offsets) - 1 == meta['length'], f'{len(offsets) - 1} samples, but dataset has {meta["length"]}'
+
+    for writer in writers.values():
+        writer.close()
+    np.save(os.path.join(tmp_path, OFFSETS_NAME), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_path, META_NAME), 'w') as f:
+        json.dump(dict(meta, fields=sorted(writers)), f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)  # store is visible only when complete
+    print(f'Saved {meta["length"]} samples, {offsets[-1]} frames of {sorted(writers)} to {path}')
+
+
+if __name__ == '__main__':
+    import argparse
+    import inspect
+    from torch.utils.data import DataLoader
+    from my_research.configs.config import get_cfg
+    from my_research.build import DATA_REGISTRY
+
+    parser = argparse.ArgumentParser(description='write the deterministic crops of an eval split into memory-mapped arrays')
+    parser.add_argument('--config_file', type=str, default='')
+    parser.add_argument('--phase', type=str, choices=['val', 'test'], required=True)
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--opts', type=str, nargs='+', default=[])
+    args = parser.parse_args()
+
+    cfg = get_cfg()
+    if args.config_file:
+        cfg.merge_from_file(args.config_file)
+    cfg.merge_from_list(args.opts)
+    root = cfg.DATA.EVAL_CROP_CACHE
+    assert root, 'set DATA.EVAL_CROP_CACHE to the directory of the stores'
+    # build from the files, as uint8 crops
+    cfg.merge_from_list(['DATA.EVAL_CROP_CACHE', '', 'DATA.UINT8_IMG', True])
+    cfg.freeze()
+
+    dataset_cls = DATA_REGISTRY.get(cfg[args.phase.upper()]['DATASET'])
+    kwargs = {'frame_counts': cfg.DATA.FRAME_COUNTS} if 'frame_counts' in inspect.signature(dataset_cls).parameters else {}
+    dataset = dataset_cls(cfg, args.phase, **kwargs)
+    meta = eval_crop_meta(cfg, dataset, dataset.eval_aug_cfg())
+    loader = DataLoader(dataset, batch_size=None, shuffle=False, num_workers=args.num_workers)
+    build_eval_crop_store(root, meta, loader, dataset.EVAL_CROP_FIELDS)
@@ -5,6 +5,7 @@ import os
 import time
 import skimage.io as io
 from utils.read import read_mesh as read_mesh_
+from utils.img_reader import imread
 
 
 """ General util functions. """
@@ -20,11 +21,13 @@ def json_load(p):
     return d
 
 def projectPoints(xyz, K):
-    """ Project 3D coordinates into image space. """
-    xyz = np.array(xyz)
-    K = np.array(K)
-    uv = np.matmul(K, xyz.T).T
-    return uv[:, :2] / uv[:, -1:]
+    """ Project 3D coordinates into image space.
+        xyz (N, 3) with K (3, 3), or a batch: xyz (F, N, 3) with K (F, 3, 3)
+    """
+    xyz = np.asarray(xyz)
+    K = np.asarray(K)
+    uv = np.matmul(xyz, np.swapaxes(K, -1, -2))
+    return uv[..., :2] / uv[..., -1:]
 
 
 """ Draw functions. """
@@ -178,6 +181,114 @@ def load_db_annotation(base_path, writer=None, set_name=None):
         raise Exception('set_name error: ' + set_name)
 
 
+ANNOT_CACHE_VERSION = 1
+ANNOT_CACHE_FIELDS = {
+    'training': ['K', 'mano', 'xyz'],
+    'evaluation': ['K', 'scale'],
+}
+
+
+def _annot_cache_set_name(set_name):
+    if set_name in ['training', 'train']:
+        return 'training'
+    elif set_name in ['evaluation', 'eval', 'val', 'test']:
+        return 'evaluation'
+    raise Exception('set_name error: ' + set_name)
+
+
+def _annot_cache_sources(base_path, set_name):
+    return {field: os.path.join(base_path, '%s_%s.json' % (set_name, field))
+            for field in ANNOT_CACHE_FIELDS[set_name]}
+
+
+def build_annot_cache(base_path, set_name):
+    """ Parse {set_name}_*.json once and save them as .npy files in {base_path}/annot_cache/{set_name}. """
+    set_name = _annot_cache_set_name(set_name)
+    cache_dir = os.path.join(base_path, 'annot_cache', set_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta = {'version': ANNOT_CACHE_VERSION, 'mtime': {}}
+    length = None
+    for field, json_path in _annot_cache_sources(base_path, set_name).items():
+        value = np.array(json_load(json_path))
+        assert length is None or len(value) == length, 'Size mismatch.'
+        length = len(value)
+        tmp_path = os.path.join(cache_dir, field + '.tmp.npy')
+        np.save(tmp_path, value)
+        os.replace(tmp_path, os.path.join(cache_dir, field + '.npy'))
+        meta['mtime'][field] = os.path.getmtime(json_path)
+    # meta.json is written last, a cache without it is rebuilt
+    with open(os.path.join(cache_dir, 'meta.json'), 'w') as fo:
+        json.dump(meta, fo)
+
+
+def _annot_cache_valid(base_path, set_name):
+    """ The cache is valid if it has the current version and every json it came from is unchanged. """
+    meta_path = os.path.join(base_path, 'annot_cache', set_name, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as fi:
+        meta = json.load(fi)
+    if meta.get('version') != ANNOT_CACHE_VERSION:
+        return False
+    for field, json_path in _annot_cache_sources(base_path, set_name).items():
+        if field not in meta['mtime']:
+            return False
+        if os.path.exists(json_path) and os.path.getmtime(json_path) != meta['mtime'][field]:
+            return False
+    return True
+
+
+class DBAnnotation(object):
+    """ Memory-mapped FreiHAND annotations, a lazy replacement of tuple(load_db_annotation(...)) * versions.
+
+        db[idx] -> (K, mano, xyz) for training, (K, scale) for evaluation, of sample idx % one_version_len
+        arrays are opened lazily, so DataLoader workers map the files by themselves
+    """
+    def __init__(self, cache_dir, fields, versions=1):
+        self.cache_dir = cache_dir
+        self.fields = fields
+        self.versions = versions
+        self._arrays = None
+        self.one_version_len = len(self.arrays[0])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = [np.load(os.path.join(self.cache_dir, field + '.npy'), mmap_mode='r') for field in self.fields]
+        return self._arrays
+
+    def __len__(self):
+        return self.one_version_len * self.versions
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= len(self):
+            raise IndexError('index %d out of range' % idx)
+        idx = idx % self.one_version_len
+        return tuple(array[idx] for array in self.arrays)
+
+
+def load_db_annotation_cache(base_path, writer=None, set_name=None, versions=1):
+    """ Same annotations as load_db_annotation, from a .npy cache that is (re)built on demand.
+
+        versions: 4 for the training set to cover all image versions, see sample_version
+    """
+    set_name = _annot_cache_set_name(set_name)
+    t = time.time()
+    if not _annot_cache_valid(base_path, set_name):
+        if writer is not None:
+            writer.print_str('Building FreiHAND %s annotation cache ...' % set_name)
+        build_annot_cache(base_path, set_name)
+    db = DBAnnotation(os.path.join(base_path, 'annot_cache', set_name), ANNOT_CACHE_FIELDS[set_name], versions)
+    if writer is not None:
+        writer.print_str('Loading of %d %s samples done in %.2f seconds' % (db.one_version_len, set_name, time.time() - t))
+    return db
+
+
 class sample_version:
     gs = 'gs'  # green screen
     hom = 'hom'  # homogenized
@@ -202,7 +313,8 @@ class sample_version:
         return id + cls.db_size*cls.valid_options().index(version)
 
 
-def read_img(idx, base_path, set_name, version=None):
+def read_img(idx, base_path, set_name, version=None, max_reduce=None):
+    """ max_reduce: if given, return (img, reduce) of a reduced-resolution decode, see utils/img_reader.py """
     if version is None:
         version = sample_version.gs
 
@@ -214,15 +326,25 @@ def read_img(idx, base_path, set_name, version=None):
         img_rgb_path = os.path.join(base_path, set_name, 'rgb2', '%08d.jpg' % idx)
 
     _assert_exist(img_rgb_path)
+    if max_reduce is not None:
+        return imread(img_rgb_path, max_reduce=max_reduce)
     return io.imread(img_rgb_path)
 
 
-def read_img_abs(idx, base_path, set_name):
+def img_abs_path(idx, base_path, set_name):
     img_rgb_path = os.path.join(base_path, set_name, 'rgb', '%08d.jpg' % idx)
     if not os.path.exists(img_rgb_path):
         img_rgb_path = os.path.join(base_path, set_name, 'rgb2', '%08d.jpg' % idx)
+    return img_rgb_path
+
+
+def read_img_abs(idx, base_path, set_name, max_reduce=None):
+    """ max_reduce: if given, return (img, reduce) of a reduced-resolution decode, see utils/img_reader.py """
+    img_rgb_path = img_abs_path(idx, base_path, set_name)
 
     _assert_exist(img_rgb_path)
+    if max_reduce is not None:
+        return imread(img_rgb_path, max_reduce=max_reduce)
     return io.imread(img_rgb_path)
 
 
@@ -233,9 +355,12 @@ def read_msk(idx, base_path, set_name):
     return (io.imread(mask_path)[:, :, 0] > 240).astype(np.uint8)
 
 
+def mask_abs_path(idx, base_path, set_name):
+    return os.path.join(base_path, set_name, 'mask', '%08d.jpg' % idx)
+
+
 def read_mask_woclip(idx, base_path, set_name):
-    mask_path = os.path.join(base_path, set_name, 'mask',
-                             '%08d.jpg' % idx)
+    mask_path = mask_abs_path(idx, base_path, set_name)
     _assert_exist(mask_path)
     return io.imread(mask_path)[:, :, 0]
 
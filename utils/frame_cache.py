@@ -0,0 +1,149 @@
+''' Shared-memory cache of decoded frames
+
+Random windows of the same (folder, seq_id, cam_id) overlap heavily within an
+epoch, but every window is decoded again by whichever DataLoader worker gets
+it. SharedFrameCache keeps decoded frames in a shared-memory arena created by
+the main process, so every worker sees the frames decoded by the others.
+
+    arena: #slots x slot_bytes uint8, one frame per slot
+    meta : keys (#slots,) int64, -1 if empty
+           ticks (#slots,) int64, last access, the smallest one is evicted (LRU)
+           shapes (#slots, 3) int32, [H, W, C], C == 0 for (H, W) frames
+           counters [tick, hits, misses] int64
+
+Every access holds a single lock, frames are decoded outside of it.
+'''
+import os
+import atexit
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+__all__ = [
+    'SharedFrameCache',
+]
+
+TICK, HITS, MISSES = 0, 1, 2
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # python >= 3.13
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameCache(object):
+    ''' LRU cache of decoded uint8 frames, keyed by (folder, seq_id, cam_id, frame_id)
+
+        budget_bytes: size of the arena
+        slot_bytes  : bytes of the largest frame, larger frames are not cached
+        folders     : every folder name used in keys
+
+        create it in the main process before the DataLoader starts its workers
+    '''
+    def __init__(self, budget_bytes: int, slot_bytes: int, folders):
+        self.folders = {folder: i for i, folder in enumerate(folders)}
+        self.slot_bytes = int(slot_bytes)
+        self.num_slots = max(int(budget_bytes // self.slot_bytes), 1)
+        self.lock = mp.get_context('spawn').Lock()  # usable by forked and spawned workers
+
+        self._arena = shared_memory.SharedMemory(create=True, size=self.num_slots * self.slot_bytes)
+        self._meta = shared_memory.SharedMemory(create=True, size=self._meta_bytes())
+        self._bind()
+        self.keys[:] = -1
+        self.ticks[:] = 0
+        self.shapes[:] = 0
+        self.counters[:] = 0
+
+        self._owner = os.getpid()
+        atexit.register(self.close)
+
+    def _meta_bytes(self):
+        return self.num_slots * (8 + 8 + 3 * 4) + 3 * 8
+
+    def _bind(self):
+        n = self.num_slots
+        self.arena = np.ndarray((n, self.slot_bytes), dtype=np.uint8, buffer=self._arena.buf)
+        self.keys = np.ndarray((n,), dtype=np.int64, buffer=self._meta.buf, offset=0)
+        self.ticks = np.ndarray((n,), dtype=np.int64, buffer=self._meta.buf, offset=n * 8)
+        self.shapes = np.ndarray((n, 3), dtype=np.int32, buffer=self._meta.buf, offset=n * 16)
+        self.counters = np.ndarray((3,), dtype=np.int64, buffer=self._meta.buf, offset=n * 28)
+
+    def __getstate__(self):
+        # spawned workers attach to the same blocks by name
+        return {
+            'folders': self.folders,
+            'slot_bytes': self.slot_bytes,
+            'num_slots': self.num_slots,
+            'lock': self.lock,
+            'names': (self._arena.name, self._meta.name),
+        }
+
+    def __setstate__(self, state):
+        arena_name, meta_name = state.pop('names')
+        self.__dict__.update(state)
+        self._arena, self._meta = _attach(arena_name), _attach(meta_name)
+        self._owner = None
+        self._bind()
+
+    def _code(self, key):
+        folder, seq_id, cam_id, frame_id = key
+        return (self.folders[folder] << 56) | (int(seq_id) << 32) | (int(cam_id) << 24) | int(frame_id)
+
+    def get(self, key):
+        ''' copy of the cached frame of {key}, None if it is not cached '''
+        code = self._code(key)
+        with self.lock:
+            slots = np.flatnonzero(self.keys == code)
+            if len(slots) == 0:
+                self.counters[MISSES] += 1
+                return None
+            slot = slots[0]
+            self.counters[TICK] += 1
+            self.counters[HITS] += 1
+            self.ticks[slot] = self.counters[TICK]
+            shape = tuple(int(s) for s in self.shapes[slot] if s > 0)
+            return self.arena[slot, :int(np.prod(shape))].reshape(shape).copy()
+
+    def put(self, key, frame: np.ndarray):
+        ''' cache {frame} as {key}, the least recently used frame is evicted if the arena is full '''
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes or frame.ndim not in (2, 3):
+            return
+        code = self._code(key)
+        with self.lock:
+            if (self.keys == code).any():
+                return  # decoded by another worker in the meantime
+            empty = np.flatnonzero(self.keys == -1)
+            slot = empty[0] if len(empty) > 0 else int(np.argmin(self.ticks))
+            self.counters[TICK] += 1
+            self.keys[slot] = code
+            self.ticks[slot] = self.counters[TICK]
+            self.shapes[slot] = frame.shape if frame.ndim == 3 else (*frame.shape, 0)
+            self.arena[slot, :frame.nbytes] = np.ascontiguousarray(frame).reshape(-1)
+
+    def stats(self):
+        ''' hits, misses, hit_rate and used slots since creation '''
+        with self.lock:
+            hits, misses = int(self.counters[HITS]), int(self.counters[MISSES])
+            used = int((self.keys != -1).sum())
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / max(hits + misses, 1),
+            'used_slots': used,
+            'num_slots': self.num_slots,
+            'used_mb': used * self.slot_bytes / 2**20,
+        }
+
+    def close(self):
+        ''' release the blocks, the creating process also removes them '''
+        if self._arena is None:
+            return
+        self.arena = self.keys = self.ticks = self.shapes = self.counters = None
+        self._arena.close()
+        self._meta.close()
+        if self._owner == os.getpid():
+            self._arena.unlink()
+            self._meta.unlink()
+        self._arena = self._meta = None
@@ -2,56 +2,80 @@ import openmesh as om
 from sklearn.neighbors import KDTree
 import numpy as np
 
+# The spirals of all vertices are grown together, one ring per step. A ring
+# entry of spiral s is a pair (s, vertex) and is looked up as the key
+# s * #vertices + vertex, so membership in the last ring or in the spiral so far
+# is one np.isin over all spirals instead of list scans per vertex.
 
-def _next_ring(mesh, last_ring, other):
-    res = []
-
-    def is_new_vertex(idx):
-        return (idx not in last_ring and idx not in other and idx not in res)
-
-    for vh1 in last_ring:
-        vh1 = om.VertexHandle(vh1)
-        after_last_ring = False
-        for vh2 in mesh.vv(vh1):
-            if after_last_ring:
-                if is_new_vertex(vh2.idx()):
-                    res.append(vh2.idx())
-            if vh2.idx() in last_ring:
-                after_last_ring = True
-        for vh2 in mesh.vv(vh1):
-            if vh2.idx() in last_ring:
-                break
-            if is_new_vertex(vh2.idx()):
-                res.append(vh2.idx())
-    return res
+
+def _next_ring(nbr, deg, ring_sid, ring_vid, visited):
+    ''' next rings of every spiral in (ring_sid, ring_vid), entries grouped by spiral in ring order
+
+        per ring vertex, its neighbours in circulator order are read starting after the first one
+        that is in the last ring (from the first neighbour if none is), the new ones are kept in order
+        visited: sorted keys of the spiral so far and the last ring
+    '''
+    n = len(nbr)
+    nb = nbr[ring_vid]  # R x D, -1 padded
+    d = deg[ring_vid][:, None]
+    valid = nb >= 0
+    in_last = valid & np.isin(ring_sid[:, None] * n + nb, ring_sid * n + ring_vid)
+    start = np.where(in_last.any(1), in_last.argmax(1), -1)[:, None]
+    slot = np.arange(nb.shape[1])[None]
+    cand = np.take_along_axis(nb, (start + 1 + slot) % np.maximum(d, 1), 1)
+    keep = slot < d
+    cand_sid = np.broadcast_to(ring_sid[:, None], cand.shape)[keep]
+    cand = cand[keep]
+    keys = cand_sid * n + cand
+    new = ~np.isin(keys, visited)
+    cand_sid, keys = cand_sid[new], keys[new]
+    first = np.sort(np.unique(keys, return_index=True)[1])  # first occurrence, in order
+    return cand_sid[first], keys[first] - cand_sid[first] * n
 
 
 def extract_spirals(mesh, seq_length, dilation=1):
     # output: spirals.size() = [N, seq_length]
-    spirals = []
-    for vh0 in mesh.vertices():
-        reference_one_ring = []
-        for vh1 in mesh.vv(vh0):
-            reference_one_ring.append(vh1.idx())
-        spiral = [vh0.idx()]
-        one_ring = list(reference_one_ring)
-        last_ring = one_ring
-        next_ring = _next_ring(mesh, last_ring, spiral)
-        spiral.extend(last_ring)
-        while len(spiral) + len(next_ring) < seq_length * dilation:
-            if len(next_ring) == 0:
-                break
-            last_ring = next_ring
-            next_ring = _next_ring(mesh, last_ring, spiral)
-            spiral.extend(last_ring)
-        if len(next_ring) > 0:
-            spiral.extend(next_ring)
-        else:
-            kdt = KDTree(mesh.points(), metric='euclidean')
-            spiral = kdt.query(np.expand_dims(mesh.points()[spiral[0]],
-                                              axis=0),
-                               k=seq_length * dilation,
-                               return_distance=False).tolist()
-            spiral = [item for subspiral in spiral for item in subspiral]
-        spirals.append(spiral[:seq_length * dilation][::dilation])
-    return spirals
+    n_vert = mesh.n_vertices()
+    length = seq_length * dilation
+    nbr = mesh.vertex_vertex_indices().astype(np.int64)  # neighbours in circulator order, like mesh.vv
+    deg = (nbr >= 0).sum(1)
+
+    # spiral = [v0] + one ring, the next ring is computed before the one ring is appended
+    sid = np.arange(n_vert)
+    ring_sid, ring_vid = np.repeat(sid, deg), nbr[nbr >= 0]
+    visited = np.sort(np.concatenate([sid * n_vert + sid, ring_sid * n_vert + ring_vid]))
+    parts = [(sid, sid), (ring_sid, ring_vid)]
+    spiral_len = 1 + deg
+    next_sid, next_vid = _next_ring(nbr, deg, ring_sid, ring_vid, visited)
+    while True:
+        next_len = np.bincount(next_sid, minlength=n_vert)
+        grow = (spiral_len + next_len < length) & (next_len > 0)
+        if not grow.any():
+            break
+        # the next ring becomes the last ring of the growing spirals
+        m = grow[next_sid]
+        ring_sid, ring_vid = next_sid[m], next_vid[m]
+        visited = np.union1d(visited, ring_sid * n_vert + ring_vid)
+        parts.append((ring_sid, ring_vid))
+        spiral_len += np.bincount(ring_sid, minlength=n_vert)
+        grown_sid, grown_vid = _next_ring(nbr, deg, ring_sid, ring_vid, visited)
+        next_sid = np.concatenate([next_sid[~m], grown_sid])
+        next_vid = np.concatenate([next_vid[~m], grown_vid])
+    parts.append((next_sid, next_vid))
+
+    # concatenate the parts of every spiral in order and cut them to length
+    part_sid = np.concatenate([p[0] for p in parts])
+    part_vid = np.concatenate([p[1] for p in parts])
+    order = np.argsort(part_sid, kind='stable')
+    part_sid, part_vid = part_sid[order], part_vid[order]
+    pos = np.arange(len(part_sid)) - np.searchsorted(part_sid, part_sid)
+    spirals = np.zeros((n_vert, length), dtype=np.int64)
+    m = pos < length
+    spirals[part_sid[m], pos[m]] = part_vid[m]
+
+    # no next ring left: the spiral is the nearest vertices instead
+    closed = np.bincount(next_sid, minlength=n_vert) == 0
+    if closed.any():
+        kdt = KDTree(mesh.points(), metric='euclidean')
+        spirals[closed] = kdt.query(mesh.points()[closed], k=length, return_distance=False)
+    return np.ascontiguousarray(spirals[:, ::dilation])
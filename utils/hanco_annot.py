@@ -0,0 +1,133 @@
+''' Consolidated HanCo annotations
+
+numpy_seq/{seq_id:04d}/cam{cam_id}.npz of every (seq, cam) concatenated into a
+single float32 array, one row per frame, memory-mapped once:
+
+HanCo/
+    numpy_seq_store.npy     | (#frames, 778*3 + 21*3 + 1*3 + 3*3) float32
+    numpy_seq_index.npz     | 'offsets': (#seq, 8) int64, first row of (seq_id, cam_id), -1 if missing
+                            | 'counts':  (#seq, 8) int64, frames of (seq_id, cam_id)
+
+A row is [verts | joint | global_t | intrinsic], so every field of a window is a
+reshaped view of the mapped rows, no decompression and no copy.
+
+Build:
+    python utils/hanco_annot.py --hanco_root data/HanCo
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from typing import Dict
+import numpy as np
+
+__all__ = [
+    'HanCoAnnotStore',
+    'load_annot_store',
+    'build_annot_store',
+]
+
+ANNOT_FIELDS = [
+    ('verts', (778, 3)),
+    ('joint', (21, 3)),
+    ('global_t', (1, 3)),
+    ('intrinsic', (3, 3)),
+]
+ANNOT_WIDTH = sum(int(np.prod(shape)) for _, shape in ANNOT_FIELDS)
+STORE_NAME = 'numpy_seq_store.npy'
+INDEX_NAME = 'numpy_seq_index.npz'
+
+
+class HanCoAnnotStore(object):
+    ''' memory-mapped numpy_seq annotations
+
+        store.read(seq_id, cam_id) has the same keys and shapes as
+        utils.hanco_utils.read_annot, every value is a read-only float32 view
+    '''
+    def __init__(self, hanco_root: str):
+        self.store_path = os.path.join(hanco_root, STORE_NAME)
+        with np.load(os.path.join(hanco_root, INDEX_NAME)) as index:
+            self.offsets, self.counts = index['offsets'], index['counts']
+        self._store = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_store'] = None  # re-mapped in each worker
+        return state
+
+    @property
+    def store(self) -> np.ndarray:
+        if self._store is None:
+            self._store = np.load(self.store_path, mmap_mode='r')
+        return self._store
+
+    def __len__(self):
+        return self.store.shape[0]
+
+    def read(self, seq_id: int, cam_id: int, start: int = 0, stop: int = None) -> Dict[str, np.ndarray]:
+        ''' annotations of frames [start, stop) in (seq_id, cam_id), default: all frames '''
+        offset = self.offsets[seq_id, cam_id]
+        assert offset >= 0, f'No annotations: seq {seq_id}, cam {cam_id}'
+        if stop is None:
+            stop = self.counts[seq_id, cam_id]
+        rows = self.store[offset + start:offset + stop]
+
+        annots, col = {}, 0
+        for key, shape in ANNOT_FIELDS:
+            width = int(np.prod(shape))
+            annots[key] = rows[:, col:col + width].reshape(len(rows), *shape)
+            col += width
+        return annots
+
+
+def load_annot_store(hanco_root: str):
+    ''' HanCoAnnotStore of {hanco_root}, None if it is not built yet '''
+    if not os.path.isfile(os.path.join(hanco_root, STORE_NAME)):
+        return None
+    return HanCoAnnotStore(hanco_root)
+
+
+def build_annot_store(hanco_root: str):
+    ''' pack numpy_seq/*/cam*.npz into {hanco_root}/numpy_seq_store.npy '''
+    from tqdm import tqdm
+    from utils.hanco_utils import read_annot, load_manifest
+
+    frame_counts = load_manifest(hanco_root)['frame_counts'].astype(np.int64)
+    has_annot = np.zeros(frame_counts.shape, dtype=bool)
+    for seq_id in range(frame_counts.shape[0]):
+        for cam_id in range(frame_counts.shape[1]):
+            has_annot[seq_id, cam_id] = frame_counts[seq_id, cam_id] > 0 and os.path.exists(
+                os.path.join(hanco_root, 'numpy_seq', f'{seq_id:04d}', f'cam{cam_id}.npz'))
+    counts = np.where(has_annot, frame_counts, 0)
+    row_counts = counts.ravel()
+    offsets = np.where(has_annot.ravel(), np.cumsum(row_counts) - row_counts, -1).reshape(frame_counts.shape)
+
+    store_path = os.path.join(hanco_root, STORE_NAME)
+    tmp_path = store_path + '.tmp'
+    store = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(int(row_counts.sum()), ANNOT_WIDTH))
+    for seq_id, cam_id in tqdm(list(zip(*np.nonzero(has_annot)))):
+        annots = read_annot(hanco_root, seq_id, cam_id)
+        frames = frame_counts[seq_id, cam_id]
+        offset = offsets[seq_id, cam_id]
+        col = 0
+        for key, shape in ANNOT_FIELDS:
+            value = annots[key]
+            assert value.shape == (frames, *shape), \
+                f'{key} of seq {seq_id}, cam {cam_id}: {value.shape}, expect {(frames, *shape)}'
+            width = int(np.prod(shape))
+            store[offset:offset + frames, col:col + width] = value.reshape(frames, width)
+            col += width
+    store.flush()
+    del store
+
+    np.savez(os.path.join(hanco_root, INDEX_NAME), offsets=offsets, counts=counts)
+    os.replace(tmp_path, store_path)  # store is visible only when complete
+    print(f'Saved {row_counts.sum()} frames to {store_path}')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='pack HanCo numpy_seq annotations into one memory-mapped file')
+    parser.add_argument('--hanco_root', type=str, default='data/HanCo')
+    args = parser.parse_args()
+
+    build_annot_store(args.hanco_root)
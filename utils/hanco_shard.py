@@ -0,0 +1,138 @@
+''' Packed HanCo frame shards
+
+One shard = every frame of one (folder, seq_id, cam_id), decoded once and saved
+as a contiguous uint8 .npy file, so that a window of frames is a single slice
+of a memory-mapped array instead of `frame_counts` jpeg decodes.
+
+--- Shard Structure ---
+
+HanCo_shard/
+    rgb/                | {seq_id:04d}/cam{cam_id}.npy | (#, H, W, 3) uint8
+    rgb_color_auto/     | ...
+    ...
+    mask_hand/          | {seq_id:04d}/cam{cam_id}.npy | (#, H, W)    uint8
+
+Build:
+    python utils/hanco_shard.py --hanco_root data/HanCo --shard_root data/HanCo_shard
+Use:
+    DATA.HANCO.SHARD_ROOT: 'data/HanCo_shard'
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from collections import OrderedDict
+import numpy as np
+from utils.hanco_utils import read_img, read_mask
+
+__all__ = [
+    'HanCoShards',
+    'pack_hanco_shards',
+]
+
+IMAGE_FOLDERS = ['rgb', 'rgb_color_auto', 'rgb_color_sample', 'rgb_homo', 'rgb_merged']
+MASK_FOLDER = 'mask_hand'
+
+
+def shard_path(shard_root: str, folder: str, seq_id: int, cam_id: int) -> str:
+    return os.path.join(shard_root, folder, f'{seq_id:04d}', f'cam{cam_id}.npy')
+
+
+class HanCoShards(object):
+    ''' Read-only access to packed HanCo shards
+
+        memmaps are opened lazily and kept in a small LRU, they are dropped when
+        pickled, so every DataLoader worker maps the files by itself
+    '''
+    def __init__(self, shard_root: str, max_open: int = 256):
+        assert os.path.isdir(shard_root), f'Shard root does not exists: {shard_root}'
+        self.shard_root = shard_root
+        self.max_open = max_open
+        self._opened = OrderedDict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_opened'] = OrderedDict()
+        return state
+
+    def _open(self, folder: str, seq_id: int, cam_id: int) -> np.ndarray:
+        key = (folder, seq_id, cam_id)
+        if key in self._opened:
+            self._opened.move_to_end(key)
+            return self._opened[key]
+
+        path = shard_path(self.shard_root, folder, seq_id, cam_id)
+        assert os.path.exists(path), f'File does not exists: {path}'
+        shard = np.load(path, mmap_mode='r')
+
+        self._opened[key] = shard
+        if len(self._opened) > self.max_open:
+            self._opened.popitem(last=False)
+        return shard
+
+    def frame_count(self, folder: str, seq_id: int, cam_id: int) -> int:
+        return self._open(folder, seq_id, cam_id).shape[0]
+
+    def read_frames(self, folder: str, seq_id: int, cam_id: int, start: int, stop: int) -> np.ndarray:
+        ''' images of frames [start, stop), (F, H, W, 3) uint8, read-only view '''
+        return self._open(folder, seq_id, cam_id)[start:stop]
+
+    def read_masks(self, seq_id: int, cam_id: int, start: int, stop: int) -> np.ndarray:
+        ''' masks of frames [start, stop), (F, H, W) uint8, read-only view '''
+        return self._open(MASK_FOLDER, seq_id, cam_id)[start:stop]
+
+
+def _pack_one(hanco_root, shard_root, folder, seq_id, cam_id, frame_count):
+    ''' decode all frames of (folder, seq_id, cam_id) into one .npy shard '''
+    path = shard_path(shard_root, folder, seq_id, cam_id)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if folder == MASK_FOLDER:
+        read = lambda frame_id: read_mask(hanco_root, seq_id, cam_id, frame_id)
+    else:
+        read = lambda frame_id: read_img(hanco_root, folder, seq_id, cam_id, frame_id)
+
+    first = read(0)
+    tmp_path = path + '.tmp'
+    shard = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                      shape=(frame_count, *first.shape))
+    shard[0] = first
+    for frame_id in range(1, frame_count):
+        shard[frame_id] = read(frame_id)
+    shard.flush()
+    del shard
+    os.replace(tmp_path, path)  # only complete shards are visible
+
+
+def pack_hanco_shards(hanco_root: str, shard_root: str, folders=None, seqs=None):
+    ''' pack HanCo/{folder}/{seq}/cam{cam}/*.jpg into HanCo_shard/{folder}/{seq}/cam{cam}.npy
+
+        folders: image folders to pack, mask_hand is always packed, default: all
+        seqs   : sequences to pack, default: all sequences in HanCo/rgb
+        existing shards are skipped, so an interrupted job can be restarted
+    '''
+    from tqdm import tqdm
+    folders = IMAGE_FOLDERS if folders is None else folders
+    if seqs is None:
+        seqs = sorted(int(seq) for seq in os.listdir(os.path.join(hanco_root, 'rgb')))
+
+    for seq_id in tqdm(seqs):
+        for cam_id in range(8):
+            frame_count = len(os.listdir(os.path.join(hanco_root, 'rgb', f'{seq_id:04d}', f'cam{cam_id}')))
+            for folder in folders + [MASK_FOLDER]:
+                if not os.path.isdir(os.path.join(hanco_root, folder, f'{seq_id:04d}')):
+                    continue  # test sequences have no augmented folders
+                _pack_one(hanco_root, shard_root, folder, seq_id, cam_id, frame_count)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='pack HanCo frames into memory-mapped shards')
+    parser.add_argument('--hanco_root', type=str, default='data/HanCo')
+    parser.add_argument('--shard_root', type=str, default='data/HanCo_shard')
+    parser.add_argument('--folders', type=str, nargs='+', default=IMAGE_FOLDERS)
+    parser.add_argument('--seqs', type=int, nargs='+', default=None)
+    args = parser.parse_args()
+
+    pack_hanco_shards(args.hanco_root, args.shard_root, folders=args.folders, seqs=args.seqs)
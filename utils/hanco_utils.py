@@ -4,12 +4,14 @@ import json
 import os
 import time
 import skimage.io as io
+from utils.img_reader import imread
 
 __all__ = [
     'projectPoints',
     'read_img',
     'read_mask',
     'read_verts',
+    'load_manifest',
 ]
 
 ''' General util functions. '''
@@ -18,21 +20,26 @@ def _assert_exist(path):
     assert os.path.exists(path), f'File does not exists: {path}'
 
 def projectPoints(xyz, K):
-    """ Project 3D coordinates into image space. """
-    xyz = np.array(xyz)
-    K = np.array(K)
-    uv = np.matmul(K, xyz.T).T
-    return uv[:, :2] / uv[:, -1:]
+    """ Project 3D coordinates into image space.
+        xyz (N, 3) with K (3, 3), or a batch: xyz (F, N, 3) with K (F, 3, 3)
+    """
+    xyz = np.asarray(xyz)
+    K = np.asarray(K)
+    uv = np.matmul(xyz, np.swapaxes(K, -1, -2))
+    return uv[..., :2] / uv[..., -1:]
 
 
 ''' Dataset related functions '''
-def read_img(hanco_root: str, folder: str, seq_id: int, cam_id: int, frame_id: int) -> np.ndarray:
+def read_img(hanco_root: str, folder: str, seq_id: int, cam_id: int, frame_id: int, max_reduce: float = None) -> np.ndarray:
     ''' read image
         train -> folder in ['rgb', 'rgb_color_auto', ...]
         test  -> folder == 'rgb'
+        max_reduce: if given, return (img, reduce) of a reduced-resolution decode, see utils/img_reader.py
     '''
     img_path = os.path.join(hanco_root, folder, f'{seq_id:04d}', f'cam{cam_id}', f'{frame_id:08d}.jpg')
     _assert_exist(img_path)
+    if max_reduce is not None:
+        return imread(img_path, max_reduce=max_reduce)
 
     return io.imread(img_path)
 
@@ -64,3 +71,58 @@ def read_annot(hanco_root: str, seq_id: int, cam_id: int) -> Dict[str, np.ndarra
     _assert_exist(np_path)
 
     return np.load(np_path)
+
+def build_manifest(hanco_root: str) -> Dict[str, np.ndarray]:
+    ''' scan meta.json and the directory tree once
+        including: {
+            'frame_counts': (#seq, 8), frames in rgb/{seq}/cam{cam}, 0 if missing
+            'has_fit':      (#seq, ),  Crit 3, MANO fit in ALL frames
+            'full_aug':     (#seq, ),  Crit 2, has rgb_color_auto, ...
+            'has_mask':     (#seq, ),  has mask_hand
+            'train_seq':    Crit 2 & Crit 3
+            'test_seq':     Crit 3 & (not Crit 2)
+        }
+
+        Details: see top of my_research/datasets/hanco.py
+    '''
+    with open(os.path.join(hanco_root, 'meta.json'), 'r') as file:
+        meta_data = json.load(file)
+    seq_count = len(meta_data['has_fit'])
+
+    has_fit = np.array([sum(seq) == len(seq) for seq in meta_data['has_fit']], dtype=bool)
+    full_aug = np.zeros(seq_count, dtype=bool)
+    full_aug[[int(folder) for folder in os.listdir(os.path.join(hanco_root, 'rgb_color_auto'))]] = True
+    has_mask = np.zeros(seq_count, dtype=bool)
+    has_mask[[int(folder) for folder in os.listdir(os.path.join(hanco_root, 'mask_hand'))]] = True
+
+    frame_counts = np.zeros((seq_count, 8), dtype=np.int32)
+    for seq_id in range(seq_count):
+        for cam_id in range(8):
+            cam_dir = os.path.join(hanco_root, 'rgb', f'{seq_id:04d}', f'cam{cam_id}')
+            if os.path.isdir(cam_dir):
+                frame_counts[seq_id, cam_id] = len(os.listdir(cam_dir))
+
+    return {
+        'frame_counts': frame_counts,
+        'has_fit': has_fit,
+        'full_aug': full_aug,
+        'has_mask': has_mask,
+        'train_seq': np.flatnonzero(has_fit & full_aug),
+        'test_seq': np.flatnonzero(has_fit & ~full_aug),
+    }
+
+def load_manifest(hanco_root: str) -> Dict[str, np.ndarray]:
+    ''' return build_manifest(hanco_root), cached at {hanco_root}/dataset_manifest.npz
+        delete the file to rescan after the dataset changed
+    '''
+    manifest_path = os.path.join(hanco_root, 'dataset_manifest.npz')
+    if not os.path.isfile(manifest_path):
+        t = time.time()
+        manifest = build_manifest(hanco_root)
+        tmp_path = manifest_path + '.tmp.npz'
+        np.savez(tmp_path, **manifest)
+        os.replace(tmp_path, manifest_path)
+        print(f'Build HanCo manifest: {manifest_path}, in {time.time() - t:.2f} seconds')
+
+    with np.load(manifest_path) as manifest:
+        return {key: manifest[key] for key in manifest.files}
@@ -0,0 +1,70 @@
+''' Reduced-resolution image decoding
+
+Most samples are cropped and warped down to DATA.SIZE, so a large part of the
+decoded pixels is thrown away. JPEG can be decoded at 1/2, 1/4 or 1/8 of its
+size directly from the DCT coefficients, which is much cheaper than a full
+decode. imread() picks the largest such reduction that still keeps enough
+pixels for the caller.
+
+A pixel x of an image decoded at 1/r covers the full resolution pixels
+[r*x, r*x + r), so its center is at r*x + (r-1)/2 in full resolution
+coordinates, see reduce_trans(). Reductions are only used if they divide the
+image size, so a reduced image is exactly (H/r, W/r).
+'''
+import numpy as np
+from PIL import Image
+
+__all__ = [
+    'imread',
+    'max_crop_reduce',
+    'reduce_trans',
+]
+
+REDUCE_FACTORS = (8, 4, 2)
+
+
+def max_crop_reduce(crop_size, out_size):
+    ''' largest reduction that keeps a crop of {crop_size} (full resolution) at least {out_size} pixels wide '''
+    return max(float(crop_size) / out_size, 1)
+
+
+def _pick_reduce(width, height, max_reduce, min_size=None):
+    if min_size is not None:
+        max_reduce = min(max_reduce, width / min_size[0], height / min_size[1])
+    for reduce in REDUCE_FACTORS:
+        if reduce <= max_reduce and width % reduce == 0 and height % reduce == 0:
+            return reduce
+    return 1
+
+
+def imread(path, max_reduce=1, min_size=None, mode='RGB'):
+    ''' read an image, return (img, reduce)
+
+        img is decoded at 1/reduce of the full resolution, reduce in (1, 2, 4, 8)
+        max_reduce: upper bound of reduce, see max_crop_reduce()
+        min_size  : (w, h), reduced image is at least this large
+        mode      : 'RGB' -> (H, W, 3), 'L' -> (H, W) uint8
+        non-JPEG images are always decoded at full resolution
+    '''
+    with Image.open(path) as img:
+        reduce = 1
+        if img.format == 'JPEG':
+            reduce = _pick_reduce(img.width, img.height, max_reduce, min_size)
+        if reduce > 1:
+            # draft() selects the DCT scale, it has to be called before the image is loaded
+            size = (img.width // reduce, img.height // reduce)
+            img.draft(mode, size)
+            assert img.size == size, f'{path}: draft {size}, but got {img.size}'
+        img = img.convert(mode) if img.mode != mode else img
+        return np.asarray(img), reduce
+
+
+def reduce_trans(trans, reduce):
+    ''' 2x3 affine {trans} of full resolution coordinates -> same affine of 1/reduce coordinates '''
+    if reduce == 1:
+        return trans
+    # full = reduce * reduced + (reduce-1)/2
+    scale = np.array([[reduce, 0, (reduce - 1) / 2],
+                      [0, reduce, (reduce - 1) / 2],
+                      [0, 0, 1]], dtype=np.float32)
+    return np.dot(trans, scale).astype(trans.dtype)
@@ -54,77 +54,57 @@ def vertex_quadrics(mesh):
        v_quadrics: an (N x 4 x 4) array, where N is # vertices.
     """
 
-    # Allocate quadrics
-    v_quadrics = np.zeros((
-        len(mesh.v),
-        4,
-        4,
-    ))
-
-    # For each face...
-    for f_idx in range(len(mesh.f)):
-
-        # Compute normalized plane equation for that face
-        vert_idxs = mesh.f[f_idx]
-        verts = np.hstack((mesh.v[vert_idxs], np.array([1, 1,
-                                                        1]).reshape(-1, 1)))
-        u, s, v = np.linalg.svd(verts)
-        eq = v[-1, :].reshape(-1, 1)
-        eq = eq / (np.linalg.norm(eq[0:3]))
-
-        # Add the outer product of the plane equation to the
-        # quadrics of the vertices for this face
-        for k in range(3):
-            v_quadrics[mesh.f[f_idx, k], :, :] += np.outer(eq, eq)
+    # Normalized plane equation of every face: the right singular vector of
+    # [v | 1] with the smallest singular value, all faces in one batched svd
+    verts = np.concatenate((mesh.v[mesh.f], np.ones((len(mesh.f), 3, 1))), axis=2)
+    eq = np.linalg.svd(verts)[2][:, -1, :]
+    eq = eq / np.linalg.norm(eq[:, 0:3], axis=1, keepdims=True)
+
+    # Add the outer product of the plane equation to the quadrics of the
+    # vertices of each face, in face order
+    v_quadrics = np.zeros((len(mesh.v), 4, 4))
+    np.add.at(v_quadrics, mesh.f.ravel(), np.repeat(eq[:, :, None] * eq[:, None, :], 3, axis=0))
 
     return v_quadrics
 
 
 def setup_deformation_transfer(source, target, use_normals=False):
-    rows = np.zeros(3 * target.v.shape[0])
-    cols = np.zeros(3 * target.v.shape[0])
-    coeffs_v = np.zeros(3 * target.v.shape[0])
-    coeffs_n = np.zeros(3 * target.v.shape[0])
-
+    n_target = target.v.shape[0]
     nearest_faces, nearest_parts, nearest_vertices = source.compute_aabb_tree(
     ).nearest(target.v, True)
     nearest_faces = nearest_faces.ravel().astype(np.int64)
     nearest_parts = nearest_parts.ravel().astype(np.int64)
-    nearest_vertices = nearest_vertices.ravel()
-
-    for i in range(target.v.shape[0]):
-        # Closest triangle index
-        f_id = nearest_faces[i]
-        # Closest triangle vertex ids
-        nearest_f = source.f[f_id]
-
-        # Closest surface point
-        nearest_v = nearest_vertices[3 * i:3 * i + 3]
-        # Distance vector to the closest surface point
-        dist_vec = target.v[i] - nearest_v
-
-        rows[3 * i:3 * i + 3] = i * np.ones(3)
-        cols[3 * i:3 * i + 3] = nearest_f
-
-        n_id = nearest_parts[i]
-        if n_id == 0:
-            # Closest surface point in triangle
-            A = np.vstack((source.v[nearest_f])).T
-            coeffs_v[3 * i:3 * i + 3] = np.linalg.lstsq(A, nearest_v,
-                                                        rcond=-1)[0]
-        elif n_id > 0 and n_id <= 3:
-            # Closest surface point on edge
-            A = np.vstack((source.v[nearest_f[n_id - 1]],
-                           source.v[nearest_f[n_id % 3]])).T
-            tmp_coeffs = np.linalg.lstsq(A, target.v[i], rcond=-1)[0]
-            coeffs_v[3 * i + n_id - 1] = tmp_coeffs[0]
-            coeffs_v[3 * i + n_id % 3] = tmp_coeffs[1]
-        else:
-            # Closest surface point a vertex
-            coeffs_v[3 * i + n_id - 4] = 1.0
+    nearest_vertices = nearest_vertices.reshape(-1, 3)
+
+    # Closest triangle vertex ids, 3 coefficients per target vertex
+    nearest_f = source.f[nearest_faces].astype(np.int64)
+    rows = np.repeat(np.arange(n_target), 3)
+    cols = nearest_f.ravel()
+    coeffs_v = np.zeros((n_target, 3))
+
+    # Closest surface point in triangle: least squares with the triangle
+    # vertices as columns, all of them through one batched pseudo-inverse
+    idx = np.nonzero(nearest_parts == 0)[0]
+    A = source.v[nearest_f[idx]].transpose(0, 2, 1)
+    coeffs_v[idx] = np.matmul(np.linalg.pinv(A), nearest_vertices[idx, :, None])[:, :, 0]
+
+    # Closest surface point on edge (n_id - 1, n_id % 3): least squares of the
+    # target vertex on the two edge vertices
+    idx = np.nonzero((nearest_parts > 0) & (nearest_parts <= 3))[0]
+    k0 = nearest_parts[idx] - 1
+    k1 = nearest_parts[idx] % 3
+    A = np.stack((source.v[nearest_f[idx, k0]], source.v[nearest_f[idx, k1]]), axis=2)
+    tmp_coeffs = np.matmul(np.linalg.pinv(A), target.v[idx, :, None])[:, :, 0]
+    coeffs_v[idx, k0] = tmp_coeffs[:, 0]
+    coeffs_v[idx, k1] = tmp_coeffs[:, 1]
+
+    # Closest surface point a vertex
+    idx = np.nonzero(nearest_parts > 3)[0]
+    coeffs_v[idx, nearest_parts[idx] - 4] = 1.0
+    coeffs_v = coeffs_v.ravel()
 
     matrix = sp.csc_matrix((coeffs_v, (rows, cols)),
-                           shape=(target.v.shape[0], source.v.shape[0]))
+                           shape=(n_target, source.v.shape[0]))
     return matrix
 
 
@@ -219,18 +199,10 @@ def qslim_decimator_transformer(mesh, factor=None, n_verts_desired=None):
             np.place(faces, faces == to_destroy, to_keep)
 
             # same for queue
-            which1 = [
-                idx for idx in range(len(queue))
-                if queue[idx][1][0] == to_destroy
-            ]
-            which2 = [
-                idx for idx in range(len(queue))
-                if queue[idx][1][1] == to_destroy
-            ]
-            for k in which1:
-                queue[k] = (queue[k][0], (to_keep, queue[k][1][1]))
-            for k in which2:
-                queue[k] = (queue[k][0], (queue[k][1][0], to_keep))
+            for k, (e_cost, (e_r, e_c)) in enumerate(queue):
+                if e_r == to_destroy or e_c == to_destroy:
+                    queue[k] = (e_cost, (to_keep if e_r == to_destroy else e_r,
+                                         to_keep if e_c == to_destroy else e_c))
 
             Qv[r, :, :] = cost['Qsum']
             Qv[c, :, :] = cost['Qsum']
@@ -0,0 +1,149 @@
+''' Move batches to the device ahead of the model
+
+Runners take a batch from the DataLoader, move it with phrase_data and only then
+start the forward pass, so collation and host to device copies never overlap
+the model. DevicePrefetcher wraps a loader and keeps {num_prefetch} batches in
+flight, moved by {to_device} (usually Runner.phrase_data):
+
+    cuda: to_device runs on a side stream, with non-blocking copies from pinned
+          memory the copies run while the model computes the previous batch. The
+          compute stream waits for a batch only when it is handed out.
+    cpu : a background thread takes batches from the loader and runs to_device.
+
+wait_time is the time the runner spent blocked in next(), i.e. waiting on data.
+'''
+import time
+import queue
+import threading
+from collections import deque
+import torch
+
+__all__ = [
+    'DevicePrefetcher',
+]
+
+_END = object()
+
+
+def _tensors(data):
+    if isinstance(data, torch.Tensor):
+        yield data
+    elif isinstance(data, dict):
+        for val in data.values():
+            yield from _tensors(val)
+    elif isinstance(data, (list, tuple)):
+        for val in data:
+            yield from _tensors(val)
+
+
+class DevicePrefetcher(object):
+    ''' iterate {loader}, every batch already moved by {to_device}
+
+        to_device   : batch -> batch on {device}, e.g. Runner.phrase_data
+        num_prefetch: batches in flight, 0: move every batch when it is asked for, like before
+    '''
+    def __init__(self, loader, device, to_device, num_prefetch=2):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.to_device = to_device
+        self.num_prefetch = num_prefetch
+        self.wait_time = 0.  # seconds blocked in next()
+        self.num_batches = 0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.num_prefetch <= 0:
+            return self._iter_sync()
+        if self.device.type == 'cuda':
+            return self._iter_stream()
+        return self._iter_thread()
+
+    def stats(self):
+        ''' data wait time of the batches handed out so far '''
+        return {
+            'batches': self.num_batches,
+            'wait_s': self.wait_time,
+            'wait_ms_per_batch': self.wait_time / max(self.num_batches, 1) * 1000,
+        }
+
+    def _waited(self, start):
+        self.wait_time += time.perf_counter() - start
+        self.num_batches += 1
+
+    def _iter_sync(self):
+        it = iter(self.loader)
+        while True:
+            start = time.perf_counter()
+            batch = next(it, _END)
+            if batch is _END:
+                return
+            batch = self.to_device(batch)
+            self._waited(start)
+            yield batch
+
+    def _iter_stream(self):
+        stream = torch.cuda.Stream(self.device)
+        it = iter(self.loader)
+        pending = deque()  # (batch, event of its copies)
+        exhausted = False
+        while True:
+            start = time.perf_counter()
+            # refill first, the copies of the next batches run while the caller computes this one
+            while not exhausted and len(pending) < self.num_prefetch:
+                batch = next(it, _END)
+                if batch is _END:
+                    exhausted = True
+                    break
+                with torch.cuda.stream(stream):
+                    batch = self.to_device(batch)
+                event = torch.cuda.Event()
+                event.record(stream)
+                pending.append((batch, event))
+            if not pending:
+                return
+
+            batch, event = pending.popleft()
+            current = torch.cuda.current_stream(self.device)
+            current.wait_event(event)
+            for tensor in _tensors(batch):
+                if tensor.is_cuda:
+                    tensor.record_stream(current)  # allocated on the side stream, used on the compute stream
+            self._waited(start)
+            yield batch
+
+    def _iter_thread(self):
+        batches = queue.Queue(maxsize=self.num_prefetch)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for batch in self.loader:
+                    batch = self.to_device(batch)
+                    while not stop.is_set():
+                        try:
+                            batches.put((batch, None), timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                batches.put((_END, None))
+            except Exception as error:  # raised again in the caller
+                batches.put((_END, error))
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                batch, error = batches.get()
+                if batch is _END:
+                    if error is not None:
+                        raise error
+                    return
+                self._waited(start)
+                yield batch
+        finally:
+            stop.set()  # the caller stopped early, the thread exits after its current batch
@@ -3,9 +3,15 @@ import cv2
 import random
 import math
 from utils.augmentation import get_m1to1_gaussian_rand
+from utils.img_reader import imread, reduce_trans
 
 
-def load_img(path, order='RGB'):
+def load_img(path, order='RGB', max_reduce=None):
+    if max_reduce is not None:
+        # (img, reduce), see utils/img_reader.py
+        img, reduce = imread(path, max_reduce=max_reduce)
+        return (img if order == 'RGB' else img[:, :, ::-1].copy()), reduce
+
     img = cv2.imread(path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
     if not isinstance(img, np.ndarray):
         raise IOError("Fail to read %s" % path)
@@ -92,46 +98,104 @@ def get_aug_config(exclude_flip, base_scale=1.1, scale_factor=0.25, rot_factor=6
     return scale, rot, shift, color_scale, do_flip
 
 
-def augmentation(img, bbox, data_split, exclude_flip=False, input_img_shape=(256, 256), mask=None, base_scale=1.1, scale_factor=0.25, rot_factor=60, shift_wh=None, gaussian_std=1, color_aug=False):
-    if data_split == 'train':
-        scale, rot, shift, color_scale, do_flip = get_aug_config(exclude_flip, base_scale=base_scale, scale_factor=scale_factor, rot_factor=rot_factor, gaussian_std=gaussian_std)
-        # scale = 1.5
-        # rot = 60
-        # shift = [1, 0]
-        # color_scale = np.array([0, 0, 0], dtype=np.float32)
-        # do_flip = False
-    else:
-        scale, rot, shift, color_scale, do_flip = base_scale, 0.0, [0, 0], np.array([1, 1, 1]), False
+def augmentation(img, bbox, data_split, exclude_flip=False, input_img_shape=(256, 256), mask=None, base_scale=1.1, scale_factor=0.25, rot_factor=60, shift_wh=None, gaussian_std=1, color_aug=False, img_reduce=1):
+    return augmentation_views(img, bbox, data_split, 1, exclude_flip=exclude_flip, input_img_shape=input_img_shape, mask=mask,
+                              base_scale=base_scale, scale_factor=scale_factor, rot_factor=rot_factor, shift_wh=shift_wh,
+                              gaussian_std=gaussian_std, color_aug=color_aug, img_reduce=img_reduce)[0]
+
+
+def augmentation_views(img, bbox, data_split, num_views, exclude_flip=False, input_img_shape=(256, 256), mask=None, base_scale=1.1, scale_factor=0.25, rot_factor=60, shift_wh=None, gaussian_std=1, color_aug=False, img_reduce=1):
+    '''
+    {num_views} independently augmented views of the same img / mask, cropped by one generate_patch_images call
+    return a list of what augmentation returns, one per view
+    '''
+    params, color_scales = _aug_params(num_views, data_split, exclude_flip, base_scale, scale_factor, rot_factor, gaussian_std)
 
     # bbox= [left, top, width, height]
-    img, trans, inv_trans, mask, shift_xy = generate_patch_image(img, bbox, scale, rot, shift, do_flip, input_img_shape, shift_wh=shift_wh, mask=mask)
-    if color_aug:
-        img = np.clip(img * color_scale[None, None, :], 0, 255)
-    return img, trans, inv_trans, np.array([rot, scale, *shift_xy]), do_flip, input_img_shape[0]/(bbox[3]*scale), mask
+    patches = generate_patch_images(img, bbox, params, input_img_shape, shift_wh=shift_wh, mask=mask, img_reduce=img_reduce)
+    views = []
+    for (scale, rot, shift, do_flip), color_scale, (patch, trans, inv_trans, patch_mask, shift_xy) in zip(params, color_scales, patches):
+        if color_aug:
+            patch = np.clip(patch * color_scale[None, None, :], 0, 255)
+        views.append((patch, trans, inv_trans, np.array([rot, scale, *shift_xy]), do_flip, input_img_shape[0]/(bbox[3]*scale), patch_mask))
                                                                             # input_img_shape[0]/(bbox[3]*scale) = scale: 新圖大小 / 舊圖大小
+    return views
 
 
-def augmentation_2d(img, joint_img, princpt, trans, do_flip):
-    joint_img = joint_img.copy()
-    joint_num = len(joint_img)
-    original_img_shape = img.shape
+def augmentation_window(imgs, bboxes, data_split, exclude_flip=False, input_img_shape=(256, 256), masks=None, base_scale=1.1, scale_factor=0.25, rot_factor=60, gaussian_std=1, color_aug=False, img_reduce=1):
+    '''
+    augmentation of the F frames of a window, each frame with its own bbox and augment params
+    - imgs: F images of the same size, masks: F masks or None
+    - bboxes: (F, 4), shift_wh is the bbox size of every frame
 
-    if do_flip:
-        joint_img[:, 0] = original_img_shape[1] - joint_img[:, 0] - 1
-        princpt[0] = original_img_shape[1] - princpt[0] - 1
-    for i in range(joint_num):
-        joint_img[i,:2] = trans_point2d(joint_img[i,:2], trans)
-    princpt = trans_point2d(princpt, trans)
+    return what augmentation returns, stacked over the frames
+    - (F, h, w, 3) float32 patches, (F, 2, 3) matrices, (F, 2, 3) inverse matrices, (F, 4) aug params,
+      (F,) do_flip, (F,) scale, (F, h, w) uint8 masks or None
+    '''
+    bboxes = np.asarray(bboxes, dtype=np.float64)
+    params, color_scales = _aug_params(len(bboxes), data_split, exclude_flip, base_scale, scale_factor, rot_factor, gaussian_std)
+    patches, trans, inv_trans, patch_masks, shift_xy = generate_window_patches(imgs, bboxes, params, input_img_shape, masks=masks, img_reduce=img_reduce)
+
+    scales, rots, _, do_flips = (np.asarray(p) for p in zip(*params))
+    if color_aug:
+        patches = np.clip(patches * np.stack(color_scales)[:, None, None, :], 0, 255)
+    aug_params = np.concatenate([rots[:, None], scales[:, None], shift_xy], -1)
+    return patches, trans, inv_trans, aug_params, do_flips.astype(bool), input_img_shape[0] / (bboxes[:, 3] * scales), patch_masks
+
+
+def _aug_params(num, data_split, exclude_flip, base_scale, scale_factor, rot_factor, gaussian_std):
+    ''' {num} (scale, rot, shift, do_flip) and color scales '''
+    params, color_scales = [], []
+    for _ in range(num):
+        if data_split == 'train':
+            scale, rot, shift, color_scale, do_flip = get_aug_config(exclude_flip, base_scale=base_scale, scale_factor=scale_factor, rot_factor=rot_factor, gaussian_std=gaussian_std)
+            # scale = 1.5
+            # rot = 60
+            # shift = [1, 0]
+            # color_scale = np.array([0, 0, 0], dtype=np.float32)
+            # do_flip = False
+        else:
+            scale, rot, shift, color_scale, do_flip = base_scale, 0.0, [0, 0], np.array([1, 1, 1]), False
+        params.append((scale, rot, shift, do_flip))
+        color_scales.append(color_scale)
+    return params, color_scales
+
+
+def augmentation_2d(img, joint_img, princpt, trans, do_flip, img_reduce=1):
+    joint_img, princpt = augmentation_2d_batch(img.shape, joint_img[None], np.asarray(princpt)[None], trans[None], [do_flip], img_reduce=img_reduce)
+    return joint_img[0], princpt[0]
+
+
+def augmentation_2d_batch(img_shape, joint_img, princpt, trans, do_flip, img_reduce=1):
+    '''
+    augmentation_2d of F frames at once
+    - img_shape: shape of the decoded images, all F frames have the same size
+    - joint_img: (F, J, 2+), princpt: (F, 2), trans: (F, 2, 3), do_flip: (F,)
+
+    return
+    - joint_img (F, J, 2+), princpt (F, 2), {joint_img} and {princpt} are not modified
+    '''
+    joint_img = np.array(joint_img)
+    princpt = np.array(princpt, dtype=np.float64)
+    do_flip = np.asarray(do_flip, dtype=bool)
+    img_width = img_shape[1] * img_reduce
+
+    joint_img[do_flip, :, 0] = img_width - joint_img[do_flip, :, 0] - 1
+    princpt[do_flip, 0] = img_width - princpt[do_flip, 0] - 1
+    joint_img[..., :2] = trans_points2d(joint_img[..., :2], trans)
+    princpt = trans_points2d(princpt[:, None], trans)[:, 0]
     return joint_img, princpt
 
 
-def generate_patch_image(cvimg, bbox, scale, rot, shift, do_flip, out_shape, shift_wh=None, mask=None):
+def generate_patch_image(cvimg, bbox, scale, rot, shift, do_flip, out_shape, shift_wh=None, mask=None, img_reduce=1):
     '''
     collect
     - original image: cvimg
     - square bbox: bbox [left, top, w, h]
     - model input size: out_shape
     - mask: mask
+    - img_reduce: cvimg is decoded at 1/img_reduce resolution, see utils/img_reader.py
+                  bbox, mask and the returned matrix are in full resolution
     - augment param: scale, rot, shift...
       shift_wh: bbox - w, h
       shift   : (-1~+1, -1~+1), gaussian distribution
@@ -139,30 +203,98 @@ def generate_patch_image(cvimg, bbox, scale, rot, shift, do_flip, out_shape, shi
     return
     - transformed image, matrix, shift value(平移)
     '''
-    # out_shape: 128, model input
-    img = cvimg.copy()
-    img_height, img_width, img_channels = img.shape
+    return generate_patch_images(cvimg, bbox, [(scale, rot, shift, do_flip)], out_shape, shift_wh=shift_wh, mask=mask, img_reduce=img_reduce)[0]
+
 
-    bb_c_x = float(bbox[0] + 0.5 * bbox[2])  # center
+def generate_patch_images(cvimg, bbox, aug_params, out_shape, shift_wh=None, mask=None, img_reduce=1):
+    '''
+    generate_patch_image for K augment params of the same cvimg / mask
+    - aug_params: K (scale, rot, shift, do_flip)
+
+    all matrices come from one gen_trans_from_patch_batch call. cvimg and mask are
+    never copied: a flip is folded into the matrix given to cv2.warpAffine instead
+    of flipping the pixels, and with K > 1 views image and mask are stacked once and
+    every view warps them together (a single warp per view)
+
+    return
+    - K (transformed image, matrix, inverse matrix, mask, shift value)
+      matrices map flipped full resolution coordinates like generate_patch_image
+    '''
+    img_height, img_width = cvimg.shape[0] * img_reduce, cvimg.shape[1] * img_reduce
+    out_size = (int(out_shape[1]), int(out_shape[0]))
+    scales, rots, shifts, do_flips = (np.asarray(p, dtype=np.float32) for p in zip(*aug_params))
+
+    bb_c_x = np.float32(bbox[0] + 0.5 * bbox[2])  # center
+    bb_c_x = np.where(do_flips > 0, img_width - bb_c_x - 1, bb_c_x)
     bb_c_y = float(bbox[1] + 0.5 * bbox[3])
-    bb_width = float(bbox[2])
-    bb_height = float(bbox[3])
+    trans, inv_trans, shift_xy = gen_trans_from_patch_batch(bb_c_x, bb_c_y, float(bbox[2]), float(bbox[3]), out_shape[1], out_shape[0],
+                                                            scales, rots, shifts, shift_wh=shift_wh)
+
+    # one warp of image + mask, only pays off if the stacked copy is used by more than one view
+    stack = mask is not None and len(aug_params) > 1 and img_reduce == 1 and cvimg.ndim == 3 \
+        and mask.shape == cvimg.shape[:2] and mask.dtype == cvimg.dtype
+    src = np.dstack([cvimg, mask]) if stack else cvimg
+
+    patches = []
+    for k in range(len(aug_params)):
+        if stack:
+            img_patch, _ = _warp_patch(src, trans[k], do_flips[k], out_size)
+            img_patch, mask_patch = img_patch[:, :, :-1], (img_patch[:, :, -1] > 150).astype(np.uint8)
+        else:
+            img_patch, mask_patch = _warp_patch(cvimg, trans[k], do_flips[k], out_size, mask=mask, img_reduce=img_reduce)
+        patches.append((img_patch.astype(np.float32), trans[k], inv_trans[k], mask_patch, list(shift_xy[k])))
+    return patches
+
+
+def generate_window_patches(cvimgs, bboxes, aug_params, out_shape, masks=None, img_reduce=1):
+    '''
+    generate_patch_image of F frames, one bbox and one (scale, rot, shift, do_flip) per frame
+    shift_wh is the bbox size of every frame, all matrices come from one gen_trans_from_patch_batch call
 
+    return
+    - (F, h, w, 3) float32 patches, (F, 2, 3) matrices, (F, 2, 3) inverse matrices, (F, h, w) uint8 masks or None,
+      (F, 2) shift values
+    '''
+    bboxes = np.asarray(bboxes, dtype=np.float64)
+    img_width = cvimgs[0].shape[1] * img_reduce
+    out_size = (int(out_shape[1]), int(out_shape[0]))
+    scales, rots, shifts, do_flips = (np.asarray(p, dtype=np.float32) for p in zip(*aug_params))
+
+    bb_c_x = bboxes[:, 0] + 0.5 * bboxes[:, 2]  # center
+    bb_c_x = np.where(do_flips > 0, img_width - bb_c_x - 1, bb_c_x)
+    bb_c_y = bboxes[:, 1] + 0.5 * bboxes[:, 3]
+    trans, inv_trans, shift_xy = gen_trans_from_patch_batch(bb_c_x, bb_c_y, bboxes[:, 2], bboxes[:, 3], out_shape[1], out_shape[0],
+                                                            scales, rots, shifts, shift_wh=bboxes[:, 2:4])
+
+    patches = np.empty((len(bboxes), out_size[1], out_size[0]) + cvimgs[0].shape[2:], dtype=cvimgs[0].dtype)
+    patch_masks = np.empty((len(bboxes), out_size[1], out_size[0]), dtype=np.uint8) if masks is not None else None
+    for k in range(len(bboxes)):
+        patches[k], mask_patch = _warp_patch(cvimgs[k], trans[k], do_flips[k], out_size,
+                                             mask=masks[k] if masks is not None else None, img_reduce=img_reduce)
+        if masks is not None:
+            patch_masks[k] = mask_patch
+    return patches.astype(np.float32), trans, inv_trans, patch_masks, shift_xy
+
+
+def _warp_patch(cvimg, trans, do_flip, out_size, mask=None, img_reduce=1):
+    ''' cv2.warpAffine of cvimg (1/img_reduce resolution) and mask (full resolution) by {trans} of the flipped image '''
+    img_trans = reduce_trans(trans, img_reduce)
     if do_flip:
-        img = img[:, ::-1, :]
-        bb_c_x = img_width - bb_c_x - 1
-        if mask is not None:
-            mask = mask[:, ::-1]
+        img_trans = _flip_trans(img_trans, cvimg.shape[1])
+    img_patch = cv2.warpAffine(cvimg, img_trans, out_size, flags=cv2.INTER_LINEAR)
+    if mask is None:
+        return img_patch, None
+    mask_trans = _flip_trans(trans, mask.shape[1]) if do_flip else trans
+    mask_patch = cv2.warpAffine(mask, mask_trans, out_size, flags=cv2.INTER_LINEAR)
+    return img_patch, (mask_patch > 150).astype(np.uint8)
 
-    trans, shift_xy = gen_trans_from_patch_cv(bb_c_x, bb_c_y, bb_width, bb_height, out_shape[1], out_shape[0], scale, rot, shift, shift_wh=shift_wh, return_shift=True)
-    img_patch = cv2.warpAffine(img, trans, (int(out_shape[1]), int(out_shape[0])), flags=cv2.INTER_LINEAR)
-    img_patch = img_patch.astype(np.float32)
-    if mask is not None:
-        mask = cv2.warpAffine(mask, trans, (int(out_shape[1]), int(out_shape[0])), flags=cv2.INTER_LINEAR)
-        mask = (mask > 150).astype(np.uint8)
-    inv_trans = gen_trans_from_patch_cv(bb_c_x, bb_c_y, bb_width, bb_height, out_shape[1], out_shape[0], scale, rot, shift, shift_wh=shift_wh, inv=True)
 
-    return img_patch, trans, inv_trans, mask, shift_xy
+def _flip_trans(trans, width):
+    ''' {trans} of the horizontally flipped image -> same affine of the image itself, x -> width - 1 - x '''
+    flipped = trans.copy()
+    flipped[:, 0] = -trans[:, 0]
+    flipped[:, 2] = trans[:, 2] + trans[:, 0] * (width - 1)
+    return flipped
 
 
 def rotate_2d(pt_2d, rot_rad):
@@ -253,7 +385,59 @@ def gen_trans_from_patch_cv(c_x, c_y, src_width, src_height, dst_width, dst_heig
     return trans
 
 
+def gen_trans_from_patch_batch(c_x, c_y, src_width, src_height, dst_width, dst_height, scales, rots, shifts, shift_wh=None):
+    '''
+    gen_trans_from_patch_cv for K augment params at once
+    - c_x, c_y, src_width, src_height: bbox center and size, scalar or (K,)
+    - shift_wh: (2,) or (K, 2)
+    - scales, rots: (K,), shifts: (K, 2)
+
+    return
+    - trans (K, 2, 3), inv_trans (K, 2, 3), shift value (K, 2)
+    '''
+    scales = np.asarray(scales, dtype=np.float32)
+    rots = np.asarray(rots, dtype=np.float32)
+    shifts = np.asarray(shifts, dtype=np.float32).reshape(-1, 2)
+    num = len(scales)
+
+    # augment size with scale
+    src_w = src_width * scales
+    src_h = src_height * scales
+    if shift_wh is not None:
+        shift_wh = np.asarray(shift_wh)
+        x_shift = shifts[:, 0] * np.maximum((src_w - shift_wh[..., 0]) / 2, 0)
+        y_shift = shifts[:, 1] * np.maximum((src_h - shift_wh[..., 1]) / 2, 0)
+    else:
+        x_shift = y_shift = np.zeros(num, dtype=np.float32)
+    src_center = np.stack(np.broadcast_arrays(c_x + x_shift, c_y + y_shift), -1).astype(np.float32)  # (K, 2)
+
+    # augment rotation, rotate_2d of downdir (0, h/2) and rightdir (w/2, 0)
+    rot_rad = np.pi * rots / 180
+    sn, cs = np.sin(rot_rad), np.cos(rot_rad)
+    src_downdir = np.stack([-src_h * 0.5 * sn, src_h * 0.5 * cs], -1)
+    src_rightdir = np.stack([src_w * 0.5 * cs, src_w * 0.5 * sn], -1)
+    src = np.stack([src_center, src_center + src_downdir, src_center + src_rightdir], 1).astype(np.float32)  # (K, 3, 2)
+
+    dst_center = np.array([dst_width * 0.5, dst_height * 0.5], dtype=np.float32)
+    dst = np.stack([dst_center, dst_center + [0, dst_height * 0.5], dst_center + [dst_width * 0.5, 0]]).astype(np.float32)  # (3, 2)
+
+    # affine of 3 point pairs, [pts, 1] @ trans.T = other pts, like cv2.getAffineTransform
+    src_h1 = np.concatenate([src, np.ones((num, 3, 1), dtype=np.float32)], -1).astype(np.float64)
+    dst_h1 = np.concatenate([dst, np.ones((3, 1), dtype=np.float32)], -1).astype(np.float64)
+    trans = np.linalg.solve(src_h1, np.broadcast_to(dst, (num, 3, 2))).transpose(0, 2, 1)
+    inv_trans = np.linalg.solve(np.broadcast_to(dst_h1, (num, 3, 3)), src).transpose(0, 2, 1)
+
+    shift_xy = np.stack([x_shift / src_w, y_shift / src_h], -1)  # 平移的比例 佔整張圖的多少
+    return trans.astype(np.float32), inv_trans.astype(np.float32), shift_xy
+
+
 def trans_point2d(pt_2d, trans):
     src_pt = np.array([pt_2d[0], pt_2d[1], 1.]).T
     dst_pt = np.dot(trans, src_pt)
-    return dst_pt[0:2]
\ No newline at end of file
+    return dst_pt[0:2]
+
+
+def trans_points2d(pts_2d, trans):
+    ''' trans_point2d of every point, pts_2d (..., N, 2), trans (..., 2, 3) -> (..., N, 2) '''
+    pts_2d = np.asarray(pts_2d, dtype=np.float64)
+    return np.matmul(pts_2d, np.swapaxes(trans[..., :, :2], -1, -2)) + trans[..., None, :, 2]
@@ -2,7 +2,11 @@ import torch
 from torch_geometric.data import Data
 from torch_geometric.utils import to_undirected
 import openmesh as om
+import os
 from os import path as osp
+import hashlib
+import json
+import numpy as np
 from utils import utils, mesh_sampling
 from psbody.mesh import Mesh
 import pickle
@@ -36,7 +40,29 @@ def save_obj(v, f, file_name='output.obj'):
     obj_file.close()
 
 
-def spiral_tramsform(transform_fp, template_fp, ds_factors, seq_length, dilation):
+def spiral_cache_path(transform_fp, template_fp, ds_factors, seq_length, dilation):
+    """
+    :return: path of the cached spiral indices, keyed by the template, the transform matrices and the spiral config
+    """
+    key = hashlib.sha1()
+    for fp in (template_fp, transform_fp):
+        with open(fp, 'rb') as f:
+            key.update(f.read())
+    key.update(json.dumps([list(ds_factors), list(seq_length), list(dilation)]).encode())
+    return osp.splitext(transform_fp)[0] + '_spirals_{}.npz'.format(key.hexdigest()[:16])
+
+
+def _save_spirals(cache_fp, spiral_indices_list):
+    tmp_fp = '{}.{}.tmp'.format(cache_fp, os.getpid())
+    try:
+        with open(tmp_fp, 'wb') as f:
+            np.savez(f, **{'spiral_{}'.format(idx): s.numpy() for idx, s in enumerate(spiral_indices_list)})
+        os.replace(tmp_fp, cache_fp)  # other processes only see a complete file
+    except OSError as e:
+        print('Spiral indices are not cached: {}'.format(e))
+
+
+def spiral_tramsform(transform_fp, template_fp, ds_factors, seq_length, dilation, cache=True):
     if not osp.exists(transform_fp):
         print('Generating transform matrices...')
         mesh = Mesh(filename=template_fp)
@@ -59,10 +85,18 @@ def spiral_tramsform(transform_fp, template_fp, ds_factors, seq_length, dilation
         with open(transform_fp, 'rb') as f:
             tmp = pickle.load(f, encoding='latin1')
 
-    spiral_indices_list = [
-        utils.preprocess_spiral(tmp['face'][idx], seq_length[idx], tmp['vertices'][idx], dilation[idx])#.to(device)
-        for idx in range(len(tmp['face']) - 1)
-    ]
+    # extract_spirals walks the rings of every vertex in python, its result is kept next to transform_fp
+    cache_fp = spiral_cache_path(transform_fp, template_fp, ds_factors, seq_length, dilation) if cache else None
+    if cache_fp is not None and osp.exists(cache_fp):
+        with np.load(cache_fp) as f:
+            spiral_indices_list = [torch.from_numpy(f['spiral_{}'.format(idx)]) for idx in range(len(tmp['face']) - 1)]
+    else:
+        spiral_indices_list = [
+            utils.preprocess_spiral(tmp['face'][idx], seq_length[idx], tmp['vertices'][idx], dilation[idx])#.to(device)
+            for idx in range(len(tmp['face']) - 1)
+        ]
+        if cache_fp is not None:
+            _save_spirals(cache_fp, spiral_indices_list)
 
     down_transform_list = [
         utils.to_sparse(down_transform)#.to(device)
@@ -0,0 +1,136 @@
+''' Sequential tar shards of FreiHAND / CompHand training samples
+
+Reading the training sets file by file is slow on network or cold storage:
+FreiHAND has 4 x 32560 small jpg files in training/rgb and CompHand globs its
+whole tree at startup. The shards pack every sample into a few large tar
+files that are read front to back, see my_research/datasets/shardstream.py.
+
+--- Shard Structure ---
+
+FreiHAND_shards/
+    index.json          | {'dataset': 'FreiHAND', 'shards': [{'name': 'shard-00000.tar', 'count': 1000}, ...]}
+    shard-00000.tar     | {key:08d}.img  | encoded image, the file of the dataset as is (jpg / png)
+                        | {key:08d}.mask | encoded mask, the file of the dataset as is
+                        | {key:08d}.npz  | annotations, see FreiHAND.shard_record / CompHand.shard_record
+    shard-00001.tar     | ...
+
+Samples are in dataset order, {key} is the index of the sample in the dataset.
+
+Build:
+    python utils/sample_shard.py --dataset FreiHAND --shard_root data/FreiHAND_shards
+    python utils/sample_shard.py --dataset CompHand --shard_root data/CompHand_shards
+Use:
+    TRAIN.DATASET: 'ShardStream'
+    DATA.SHARD_STREAM.ROOTS: ['data/FreiHAND_shards', 'data/CompHand_shards']
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import io
+import json
+import tarfile
+import numpy as np
+
+__all__ = [
+    'load_shard_index',
+    'iter_shard',
+    'write_shards',
+]
+
+INDEX_NAME = 'index.json'
+
+
+def load_shard_index(shard_root):
+    ''' index.json of {shard_root}, shard names are joined with {shard_root} '''
+    path = os.path.join(shard_root, INDEX_NAME)
+    assert os.path.isfile(path), f'File does not exists: {path}, build it with utils/sample_shard.py'
+    with open(path, 'r') as f:
+        index = json.load(f)
+    for shard in index['shards']:
+        shard['path'] = os.path.join(shard_root, shard['name'])
+    return index
+
+
+def iter_shard(path):
+    ''' records of a shard in stored order, {'key': int, 'img': bytes, 'mask': bytes, 'annot': {name: ndarray}}
+        the tar is read as a stream, front to back
+    '''
+    record = {}
+    with tarfile.open(path, 'r|') as tar:
+        for member in tar:
+            key, ext = member.name.split('.')
+            if record and record['key'] != int(key):
+                yield record
+                record = {}
+            record['key'] = int(key)
+            data = tar.extractfile(member).read()
+            if ext == 'npz':
+                with np.load(io.BytesIO(data)) as npz:
+                    record['annot'] = {name: npz[name] for name in npz.files}
+            else:
+                record[ext] = data
+    if record:
+        yield record
+
+
+def _add(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _write_shard(path, read_record, keys):
+    tmp_path = path + '.tmp'
+    with tarfile.open(tmp_path, 'w') as tar:
+        for key in keys:
+            record = read_record(key)
+            annot = io.BytesIO()
+            np.savez(annot, **record['annot'])
+            _add(tar, f'{key:08d}.img', record['img'])
+            _add(tar, f'{key:08d}.mask', record['mask'])
+            _add(tar, f'{key:08d}.npz', annot.getvalue())
+    os.replace(tmp_path, path)  # only complete shards are visible
+
+
+def write_shards(shard_root, dataset_name, read_record, count, samples_per_shard=1000):
+    ''' pack samples [0, count) into {shard_root}/shard-%05d.tar and write index.json
+
+        read_record: key -> {'img': bytes, 'mask': bytes, 'annot': {name: ndarray}}
+        existing shards are skipped, so an interrupted job can be restarted
+    '''
+    from tqdm import tqdm
+    os.makedirs(shard_root, exist_ok=True)
+    shards = []
+    for shard_id, start in enumerate(tqdm(range(0, count, samples_per_shard))):
+        keys = range(start, min(start + samples_per_shard, count))
+        name = f'shard-{shard_id:05d}.tar'
+        if not os.path.exists(os.path.join(shard_root, name)):
+            _write_shard(os.path.join(shard_root, name), read_record, keys)
+        shards.append({'name': name, 'count': len(keys)})
+
+    with open(os.path.join(shard_root, INDEX_NAME), 'w') as f:
+        json.dump({'dataset': dataset_name, 'samples_per_shard': samples_per_shard, 'shards': shards}, f, indent=2)
+    print(f'Saved {count} {dataset_name} samples in {len(shards)} shards to {shard_root}')
+
+
+if __name__ == '__main__':
+    import argparse
+    from my_research.configs.config import get_cfg
+    from my_research.build import DATA_REGISTRY
+
+    parser = argparse.ArgumentParser(description='pack FreiHAND / CompHand training samples into tar shards')
+    parser.add_argument('--dataset', type=str, choices=['FreiHAND', 'CompHand'], required=True)
+    parser.add_argument('--shard_root', type=str, required=True)
+    parser.add_argument('--samples_per_shard', type=int, default=1000)
+    parser.add_argument('--config_file', type=str, default='')
+    parser.add_argument('--opts', type=str, nargs='+', default=[])
+    args = parser.parse_args()
+
+    cfg = get_cfg()
+    if args.config_file:
+        cfg.merge_from_file(args.config_file)
+    cfg.merge_from_list(args.opts)
+    cfg.freeze()
+
+    dataset = DATA_REGISTRY.get(args.dataset)(cfg, 'train')
+    write_shards(args.shard_root, args.dataset, dataset.shard_record, len(dataset), args.samples_per_shard)
@@ -0,0 +1,119 @@
+''' Ground-truth mesh vertices in one memory-mapped array
+
+FreiHAND reads training/mesh/%08d.ply and CompHand reads model_mano/**/*.obj
+per sample only to get 778 vertices, so they are extracted once per dataset
+into {root}/vert_store.npy:
+
+    (#samples, 778, 3) float32, vertices as stored in the mesh files
+        FreiHAND: indexed by sample id, shared by all 4 image versions
+        CompHand: in the (sorted) order of CompHand.img_list
+
+Build:
+    python utils/vert_store.py --dataset FreiHAND --root data/FreiHAND
+    python utils/vert_store.py --dataset CompHand --root data/CompHand
+'''
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+
+__all__ = [
+    'VertStore',
+    'load_vert_store',
+]
+
+VERT_STORE_NAME = 'vert_store.npy'
+VERT_NUM = 778
+
+
+class VertStore(object):
+    ''' store[idx] -> (778, 3) float32 vertices of sample idx, a writable copy
+
+        the array is mapped lazily, so every DataLoader worker maps the file by itself
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._verts = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_verts'] = None
+        return state
+
+    @property
+    def verts(self):
+        if self._verts is None:
+            self._verts = np.load(self.path, mmap_mode='r')
+        return self._verts
+
+    def __len__(self):
+        return len(self.verts)
+
+    def __getitem__(self, idx):
+        return np.array(self.verts[idx])
+
+
+def load_vert_store(root, length=None):
+    ''' VertStore of {root}/vert_store.npy, None if it is not built yet
+
+        length: expected sample counts, a stale store is ignored
+    '''
+    path = os.path.join(root, VERT_STORE_NAME)
+    if not os.path.isfile(path):
+        return None
+    vert_store = VertStore(path)
+    if length is not None and len(vert_store) != length:
+        print(f'Ignore {path}: {len(vert_store)} meshes, but dataset has {length} samples')
+        return None
+    return vert_store
+
+
+def _read_points(mesh_path):
+    import openmesh as om
+    assert os.path.exists(mesh_path), f'File does not exists: {mesh_path}'
+    points = om.read_trimesh(mesh_path).points()
+    assert points.shape == (VERT_NUM, 3), f'{mesh_path}: {points.shape} vertices, mesh file broken'
+    return points
+
+
+def _save(root, mesh_paths):
+    from tqdm import tqdm
+    path = os.path.join(root, VERT_STORE_NAME)
+    tmp_path = path + '.tmp'
+    verts = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(len(mesh_paths), VERT_NUM, 3))
+    for idx, mesh_path in enumerate(tqdm(mesh_paths)):
+        verts[idx] = _read_points(mesh_path)
+    verts.flush()
+    del verts
+    os.replace(tmp_path, path)  # store is visible only when complete
+    print(f'Saved {len(mesh_paths)} meshes to {path}')
+
+
+def build_freihand_vert_store(freihand_root):
+    from utils.fh_utils import db_size
+    _save(freihand_root, [os.path.join(freihand_root, 'training', 'mesh', '%08d.ply' % idx)
+                          for idx in range(db_size('training'))])
+
+
+def build_comphand_vert_store(comphand_root):
+    from pathlib import Path
+
+    img_list = sorted(list(Path(comphand_root).glob('**/pic256/**/*.png')))
+    mesh_paths = []
+    for img_path in img_list:
+        num = int(img_path.parts[-1].split('.')[1])
+        mesh_paths.append(os.path.join(*img_path.parts[:-2], str(num) + '.obj').replace('pic256', 'model_mano'))
+    _save(comphand_root, mesh_paths)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='extract ground-truth mesh vertices into one array')
+    parser.add_argument('--dataset', type=str, choices=['FreiHAND', 'CompHand'], required=True)
+    parser.add_argument('--root', type=str, required=True)
+    args = parser.parse_args()
+
+    {
+        'FreiHAND': build_freihand_vert_store,
+        'CompHand': build_comphand_vert_store,
+    }[args.dataset](args.root)
@@ -20,6 +20,51 @@ def base_transform(img, size, mean=0.5, std=0.5):
     return x
 
 
+def roi_transform(img, size, mean=0.5, std=0.5, uint8=False):
+    """ base_transform, or a (3, size, size) uint8 image if {uint8}
+
+    uint8 images are 1/4 of the bytes through the DataLoader, they are
+    normalised on the whole batch by normalize_img in Runner.phrase_data.
+    Crops of the float colour augmentation are neither rounded nor clipped,
+    the datasets keep them float (uint8=False, see their uint8_img)
+    """
+    if not uint8:
+        return base_transform(img, size, mean=mean, std=std)
+    x = cv2.resize(img, (size, size))
+    if x.dtype != np.uint8:
+        # float crops that are not colour augmented are integral
+        x = np.clip(np.rint(x), 0, 255).astype(np.uint8)
+    return x.transpose(2, 0, 1)
+
+
+def roi_transform_window(imgs, size, mean=0.5, std=0.5, uint8=False):
+    """ roi_transform of (F, H, W, 3) images -> (F, 3, size, size), one array op for the window if H == W == size """
+    imgs = np.asarray(imgs)
+    if imgs.shape[1:3] != (size, size):
+        return np.stack([roi_transform(img, size, mean=mean, std=std, uint8=uint8) for img in imgs])
+    if not uint8:
+        x = imgs.astype(np.float32) / 255
+        x -= mean
+        x /= std
+        return np.ascontiguousarray(x.transpose(0, 3, 1, 2))
+    if imgs.dtype != np.uint8:
+        imgs = np.clip(np.rint(imgs), 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(imgs.transpose(0, 3, 1, 2))
+
+
+def as_tensor(x, keep_uint8=False):
+    """ torch.from_numpy(x).float(), uint8 arrays stay uint8 if {keep_uint8} """
+    import torch
+    if keep_uint8 and x.dtype == np.uint8:
+        return torch.from_numpy(np.ascontiguousarray(x))
+    return torch.from_numpy(x).float()
+
+
+def normalize_img(img, mean=0.5, std=0.5):
+    """ batched base_transform of uint8 images from roi_transform, same float32 operations """
+    return img.float().div_(255).sub_(mean).div_(std)
+
+
 def inv_base_tranmsform(x, mean=0.5, std=0.5):
     x = x.transpose(1, 2, 0)
     image = (x * std + mean) * 255
@@ -38,6 +38,8 @@ class Writer:
         message = 'Epoch: {}/{}, Step: {}/{}, Total: {}, Dur: {:.3f}s, FDur: {:.3f}s, BDur: {:.3f}s,, Train Loss: {:.4f}, L1 Loss: {:.4f}, Lr: {:.6f}' \
             .format(info['epoch'], info['max_epoch'], info['step'], info['max_step'], info['total_step'],
             info['step_duration'], info['forward_duration'] ,info['backward_duration'], info['train_loss'], info['l1_loss'], info['lr'])
+        if 'data_duration' in info:
+            message += ', DataWait: {:.3f}s'.format(info['data_duration'])  # see utils/prefetch.py
         print('  > ' + message)
         logging.info(message)
 